@@ -0,0 +1,152 @@
+"""
+Async (ASGI-native) versions of the hot read-only book API endpoints.
+
+These views use Django's async ORM interface and answer GET requests
+without going through DRF, whose views are synchronous; they are routed in
+front of the DRF ones when ``ASYNC_READ_VIEWS`` is enabled. Querysets are
+shaped (``only()`` and prefetches) to what the serializer renders, so
+serialization runs in the event loop without touching the database.
+Requests with other methods are handed to the synchronous DRF view.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.translation import gettext as _
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from .conditional import SCORE_VALIDATOR_FIELDS, VALIDATOR_FIELDS, conditional, object_validators
+from .models import Book
+from .pagination import InvalidCursor, KeysetPagination, apaginate, load_fields
+from .serializers import BookListSerializer, BookSerializer, shape_queryset
+from .views import BookViewSet
+
+LIST_SIZE = 10
+
+
+class AsyncAPIView(View):
+    """Base class of the async API views.
+
+    ``fallback`` is the synchronous view serving methods other than GET/HEAD.
+    """
+    fallback = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like DRF views, rely on the API authentication for CSRF checks.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and self.fallback is not None:
+            return await sync_to_async(self.fallback)(request, *args, **kwargs)
+        return await super().dispatch(request, *args, **kwargs)
+
+    def get_serializer(self, serializer_class, *args, **kwargs):
+        return serializer_class(*args, context={'request': self.request}, **kwargs)
+
+    async def fetch(self, queryset, serializer_class, validator_fields=SCORE_VALIDATOR_FIELDS):
+        """Return the books of ``queryset``, loaded with what ``serializer_class`` renders and their validators."""
+        queryset = load_fields(shape_queryset(queryset, self.get_serializer(serializer_class)), validator_fields)
+        return [book async for book in queryset]
+
+
+class BookSelectionView(AsyncAPIView):
+    """Async view returning a fixed selection of books (featured, new, popular, trending)."""
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    async def get(self, request):
+        books = await self.fetch(self.get_queryset()[:LIST_SIZE], BookSerializer)
+        return conditional(
+            request, object_validators(request, books, fields=SCORE_VALIDATOR_FIELDS),
+            lambda: JsonResponse(self.get_serializer(BookSerializer, books, many=True).data, safe=False),
+        )
+
+
+class FeaturedBooksView(BookSelectionView):
+    """Async API view for featured books."""
+
+    def get_queryset(self):
+        return Book.objects.available().for_detail().filter(is_featured=True)
+
+
+class NewReleasesView(BookSelectionView):
+    """Async API view for new releases."""
+
+    def get_queryset(self):
+        return Book.objects.available().for_detail().filter(is_new=True).order_by('-created_at')
+
+
+class PopularBooksView(BookSelectionView):
+    """Async API view for popular books of all time, by weighted rating."""
+
+    def get_queryset(self):
+        return Book.objects.available().for_detail().order_by('-bayesian_rating', '-id')
+
+
+class TrendingBooksView(BookSelectionView):
+    """Async API view for books trending this week."""
+
+    def get_queryset(self):
+        return Book.objects.available().for_detail().filter(trending_score__gt=0).order_by('-trending_score', '-id')
+
+
+class BookListView(AsyncAPIView):
+    """Async keyset-paginated list of available books (``?cursor=&page_size=&ordering=``).
+
+    Search, filters and sparse fieldsets are implemented by the DRF filter
+    backends: requests using any other parameter go to the DRF view.
+    """
+    fallback = staticmethod(BookViewSet.as_view({'get': 'list', 'post': 'create'}))
+    params = {
+        KeysetPagination.cursor_query_param, KeysetPagination.page_size_query_param, 'ordering',
+    }
+
+    def get_queryset(self):
+        queryset = Book.objects.available().for_list()
+        ordering = self.request.GET.get('ordering', '')
+        if ordering.lstrip('-') not in BookViewSet.ordering_fields:
+            ordering = BookViewSet.ordering[0]
+        return queryset.order_by(ordering)
+
+    async def get(self, request):
+        if set(request.GET) - self.params:
+            return await sync_to_async(self.fallback)(request)
+        pagination = KeysetPagination()
+        pagination.request = request
+        queryset = shape_queryset(self.get_queryset(), self.get_serializer(BookListSerializer))
+        try:
+            page = await apaginate(
+                load_fields(queryset, VALIDATOR_FIELDS),
+                request.GET.get(pagination.cursor_query_param), pagination.get_page_size(request),
+            )
+        except InvalidCursor:
+            return JsonResponse({'detail': str(pagination.invalid_cursor_message)}, status=404)
+        pagination.page = page
+        next_link = pagination.get_next_link()
+
+        def build_response():
+            return JsonResponse({
+                'next': next_link,
+                'previous': pagination.get_previous_link(),
+                'results': self.get_serializer(BookListSerializer, page.object_list, many=True).data,
+            })
+
+        return conditional(request, object_validators(request, page.object_list, next_link or ''), build_response)
+
+
+class BookDetailView(AsyncAPIView):
+    """Async book detail."""
+    fallback = staticmethod(BookViewSet.as_view({
+        'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy',
+    }))
+
+    async def get(self, request, pk):
+        queryset = Book.objects.available().for_detail().filter(pk=pk)
+        books = await self.fetch(queryset, BookSerializer)
+        if not books:
+            return JsonResponse({'detail': _('No Book matches the given query.')}, status=404)
+        return conditional(
+            request, object_validators(request, books, fields=SCORE_VALIDATOR_FIELDS),
+            lambda: JsonResponse(self.get_serializer(BookSerializer, books[0]).data),
+        )
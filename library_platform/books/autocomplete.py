@@ -0,0 +1,136 @@
+"""
+Prefix search over author and genre names, for typeahead filters.
+
+Authors and genres store their name normalized (case folded, accents
+stripped, whitespace collapsed) in indexed columns, filled by a
+``pre_save`` signal, so a typed prefix is one index range scan whatever
+the size of the table. Prefixes are matched as a ``>= prefix AND < prefix
++ END`` range, not ``LIKE``, which SQLite only runs on an index of a
+case-insensitive column. The ``AutocompleteSelect`` widget only renders
+the selected options and leave the rest to the autocomplete endpoints, so
+search pages no longer list every author.
+"""
+import unicodedata
+
+from django import forms
+from django.db.models import Q
+from django.urls import reverse
+
+from .models import Author, Genre
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Sorts after any character a normalized name can contain
+END = '\U0010ffff'
+
+
+def normalize_name(value):
+    """Return ``value`` case folded, without accents and with single spaces."""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+def prefix_filter(field, prefix):
+    """Match the ``field`` values starting with ``prefix`` as an index range."""
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + END})
+
+
+def set_normalized_names(instance):
+    """Fill the normalized name columns of an author or genre (``bulk_create`` skips the signal)."""
+    if isinstance(instance, Author):
+        instance.normalized_name = normalize_name(f'{instance.first_name} {instance.last_name}')
+        instance.normalized_last_name = normalize_name(instance.last_name)
+    elif isinstance(instance, Genre):
+        instance.normalized_name = normalize_name(instance.name)
+    return instance
+
+
+def backfill_normalized_names(batch_size=1000):
+    """Recompute the normalized names of every author and genre; return the updated count."""
+    total = 0
+    for model, fields in ((Author, ['normalized_name', 'normalized_last_name']), (Genre, ['normalized_name'])):
+        last_pk = 0
+        queryset = model.objects.order_by('pk')
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            model.objects.bulk_update([set_normalized_names(obj) for obj in batch], fields)
+            total += len(batch)
+            last_pk = batch[-1].pk
+    return total
+
+
+def author_suggestions(query, limit=DEFAULT_LIMIT):
+    """Return ``[{id, text}]`` of the authors whose full or last name starts with ``query``."""
+    prefix = normalize_name(query)
+    if not prefix:
+        return []
+    authors = (
+        Author.objects.filter(prefix_filter('normalized_name', prefix) | prefix_filter('normalized_last_name', prefix))
+        .order_by('normalized_last_name', 'normalized_name', 'id')
+        .values_list('id', 'first_name', 'last_name')[:limit]
+    )
+    return [{'id': pk, 'text': f'{first_name} {last_name}'} for pk, first_name, last_name in authors]
+
+
+def genre_suggestions(query, limit=DEFAULT_LIMIT):
+    """Return ``[{id, text}]`` of the genres whose name starts with ``query``."""
+    prefix = normalize_name(query)
+    if not prefix:
+        return []
+    genres = (
+        Genre.objects.filter(prefix_filter('normalized_name', prefix))
+        .order_by('normalized_name', 'id').values_list('id', 'name')[:limit]
+    )
+    return [{'id': pk, 'text': name} for pk, name in genres]
+
+
+def parse_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    try:
+        return max(1, min(int(value), maximum))
+    except (TypeError, ValueError):
+        return default
+
+
+class AutocompleteMixin:
+    """Select widget rendering only the selected options, completed by ``main.js``.
+
+    ``url_name`` names the endpoint answering ``?q=`` with ``[{id, text}]``.
+    """
+
+    def __init__(self, url_name, attrs=None, **kwargs):
+        super().__init__(attrs, **kwargs)
+        self.url_name = url_name
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-autocomplete-url'] = reverse(self.url_name)
+        return attrs
+
+    def selected_choices(self, value):
+        """Return the choices of the selected ids only, instead of iterating the whole table."""
+        iterator = self.choices
+        choices = []
+        empty_label = getattr(getattr(iterator, 'field', None), 'empty_label', None)
+        if empty_label is not None:
+            choices.append(('', empty_label))
+        pks = [int(item) for item in value if str(item).isdigit()]
+        if pks:
+            choices.extend((obj.pk, str(obj)) for obj in iterator.queryset.filter(pk__in=pks))
+        return choices
+
+    def optgroups(self, name, value, attrs=None):
+        if not hasattr(self.choices, 'queryset'):
+            return super().optgroups(name, value, attrs)
+        iterator = self.choices
+        self.choices = self.selected_choices(value)
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = iterator
+
+
+class AutocompleteSelect(AutocompleteMixin, forms.Select):
+    pass
@@ -0,0 +1,104 @@
+"""
+Conditional GET support (ETag / Last-Modified) for the books API.
+
+Validators are derived from the keys and modification times of the rows a
+response renders, which the view fetched anyway, so they cost no query of
+their own and unchanged resources are answered with a 304 before any
+rendering happens. ``updated_at`` covers the stored fields; responses
+rendering the popularity scores also read ``scores_updated_at``
+(:data:`SCORE_VALIDATOR_FIELDS`), which the score refreshes stamp instead.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .pagination import load_fields
+
+VALIDATOR_FIELDS = ('updated_at',)
+SCORE_VALIDATOR_FIELDS = ('updated_at', 'scores_updated_at')
+
+
+def build_validators(request, latest, version):
+    fingerprint = '|'.join([
+        request.get_full_path(),
+        request.headers.get('Accept', ''),
+        request.headers.get('Accept-Language', ''),
+        latest.isoformat() if latest else '',
+        str(version),
+    ])
+    etag = 'W/"%s"' % hashlib.md5(fingerprint.encode()).hexdigest()
+    last_modified = int(latest.timestamp()) if latest else None
+    return etag, last_modified
+
+
+def object_validators(request, objects, extra='', fields=VALIDATOR_FIELDS):
+    """Return ``(etag, last_modified)`` for a response rendering the fetched ``objects``.
+
+    ``fields`` are the modification times of the data rendered.
+    """
+    stamps = [[getattr(obj, name) for name in fields] for obj in objects]
+    latest = max((stamp for row in stamps for stamp in row if stamp is not None), default=None)
+    keys = ','.join(
+        ':'.join([str(obj.pk), *(stamp.isoformat() if stamp else '' for stamp in row)])
+        for obj, row in zip(objects, stamps)
+    )
+    return build_validators(request, latest, f'{keys}|{extra}')
+
+
+def tag_response(response, etag, last_modified):
+    if response.status_code == 200:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional(request, validators, build_response):
+    """Answer 304 when the client matches ``validators``, else build and tag the response."""
+    etag, last_modified = validators
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+    return tag_response(build_response(), etag, last_modified)
+
+
+class ConditionalViewSetMixin:
+    """Viewset mixin adding ETag / Last-Modified handling to list and retrieve.
+
+    The queryset is filtered and fetched once: list validators cover the
+    rows of the page being served, and retrieve validators the looked up
+    object, so missing or malformed keys get the usual 404.
+    """
+    validator_fields = VALIDATOR_FIELDS
+
+    def get_validator_fields(self):
+        return self.validator_fields
+
+    def filter_queryset(self, queryset):
+        return load_fields(super().filter_queryset(queryset), self.get_validator_fields())
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            objects, next_link = list(queryset), None
+        else:
+            objects, next_link = page, self.paginator.get_next_link()
+
+        def build_response():
+            serializer = self.get_serializer(objects, many=True)
+            if page is None:
+                return Response(serializer.data)
+            return self.get_paginated_response(serializer.data)
+
+        validators = object_validators(request, objects, next_link or '', self.get_validator_fields())
+        return conditional(request, validators, build_response)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return conditional(
+            request, object_validators(request, [instance], fields=self.get_validator_fields()),
+            lambda: Response(self.get_serializer(instance).data),
+        )
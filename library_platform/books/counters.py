@@ -0,0 +1,247 @@
+"""
+Write-behind view and download counters for books.
+
+Hits are buffered instead of updating the book row on every request, and
+flushed in batches with one UPDATE per book. Two backends are available
+through the ``BOOKS_COUNTER_BACKEND`` setting:
+
+* ``local``: hits accumulate in process memory and a background thread of
+  the process flushes them every ``BOOKS_COUNTER_FLUSH_INTERVAL`` seconds,
+  logging failures; requests never write the counters themselves.
+* ``cache``: hits accumulate in the shared cache (which must support atomic
+  ``incr``, e.g. Redis or Memcached) and the ``flush_book_counters`` Celery
+  task writes them to the database. The default whenever the cache is Redis.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F
+
+COUNTER_FIELDS = {
+    'view': 'view_count',
+    'download': 'download_count',
+}
+
+DEFAULT_FLUSH_INTERVAL = 30
+
+logger = logging.getLogger(__name__)
+
+
+def write_deltas(deltas):
+    """Persist ``{book_id: {field: delta}}``, one UPDATE per book."""
+    from .models import Book
+    from .popularity import record_activity
+
+    for book_id, fields in deltas.items():
+        changes = {field: F(field) + delta for field, delta in fields.items() if delta}
+        if changes:
+            Book.objects.filter(pk=book_id).update(**changes)
+    record_activity(deltas)
+
+
+class LocalCounterBackend:
+    """Buffer hits in process memory, flushed by a background thread."""
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.pending = defaultdict(lambda: defaultdict(int))
+        self.last_flush = time.monotonic()
+        self.flusher = None
+        atexit.register(self.flush)
+
+    def record(self, kind, book_id, amount=1):
+        with self.lock:
+            self.pending[book_id][COUNTER_FIELDS[kind]] += amount
+            # Started on first use, so processes forked by the server get their own
+            if self.flusher is None or not self.flusher.is_alive():
+                self.flusher = threading.Thread(target=self.run, name='book-counters', daemon=True)
+                self.flusher.start()
+
+    def run(self):
+        while True:
+            time.sleep(max(self.flush_interval - (time.monotonic() - self.last_flush), 0))
+            try:
+                self.try_flush()
+            finally:
+                connections.close_all()
+
+    def try_flush(self):
+        """Flush, logging failures instead of raising them; failed hits are retried next time."""
+        try:
+            return self.flush()
+        except Exception:
+            logger.exception('Could not flush the book counters, retrying in %s seconds', self.flush_interval)
+            return 0
+
+    def pending_deltas(self, book_ids):
+        with self.lock:
+            return {pk: dict(self.pending[pk]) for pk in book_ids if pk in self.pending}
+
+    def flush(self):
+        with self.lock:
+            deltas, self.pending = self.pending, defaultdict(lambda: defaultdict(int))
+            self.last_flush = time.monotonic()
+        try:
+            write_deltas(deltas)
+        except Exception:
+            # Put the hits back so the next flush retries them.
+            with self.lock:
+                for book_id, fields in deltas.items():
+                    for field, delta in fields.items():
+                        self.pending[book_id][field] += delta
+            raise
+        return len(deltas)
+
+
+class CacheCounterBackend:
+    """Buffer hits in the shared cache, partitioned in generations.
+
+    Every flush closes the open generation and drains the generations closed
+    by earlier flushes, so writers that read the generation number just
+    before it moved still land in a bucket that has not been drained yet.
+    """
+
+    prefix = 'books:counters'
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+
+    @property
+    def generation_key(self):
+        return f'{self.prefix}:generation'
+
+    @property
+    def drained_key(self):
+        return f'{self.prefix}:drained'
+
+    def counter_key(self, generation, kind, book_id):
+        return f'{self.prefix}:{generation}:{kind}:{book_id}'
+
+    def sequence_key(self, generation):
+        return f'{self.prefix}:{generation}:sequence'
+
+    def slot_key(self, generation, slot):
+        return f'{self.prefix}:{generation}:slot:{slot}'
+
+    def current_generation(self):
+        generation = cache.get(self.generation_key)
+        if generation is None:
+            cache.add(self.generation_key, 0, None)
+            generation = cache.get(self.generation_key, 0)
+        return generation
+
+    def record(self, kind, book_id, amount=1):
+        generation = self.current_generation()
+        key = self.counter_key(generation, kind, book_id)
+        if cache.add(key, amount, None):
+            # First hit for this book in the generation: register it so the
+            # flush can find the key without scanning the cache.
+            sequence_key = self.sequence_key(generation)
+            cache.add(sequence_key, 0, None)
+            slot = cache.incr(sequence_key)
+            cache.set(self.slot_key(generation, slot), (kind, book_id), None)
+        else:
+            cache.incr(key, amount)
+
+    def pending_deltas(self, book_ids):
+        current = self.current_generation()
+        drained = cache.get(self.drained_key, -1)
+        keys = {}
+        for generation in range(drained + 1, current + 1):
+            for kind, field in COUNTER_FIELDS.items():
+                for book_id in book_ids:
+                    keys[self.counter_key(generation, kind, book_id)] = (book_id, field)
+        deltas = defaultdict(lambda: defaultdict(int))
+        for key, value in cache.get_many(keys).items():
+            book_id, field = keys[key]
+            deltas[book_id][field] += value
+        return {pk: dict(fields) for pk, fields in deltas.items()}
+
+    def collect(self, generation):
+        """Return the deltas of a generation and the cache keys holding them."""
+        size = cache.get(self.sequence_key(generation), 0)
+        slot_keys = [self.slot_key(generation, slot) for slot in range(1, size + 1)]
+        counter_keys = {
+            self.counter_key(generation, kind, book_id): (book_id, COUNTER_FIELDS[kind])
+            for kind, book_id in cache.get_many(slot_keys).values()
+        }
+        deltas = defaultdict(lambda: defaultdict(int))
+        for key, value in cache.get_many(counter_keys).items():
+            book_id, field = counter_keys[key]
+            deltas[book_id][field] += value
+        return deltas, [self.sequence_key(generation)] + slot_keys + list(counter_keys)
+
+    def flush(self):
+        lock_key = f'{self.prefix}:flush-lock'
+        if not cache.add(lock_key, 1, self.flush_interval):
+            return 0
+        try:
+            closed = self.current_generation()
+            cache.incr(self.generation_key)
+            drained = cache.get(self.drained_key, -1)
+            flushed = 0
+            for generation in range(drained + 1, closed):
+                deltas, keys = self.collect(generation)
+                write_deltas(deltas)
+                cache.set(self.drained_key, generation, None)
+                cache.delete_many(keys)
+                flushed += len(deltas)
+            return flushed
+        finally:
+            cache.delete(lock_key)
+
+
+BACKENDS = {
+    'local': LocalCounterBackend,
+    'cache': CacheCounterBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_counter_backend():
+    """Return the process-wide counter backend."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, 'BOOKS_COUNTER_BACKEND', 'local')
+                interval = getattr(settings, 'BOOKS_COUNTER_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+                _backend = BACKENDS[name](interval)
+    return _backend
+
+
+def record_view(book_id):
+    get_counter_backend().record('view', book_id)
+
+
+def record_download(book_id):
+    get_counter_backend().record('download', book_id)
+
+
+def flush_counters():
+    """Write buffered hits to the database, returning the number of books updated."""
+    return get_counter_backend().flush()
+
+
+def pending_deltas(book_ids):
+    """Return ``{book_id: {field: delta}}`` for hits not flushed yet."""
+    return get_counter_backend().pending_deltas(list(book_ids))
+
+
+def apply_live_counts(books):
+    """Add pending hits to the counters of the given (unsaved) book instances."""
+    books = list(books)
+    deltas = pending_deltas(book.pk for book in books)
+    for book in books:
+        for field, delta in deltas.get(book.pk, {}).items():
+            setattr(book, field, getattr(book, field) + delta)
+    return books
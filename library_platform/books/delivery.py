@@ -0,0 +1,146 @@
+"""
+File delivery for book media (PDF, EPUB and audio files).
+
+Files are either streamed by Django in fixed-size chunks, with support for
+single HTTP ranges so audio players can seek, or handed off to the front
+proxy with ``X-Accel-Redirect`` (nginx) or ``X-Sendfile`` (Apache,
+lighttpd). The mode is selected with the ``BOOKS_DELIVERY_MODE`` setting;
+files of storages without a local path are always streamed.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when the requested byte range lies outside the file."""
+
+
+def parse_range(header, size):
+    """Parse a ``Range`` header into an inclusive ``(start, end)`` pair.
+
+    Returns ``None`` when the header is absent, malformed or asks for
+    several ranges, in which case the whole file is served.
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def iter_file(storage, name, start, length, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield ``length`` bytes of a stored file from ``start``, chunk by chunk."""
+    with storage.open(name, 'rb') as handle:
+        handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = handle.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_etag(fieldfile):
+    return quote_etag(f'{fieldfile.name}-{fieldfile.size}')
+
+
+def is_first_request(request, size):
+    """Whether the request downloads a file of ``size`` bytes from its start.
+
+    Resumed or seeking ranges, and probes such as ``bytes=0-1`` sent by
+    players and download managers before the real request, are not.
+    """
+    byte_range = request.headers.get('Range', '')
+    if not byte_range:
+        return True
+    match = RANGE_RE.match(byte_range.strip())
+    if not match or match.group(1) != '0':
+        return False
+    return not match.group(2) or int(match.group(2)) >= size - 1
+
+
+def offload_response(fieldfile, mode):
+    """Let the front proxy send the file, or return ``None`` when it cannot reach it."""
+    response = HttpResponse()
+    if mode == 'accel':
+        prefix = getattr(settings, 'BOOKS_DELIVERY_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(fieldfile.name)
+    else:
+        try:
+            response['X-Sendfile'] = fieldfile.path
+        except NotImplementedError:
+            # Remote storages have no local path for the proxy to read
+            return None
+    # The proxy fills in the content type, length and range handling.
+    del response['Content-Type']
+    return response
+
+
+def stream_response(request, fieldfile):
+    """Stream the file from storage, honouring a single byte range."""
+    size = fieldfile.size
+    etag = file_etag(fieldfile)
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if not if_range or if_range == etag:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    chunk_size = getattr(settings, 'BOOKS_DELIVERY_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            iter_file(fieldfile.storage, fieldfile.name, start, length, chunk_size), status=206
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        length = size
+        response = StreamingHttpResponse(
+            iter_file(fieldfile.storage, fieldfile.name, 0, length, chunk_size)
+        )
+    response['Content-Length'] = str(length)
+    response['ETag'] = etag
+    return response
+
+
+def serve_file(request, fieldfile, as_attachment=True):
+    """Build the response delivering ``fieldfile`` according to the delivery mode."""
+    mode = getattr(settings, 'BOOKS_DELIVERY_MODE', 'stream')
+    response = offload_response(fieldfile, mode) if mode in ('accel', 'sendfile') else None
+    if response is None:
+        response = stream_response(request, fieldfile)
+        content_type, encoding = mimetypes.guess_type(fieldfile.name)
+        response['Content-Type'] = content_type or 'application/octet-stream'
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition_header(
+        as_attachment, os.path.basename(fieldfile.name)
+    )
+    return response
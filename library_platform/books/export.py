@@ -0,0 +1,158 @@
+"""
+Streaming catalog export for downstream warehouses and search clusters.
+
+Books are read with ``.iterator()`` (a server-side cursor where the
+database supports it) in chunks of primary keys; the authors, genres and
+tags of each chunk are fetched with one query per relation, so memory use
+and query count depend on the chunk size, not on the catalog size. Rows
+are encoded as NDJSON or CSV line by line, optionally gzip-compressed on
+the fly.
+
+Incremental exports (``since``) hold the books whose ``updated_at`` moved
+since the watermark, then a tombstone (``{"id": ..., "deleted": true}``)
+per book deleted since. View and download counters are flushed without
+touching ``updated_at``, so only full exports carry them. Tombstones are
+kept ``BOOKS_TOMBSTONE_RETENTION_DAYS`` days (see :func:`prune_tombstones`):
+incremental consumers must export more often than that.
+"""
+import csv
+import datetime
+import io
+import json
+import zlib
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from taggit.models import TaggedItem
+
+from .models import Book, DeletedBook
+
+BOOK_FIELDS = [
+    'id', 'title', 'subtitle', 'isbn', 'language', 'pages', 'publisher',
+    'publication_date', 'edition', 'status', 'is_featured', 'is_new',
+    'average_rating', 'total_ratings', 'view_count', 'download_count',
+    'created_at', 'updated_at',
+]
+RELATION_FIELDS = ['authors', 'genres', 'tags']
+COUNTER_FIELDS = ['view_count', 'download_count']
+FIELDS = BOOK_FIELDS + RELATION_FIELDS + ['deleted']
+
+FORMATS = ('ndjson', 'csv')
+
+CHUNK_SIZE = 2000
+
+DEFAULT_TOMBSTONE_RETENTION_DAYS = 90
+
+
+def related_names(book_ids):
+    """Return ``{relation: {book_id: [names]}}`` for a chunk of books."""
+    relations = {name: defaultdict(list) for name in RELATION_FIELDS}
+    authors = (
+        Book.authors.through.objects.filter(book_id__in=book_ids)
+        .order_by('author__last_name', 'author__first_name')
+        .values_list('book_id', 'author__first_name', 'author__last_name')
+    )
+    for book_id, first_name, last_name in authors:
+        relations['authors'][book_id].append(f'{first_name} {last_name}'.strip())
+    genres = (
+        Book.genres.through.objects.filter(book_id__in=book_ids)
+        .order_by('genre__name').values_list('book_id', 'genre__name')
+    )
+    for book_id, name in genres:
+        relations['genres'][book_id].append(name)
+    tags = (
+        TaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Book), object_id__in=book_ids
+        ).order_by('tag__name').values_list('object_id', 'tag__name')
+    )
+    for book_id, name in tags:
+        relations['tags'][book_id].append(name)
+    return relations
+
+
+def export_fields(since=None):
+    """Return the columns of an export, without the counters for incremental ones."""
+    return [name for name in FIELDS if since is None or name not in COUNTER_FIELDS]
+
+
+def iter_books(since=None, chunk_size=CHUNK_SIZE):
+    """Yield export rows (dicts) ordered by id, only books updated since ``since`` if given.
+
+    Incremental exports end with the tombstones of the books deleted since.
+    """
+    queryset = Book.objects.order_by('pk')
+    if since is not None:
+        queryset = queryset.filter(updated_at__gte=since)
+    fields = [name for name in export_fields(since) if name in BOOK_FIELDS]
+    rows = queryset.values(*fields).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        relations = related_names([row['id'] for row in chunk])
+        for row in chunk:
+            for name in RELATION_FIELDS:
+                row[name] = relations[name].get(row['id'], [])
+            row['deleted'] = False
+            yield row
+    if since is not None:
+        deleted = (
+            DeletedBook.objects.filter(deleted_at__gte=since).order_by('book_id')
+            .values_list('book_id', flat=True).distinct()
+        )
+        for book_id in deleted.iterator(chunk_size=chunk_size):
+            yield {'id': book_id, 'deleted': True}
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows, fields=FIELDS):
+    """Encode rows as CSV, relations being joined with ``;`` as in import feeds."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for row in rows:
+        for name in RELATION_FIELDS:
+            row[name] = ';'.join(row.get(name, []))
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, flush_size=64 * 1024):
+    """Gzip-compress an iterable of byte strings incrementally."""
+    compressor = zlib.compressobj(wbits=31)
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= flush_size:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(output='ndjson', since=None, compress=False, chunk_size=CHUNK_SIZE):
+    """Yield the encoded export as byte strings."""
+    rows = iter_books(since, chunk_size)
+    lines = csv_lines(rows, export_fields(since)) if output == 'csv' else ndjson_lines(rows)
+    chunks = (line.encode() for line in lines)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def prune_tombstones(now=None):
+    """Delete the tombstones older than the retention period; return the deleted count."""
+    days = getattr(settings, 'BOOKS_TOMBSTONE_RETENTION_DAYS', DEFAULT_TOMBSTONE_RETENTION_DAYS)
+    horizon = (now or timezone.now()) - datetime.timedelta(days=days)
+    return DeletedBook.objects.filter(deleted_at__lt=horizon).delete()[0]
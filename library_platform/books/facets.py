@@ -0,0 +1,137 @@
+"""
+Facet counts for book search results.
+
+Counts for language, publication decade, rating and media availability come
+from a single grouped query over the filtered books, rolled up in Python;
+genre counts come from one grouped query on the genres through table. The
+counts of the unfiltered catalog are cached under a version number bumped
+by signals whenever books or their genres change.
+
+Facet values are the ``BookFilter`` parameter values selecting them
+(``genre``, ``language``, ``min_rating``, ``decade``, ``has_audio``,
+``has_ebook``), so clients can turn a facet into a filter link directly.
+"""
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, Count, IntegerField, Value, When
+from django.db.models.functions import ExtractYear, Floor, Least
+from django.utils.translation import gettext as _
+
+from core.cache import initial_version, tiered
+
+from .filtres import has_audio_q, has_ebook_q
+from .models import Book
+
+# Rating aggregates are updated without signals, so cached counts may lag by this much
+CACHE_TIMEOUT = 3600
+VERSION_KEY = 'facets:version'
+MAX_GENRES = 50
+
+
+def boolean(condition):
+    return Case(When(condition, then=Value(True)), default=Value(False), output_field=BooleanField())
+
+
+def compute_facets(queryset):
+    """Return the raw facet counts of ``queryset`` as JSON-serializable data."""
+    queryset = queryset.order_by()
+    rows = queryset.values_list(
+        'language',
+        Floor(ExtractYear('publication_date') / 10, output_field=IntegerField()),
+        Least(Floor('average_rating', output_field=IntegerField()), Value(4)),
+        boolean(has_audio_q()),
+        boolean(has_ebook_q()),
+    ).annotate(count=Count('pk'))
+
+    total = 0
+    counts = {name: Counter() for name in ('language', 'decade', 'rating', 'has_audio', 'has_ebook')}
+    for language, decade, rating, has_audio, has_ebook, count in rows:
+        total += count
+        counts['language'][language] += count
+        if decade is not None:
+            counts['decade'][decade * 10] += count
+        counts['rating'][int(rating or 0)] += count
+        counts['has_audio'][bool(has_audio)] += count
+        counts['has_ebook'][bool(has_ebook)] += count
+
+    genres = (
+        Book.genres.through.objects.filter(book_id__in=queryset.values('pk'))
+        .values_list('genre_id', 'genre__name').annotate(count=Count('book_id'))
+        .order_by('-count', 'genre__name')[:MAX_GENRES]
+    )
+    return {
+        'total': total,
+        'genre': [[genre_id, name, count] for genre_id, name, count in genres],
+        'language': sorted(counts['language'].items(), key=lambda item: -item[1]),
+        # Cumulative, like the ``min_rating`` filter: "3+" includes 4 and 5 stars
+        'min_rating': [
+            [minimum, sum(count for rating, count in counts['rating'].items() if rating >= minimum)]
+            for minimum in (4, 3, 2, 1)
+        ],
+        'decade': sorted(counts['decade'].items(), reverse=True),
+        'has_audio': counts['has_audio'][True],
+        'has_ebook': counts['has_ebook'][True],
+    }
+
+
+def label_facets(raw):
+    """Turn raw counts into ``{facet: [{value, label, count}, ...]}``, dropping empty values."""
+    languages = dict(Book.LANGUAGE_CHOICES)
+    return {
+        'total': raw['total'],
+        'genre': [
+            {'value': genre_id, 'label': name, 'count': count}
+            for genre_id, name, count in raw['genre']
+        ],
+        'language': [
+            {'value': code, 'label': str(languages.get(code, code)), 'count': count}
+            for code, count in raw['language']
+        ],
+        'min_rating': [
+            {'value': minimum, 'label': _('%(rating)s+ stars') % {'rating': minimum}, 'count': count}
+            for minimum, count in raw['min_rating'] if count
+        ],
+        'decade': [
+            {'value': decade, 'label': f'{decade}s', 'count': count}
+            for decade, count in raw['decade']
+        ],
+        'has_audio': [{'value': True, 'label': _('Has audio'), 'count': raw['has_audio']}]
+        if raw['has_audio'] else [],
+        'has_ebook': [{'value': True, 'label': _('Has e-book'), 'count': raw['has_ebook']}]
+        if raw['has_ebook'] else [],
+    }
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        initial = initial_version()
+        cache.add(VERSION_KEY, initial, None)
+        version = cache.get(VERSION_KEY, initial)
+    return version
+
+
+def invalidate():
+    """Drop the cached unfiltered counts."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, initial_version(), None)
+
+
+def facet_counts(queryset, cache_name=None):
+    """Return the labelled facet counts of ``queryset``.
+
+    Pass ``cache_name`` for unfiltered base querysets only: their counts are
+    cached until the next book change.
+    """
+    if cache_name is None:
+        return label_facets(compute_facets(queryset))
+    key = f'facets:{cache_name}:{get_version()}'
+    return label_facets(tiered.get_or_set(key, lambda: compute_facets(queryset), CACHE_TIMEOUT))
+
+
+def is_filtered(params, names):
+    """Tell whether any of the filter parameters ``names`` is set in ``params``."""
+    return any(params.get(name) not in (None, '') for name in names)
@@ -4,25 +4,59 @@ Filters for books app.
 import django_filters
 from django.utils.translation import gettext_lazy as _
 from django.db import models  # Ajouté pour utiliser models.Q
+from rest_framework import filters
+from core.cache import CachedModelChoiceIterator
+from .autocomplete import AutocompleteSelect
 from .models import Book, Genre, Author
+from .fuzzy import fuzzy_filter
+from .search import search_books
+
+
+def has_audio_q():
+    """Condition matching books with an audio file (``Book.has_audio``)."""
+    return models.Q(audio_file__isnull=False) & ~models.Q(audio_file='')
+
+
+def has_ebook_q():
+    """Condition matching books with a PDF or EPUB file (``Book.has_ebook``)."""
+    return (
+        (models.Q(pdf_file__isnull=False) & ~models.Q(pdf_file=''))
+        | (models.Q(epub_file__isnull=False) & ~models.Q(epub_file=''))
+    )
+
+
+class CachedModelMultipleChoiceField(django_filters.fields.ModelMultipleChoiceField):
+    iterator = CachedModelChoiceIterator
+
+
+class CachedModelMultipleChoiceFilter(django_filters.ModelMultipleChoiceFilter):
+    """Multiple choice filter rendering its (small, stable) choices from the cache."""
+    field_class = CachedModelMultipleChoiceField
 
 
 class BookFilter(django_filters.FilterSet):
     """Filter for books with advanced options."""
     
+    q = django_filters.CharFilter(
+        method='filter_search',
+        label=_('Search')
+    )
+    
     title = django_filters.CharFilter(
         field_name='title',
         lookup_expr='icontains',
         label=_('Title')
     )
     
+    # Typeahead: only the selected author is rendered and validated
     author = django_filters.ModelChoiceFilter(
         field_name='authors',
         queryset=Author.objects.all(),
+        widget=AutocompleteSelect('books:author-autocomplete'),
         label=_('Author')
     )
     
-    genre = django_filters.ModelMultipleChoiceFilter(
+    genre = CachedModelMultipleChoiceFilter(
         field_name='genres',
         queryset=Genre.objects.all(),
         label=_('Genres')
@@ -61,6 +95,11 @@ class BookFilter(django_filters.FilterSet):
         label=_('Publication year')
     )
     
+    decade = django_filters.NumberFilter(
+        method='filter_decade',
+        label=_('Publication decade')
+    )
+    
     is_featured = django_filters.BooleanFilter(
         field_name='is_featured',
         label=_('Featured')
@@ -74,20 +113,82 @@ class BookFilter(django_filters.FilterSet):
     class Meta:
         model = Book
         fields = [
-            'title', 'author', 'genre', 'language', 'min_rating',
+            'q', 'title', 'author', 'genre', 'language', 'min_rating',
             'max_pages', 'has_audio', 'has_ebook', 'publication_year',
-            'is_featured', 'is_new'
+            'decade', 'is_featured', 'is_new'
         ]
     
+    def filter_queryset(self, queryset):
+        """Apply the search last, so its matches are taken among the filtered books."""
+        cleaned_data = self.form.cleaned_data
+        for name in sorted(cleaned_data, key=lambda name: name == 'q'):
+            queryset = self.filters[name].filter(queryset, cleaned_data[name])
+        return queryset
+    
+    def filter_search(self, queryset, name, value):
+        """Full-text search over titles, authors, descriptions and tags."""
+        return search_books(queryset, value)
+    
     def filter_has_audio(self, queryset, name, value):
         """Filter books that have audio files."""
         if value:
-            return queryset.exclude(audio_file='')
+            return queryset.filter(has_audio_q())
         return queryset
     
     def filter_has_ebook(self, queryset, name, value):
-        """Filter books that have e-book files."""
+        """Filter books that have e-book files (PDF or EPUB)."""
         if value:
-            return queryset.filter(
-                models.Q(pdf_file__isnull=False) | models.Q(epub_file__isnull=False)
-            ).exclude(pdf_file='').exclude(epub_file='')
\ No newline at end of file
+            return queryset.filter(has_ebook_q())
+        return queryset
+    
+    def filter_decade(self, queryset, name, value):
+        """Filter books published in the decade starting at ``value`` (e.g. 1990)."""
+        start = int(value) // 10 * 10
+        return queryset.filter(publication_date__year__gte=start, publication_date__year__lt=start + 10)
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """DRF search backend answering ``?search=`` from the full-text index.
+    
+    Results are ranked by relevance unless the client asked for an explicit
+    ``?ordering=``; list it after ``OrderingFilter`` so the rank wins.
+    """
+    
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        ordering = queryset.query.order_by
+        queryset = search_books(queryset, query)
+        if request.query_params.get(filters.OrderingFilter.ordering_param):
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
+
+class FuzzySearchFilter(filters.BaseFilterBackend):
+    """DRF backend answering ``?fuzzy=`` with typo-tolerant matching (see :mod:`books.fuzzy`).
+    
+    Works on Book and Author querysets. Results are ranked by similarity
+    unless the client asked for an explicit ``?ordering=``; list it after
+    ``OrderingFilter`` so the rank wins.
+    """
+    fuzzy_param = 'fuzzy'
+    
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.fuzzy_param, '').strip()
+        if not query:
+            return queryset
+        ordering = queryset.query.order_by
+        queryset = fuzzy_filter(queryset, query)
+        if request.query_params.get(filters.OrderingFilter.ordering_param):
+            queryset = queryset.order_by(*ordering)
+        return queryset
+    
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.fuzzy_param,
+            'required': False,
+            'in': 'query',
+            'description': str(_('Typo-tolerant search term.')),
+            'schema': {'type': 'string'},
+        }]
@@ -5,7 +5,8 @@ from django import forms
 from django.utils.translation import gettext_lazy as _
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Fieldset, Submit, Row, Column
-from .models import Review, BookCollection, Book
+from .autocomplete import AutocompleteSelect
+from .models import Review, BookCollection, Book, Genre
 
 
 class ReviewForm(forms.ModelForm):
@@ -63,9 +64,10 @@ class BookSearchForm(forms.Form):
     
     genre = forms.ModelChoiceField(
         label=_('Genre'),
-        queryset=None,  # Will be set in __init__
+        queryset=Genre.objects.all(),
         required=False,
-        empty_label=_('All genres')
+        empty_label=_('All genres'),
+        widget=AutocompleteSelect('books:genre-autocomplete')
     )
     
     language = forms.ChoiceField(
@@ -92,9 +94,6 @@ class BookSearchForm(forms.Form):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        from .models import Genre
-        self.fields['genre'].queryset = Genre.objects.all()
-
         self.helper = FormHelper()
         self.helper.layout = Layout(
             Row(
@@ -0,0 +1,148 @@
+"""
+Typo-tolerant search over book titles and author names.
+
+Normalized titles and author full names (see
+:func:`books.autocomplete.normalize_name`) are split into trigrams, each
+word padded like PostgreSQL's ``pg_trgm`` does, and stored in the
+``BookTrigram`` and ``AuthorTrigram`` side tables, which work on any
+database. A query only scores the rows sharing enough of its trigrams,
+found through the ``(trigram, id)`` index; the others are never read.
+
+The similarity of a row is the share of the query trigrams it contains,
+so "tolkein" matches "John Ronald Reuel Tolkien" as well as "Tolkien";
+rows with as many shared trigrams are ordered by Jaccard similarity, the
+shortest names first. A book matches through its title or its authors.
+"""
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .autocomplete import normalize_name
+from .models import Author, AuthorTrigram, Book, BookTrigram
+from .search import first_matches, rank_queryset
+
+DEFAULT_THRESHOLD = 0.4
+DEFAULT_MAX_RESULTS = 200
+BATCH_SIZE = 1000
+
+
+def threshold():
+    return getattr(settings, 'FUZZY_SEARCH_THRESHOLD', DEFAULT_THRESHOLD)
+
+
+def max_results():
+    return getattr(settings, 'FUZZY_SEARCH_MAX_RESULTS', DEFAULT_MAX_RESULTS)
+
+
+def trigrams(text):
+    """Return the set of trigrams of ``text``, words padded with two spaces before and one after."""
+    grams = set()
+    for word in normalize_name(text).split():
+        padded = f'  {word} '
+        grams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return grams
+
+
+def author_text(author):
+    return f'{author.first_name} {author.last_name}'
+
+
+def write_trigrams(model, field, texts):
+    """Replace the trigrams of ``{pk: text}`` in the ``model`` side table."""
+    with transaction.atomic():
+        model.objects.filter(**{f'{field}__in': list(texts)}).delete()
+        model.objects.bulk_create(
+            [model(**{field: pk, 'trigram': gram}) for pk, text in texts.items() for gram in trigrams(text)],
+            batch_size=BATCH_SIZE,
+        )
+
+
+def index_books(book_ids):
+    write_trigrams(BookTrigram, 'book_id', dict(Book.objects.filter(pk__in=book_ids).values_list('pk', 'title')))
+
+
+def index_authors(author_ids):
+    authors = Author.objects.filter(pk__in=author_ids).only('first_name', 'last_name')
+    write_trigrams(AuthorTrigram, 'author_id', {author.pk: author_text(author) for author in authors})
+
+
+def rebuild_trigrams(batch_size=BATCH_SIZE):
+    """Reindex every book and author; return the number of indexed rows."""
+    total = 0
+    BookTrigram.objects.all().delete()
+    AuthorTrigram.objects.all().delete()
+    for model, index in ((Book, index_books), (Author, index_authors)):
+        last_pk = 0
+        queryset = model.objects.order_by('pk').values_list('pk', flat=True)
+        while True:
+            pks = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not pks:
+                break
+            index(pks)
+            total += len(pks)
+            last_pk = pks[-1]
+    return total
+
+
+def match(model, field, query, limit=None):
+    """Return ``[(pk, similarity)]`` of the ``model`` rows similar to ``query``, best first."""
+    grams = trigrams(query)
+    if not grams:
+        return []
+    limit = limit or max_results()
+    needed = max(1, math.ceil(threshold() * len(grams)))
+    shared = dict(
+        model.objects.filter(trigram__in=grams).values(field)
+        .annotate(shared=Count('id')).filter(shared__gte=needed)
+        .order_by('-shared', field).values_list(field, 'shared')[:limit]
+    )
+    sizes = dict(
+        model.objects.filter(**{f'{field}__in': list(shared)}).values(field)
+        .annotate(size=Count('id')).values_list(field, 'size')
+    )
+
+    def score(pk):
+        common = shared[pk]
+        return common / len(grams), common / (len(grams) + sizes.get(pk, common) - common)
+
+    ranked = sorted(shared, key=lambda pk: (score(pk), -pk), reverse=True)
+    return [(pk, score(pk)[0]) for pk in ranked]
+
+
+def match_books(query, limit=None):
+    """Return ``[(book_id, similarity)]``, matching titles and author names."""
+    scores = dict(match(BookTrigram, 'book_id', query, limit))
+    authors = dict(match(AuthorTrigram, 'author_id', query, limit))
+    if authors:
+        written = Book.authors.through.objects.filter(author_id__in=list(authors)).values_list('book_id', 'author_id')
+        for book_id, author_id in written:
+            scores[book_id] = max(scores.get(book_id, 0), authors[author_id])
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return ranked[:limit or max_results()]
+
+
+def match_authors(query, limit=None):
+    return match(AuthorTrigram, 'author_id', query, limit)
+
+
+def match_batches(query, matcher, size):
+    """Yield the ids ranked by ``matcher`` in batches, widening its limit while the matches last."""
+    seen, limit = set(), size
+    while True:
+        matches = matcher(query, limit)
+        batch = [pk for pk, similarity in matches if pk not in seen]
+        seen.update(batch)
+        if batch:
+            yield batch
+        if len(matches) < limit:
+            return
+        limit *= 4
+
+
+def fuzzy_filter(queryset, query):
+    """Restrict a Book or Author queryset to the rows similar to ``query`` it contains, best match first."""
+    matcher = match_authors if queryset.model is Author else match_books
+    limit = max_results()
+    return rank_queryset(queryset, first_matches(queryset, match_batches(query, matcher, limit), limit))
@@ -0,0 +1,401 @@
+"""
+Bulk catalog import for publisher feeds.
+
+Feeds (CSV, JSON Lines or ONIX 3.0) are streamed record by record and
+written in batches: authors and genres are upserted by natural key, books
+are upserted by ISBN with ``bulk_create``, and the authors/genres/tags
+relations are written straight into their through tables. Books without
+an ISBN are matched on their title and authors instead, so reruns update
+them rather than inserting duplicates. Model ``save()`` and signals are
+bypassed, so derived data (search index, similar books) is refreshed
+explicitly per batch, and the caches and typeahead index once the import
+is done (``catalog_imported`` is sent for the other apps' caches).
+"""
+import csv
+import datetime
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from django.utils.text import slugify
+from taggit.models import Tag, TaggedItem
+
+from core.cache import invalidate_model
+
+from . import facets, suggest
+from .autocomplete import set_normalized_names
+from .models import Author, Book, Genre
+from .fuzzy import index_authors, index_books
+from .search import get_search_backend
+
+BOOK_FIELDS = [
+    'title', 'subtitle', 'description', 'isbn', 'language', 'pages',
+    'publisher', 'publication_date', 'edition', 'status',
+]
+
+# ONIX uses ISO 639-2/B language codes.
+ONIX_LANGUAGES = {
+    'fre': 'fr',
+    'eng': 'en',
+    'spa': 'es',
+    'ger': 'de',
+    'ita': 'it',
+}
+
+
+# Sent once after an import wrote books, so cached pages can be dropped
+catalog_imported = Signal()
+
+
+class RecordError(Exception):
+    """Raised for records that cannot be imported."""
+
+
+def split_list(value):
+    if isinstance(value, list):
+        return [item for item in value if item]
+    return [item.strip() for item in (value or '').split(';') if item.strip()]
+
+
+def parse_author(value):
+    """Return the ``(first_name, last_name)`` natural key of an author."""
+    if isinstance(value, dict):
+        return (value.get('first_name', '').strip(), value.get('last_name', '').strip())
+    first_name, _, last_name = value.strip().rpartition(' ')
+    return (first_name, last_name)
+
+
+def parse_date(value):
+    value = (value or '').strip()
+    for fmt in ('%Y-%m-%d', '%Y%m%d', '%Y-%m', '%Y%m', '%Y'):
+        try:
+            return datetime.datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise RecordError(f'Invalid publication date: {value!r}')
+
+
+def natural_key(record):
+    """Identify a book by ISBN, or by title and authors when it has none."""
+    return record['isbn'] or (record['title'], frozenset(record['authors']))
+
+
+def normalize_record(data):
+    """Validate a raw feed record and convert it to model values."""
+    title = (data.get('title') or '').strip()
+    if not title:
+        raise RecordError('Missing title')
+    return {
+        'title': title[:200],
+        'subtitle': (data.get('subtitle') or '')[:200],
+        'description': data.get('description') or '',
+        'isbn': (data.get('isbn') or '').replace('-', '').strip() or None,
+        'language': data.get('language') or 'fr',
+        'pages': int(data.get('pages') or 0),
+        'publisher': (data.get('publisher') or '')[:200],
+        'publication_date': parse_date(data.get('publication_date')),
+        'edition': (data.get('edition') or '')[:100],
+        'status': data.get('status') or 'available',
+        'authors': [parse_author(author) for author in split_list(data.get('authors'))],
+        'genres': [name[:100] for name in split_list(data.get('genres'))],
+        'tags': [name[:100] for name in split_list(data.get('tags'))],
+    }
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as handle:
+        yield from csv.DictReader(handle)
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def local_name(element):
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def find_all(element, name):
+    return [child for child in element.iter() if local_name(child) == name]
+
+
+def find_text(element, name):
+    for child in element.iter():
+        if local_name(child) == name and child.text:
+            return child.text.strip()
+    return ''
+
+
+def read_onix(path):
+    """Stream the products of an ONIX 3.0 (reference tags) message."""
+    for event, element in ET.iterparse(path, events=('end',)):
+        if local_name(element) != 'Product':
+            continue
+        isbn = ''
+        for identifier in find_all(element, 'ProductIdentifier'):
+            if find_text(identifier, 'ProductIDType') in ('15', '03'):
+                isbn = find_text(identifier, 'IDValue')
+        authors = []
+        for contributor in find_all(element, 'Contributor'):
+            if find_text(contributor, 'ContributorRole') == 'A01':
+                authors.append({
+                    'first_name': find_text(contributor, 'NamesBeforeKey'),
+                    'last_name': find_text(contributor, 'KeyNames') or find_text(contributor, 'PersonName'),
+                })
+        genres, tags = [], []
+        for subject in find_all(element, 'Subject'):
+            if find_text(subject, 'SubjectSchemeIdentifier') == '20':
+                tags.extend(split_list(find_text(subject, 'SubjectHeadingText')))
+            elif find_text(subject, 'SubjectHeadingText'):
+                genres.append(find_text(subject, 'SubjectHeadingText'))
+        pages = ''
+        for extent in find_all(element, 'Extent'):
+            if find_text(extent, 'ExtentType') in ('00', '11'):
+                pages = find_text(extent, 'ExtentValue')
+        language = find_text(element, 'LanguageCode')
+        yield {
+            'isbn': isbn,
+            'title': find_text(element, 'TitleText'),
+            'subtitle': find_text(element, 'Subtitle'),
+            'authors': authors,
+            'genres': genres,
+            'tags': tags,
+            'description': find_text(element, 'Text'),
+            'language': ONIX_LANGUAGES.get(language, language[:2] or 'fr'),
+            'pages': pages,
+            'publisher': find_text(element, 'PublisherName'),
+            'publication_date': find_text(element, 'Date'),
+            'edition': find_text(element, 'EditionStatement'),
+        }
+        element.clear()
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+    'onix': read_onix,
+}
+
+
+@dataclass
+class ImportReport:
+    processed: int = 0
+    created: int = 0
+    updated: int = 0
+    errors: list = field(default_factory=list)
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.monotonic() - self.started
+        return self.processed / elapsed if elapsed else 0.0
+
+
+class CatalogImporter:
+    """Import feed records in batches, optionally resuming from a checkpoint."""
+
+    def __init__(self, batch_size=1000, dry_run=False, checkpoint_path=None, progress=None):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.checkpoint_path = checkpoint_path
+        self.progress = progress
+        self.report = ImportReport()
+        self.book_type = ContentType.objects.get_for_model(Book)
+
+    def read_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path) as handle:
+            return json.load(handle)['offset']
+
+    def write_checkpoint(self, offset):
+        if not self.checkpoint_path or self.dry_run:
+            return
+        temporary = f'{self.checkpoint_path}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump({'offset': offset, 'at': timezone.now().isoformat()}, handle)
+        os.replace(temporary, self.checkpoint_path)
+
+    def run(self, records):
+        offset = position = self.read_checkpoint()
+        batch = []
+        for position, data in enumerate(records, start=1):
+            if position <= offset:
+                continue
+            try:
+                batch.append(normalize_record(data))
+            except (RecordError, ValueError, TypeError) as exc:
+                self.report.errors.append((position, str(exc)))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch, position)
+                batch = []
+        if batch or position > offset:
+            self.import_batch(batch, position)
+        if self.report.processed and not self.dry_run:
+            self.refresh_derived_data()
+        return self.report
+
+    def refresh_derived_data(self):
+        """Drop the caches the bulk writes bypassed, once per import."""
+        facets.invalidate()
+        invalidate_model(Book, Author, Genre, Book.authors.through, Book.genres.through)
+        suggest.invalidate()
+        catalog_imported.send(sender=Book)
+
+    def import_batch(self, records, offset):
+        with transaction.atomic():
+            if records:
+                self.write_batch(records)
+            if self.dry_run:
+                transaction.set_rollback(True)
+        self.write_checkpoint(offset)
+        self.report.processed += len(records)
+        if self.progress:
+            self.progress(self.report)
+
+    def write_batch(self, records):
+        # Collapse duplicate books within the batch, the last record wins.
+        latest = {}
+        for record in records:
+            latest[natural_key(record)] = record
+        records = list(latest.values())
+
+        authors = self.upsert_authors({key for record in records for key in record['authors']})
+        genres = self.upsert_genres({name for record in records for name in record['genres']})
+        tags = self.upsert_tags({name for record in records for name in record['tags']})
+        books = self.upsert_books(records)
+
+        book_ids = [book.pk for book in books]
+        self.replace_relations(
+            Book.authors.through, 'author_id', book_ids,
+            [(book.pk, authors[key]) for book, record in zip(books, records) for key in record['authors']],
+        )
+        self.replace_relations(
+            Book.genres.through, 'genre_id', book_ids,
+            [(book.pk, genres[name]) for book, record in zip(books, records) for name in record['genres']],
+        )
+        TaggedItem.objects.filter(content_type=self.book_type, object_id__in=book_ids).delete()
+        TaggedItem.objects.bulk_create([
+            TaggedItem(content_type=self.book_type, object_id=book.pk, tag_id=tags[name])
+            for book, record in zip(books, records)
+            for name in dict.fromkeys(record['tags']) if name in tags
+        ], ignore_conflicts=True)
+
+        backend = get_search_backend()
+        backend.index_books(Book.objects.filter(pk__in=book_ids).prefetch_related('authors', 'tags'))
+        index_books(book_ids)
+        index_authors(set(authors.values()))
+
+    def upsert_authors(self, keys):
+        """Return ``{(first_name, last_name): pk}``, creating missing authors."""
+        def existing():
+            found = Author.objects.filter(
+                last_name__in={last for first, last in keys}
+            ).values_list('first_name', 'last_name', 'pk')
+            return {(first, last): pk for first, last, pk in found if (first, last) in keys}
+
+        authors = existing()
+        missing = keys - set(authors)
+        if missing:
+            Author.objects.bulk_create(
+                [set_normalized_names(Author(first_name=first, last_name=last)) for first, last in missing],
+                batch_size=self.batch_size,
+            )
+            authors = existing()
+        return authors
+
+    def upsert_genres(self, names):
+        """Return ``{name: pk}``, creating missing genres."""
+        Genre.objects.bulk_create(
+            [set_normalized_names(Genre(name=name)) for name in names], ignore_conflicts=True,
+        )
+        return dict(Genre.objects.filter(name__in=names).values_list('name', 'pk'))
+
+    def upsert_tags(self, names):
+        """Return ``{name: pk}``, creating missing tags."""
+        Tag.objects.bulk_create(
+            [Tag(name=name, slug=slugify(name, allow_unicode=True)[:100] or name) for name in names],
+            ignore_conflicts=True,
+        )
+        return dict(Tag.objects.filter(name__in=names).values_list('name', 'pk'))
+
+    def books_without_isbn(self, records):
+        """Return ``{(title, authors): pk}`` of the existing books without ISBN among ``records``."""
+        titles = {record['title'] for record in records if not record['isbn']}
+        if not titles:
+            return {}
+        candidates = dict(Book.objects.filter(isbn__isnull=True, title__in=titles).values_list('pk', 'title'))
+        written = {pk: set() for pk in candidates}
+        rows = Book.authors.through.objects.filter(book_id__in=list(candidates)).values_list(
+            'book_id', 'author__first_name', 'author__last_name',
+        )
+        for book_id, first_name, last_name in rows:
+            written[book_id].add((first_name, last_name))
+        found = {}
+        for pk in sorted(candidates, reverse=True):
+            found[(candidates[pk], frozenset(written[pk]))] = pk
+        return found
+
+    def upsert_books(self, records):
+        """Insert or update the batch's books, returned in record order with their pks."""
+        isbns = [record['isbn'] for record in records if record['isbn']]
+        existing = set(Book.objects.filter(isbn__in=isbns).values_list('isbn', flat=True))
+        matched = self.books_without_isbn(records)
+
+        books = [
+            Book(cover_image='', similarity_dirty=True, **{name: record[name] for name in BOOK_FIELDS})
+            for record in records
+        ]
+        with_isbn = [book for book in books if book.isbn]
+        without_isbn = []
+        updated = []
+        now = timezone.now()
+        for book, record in zip(books, records):
+            if book.isbn:
+                continue
+            book.pk = matched.get(natural_key(record))
+            if book.pk is None:
+                without_isbn.append(book)
+            else:
+                book.updated_at = now
+                updated.append(book)
+        self.report.updated += len(existing) + len(updated)
+        self.report.created += len(records) - len(existing) - len(updated)
+        if with_isbn:
+            Book.objects.bulk_create(
+                with_isbn,
+                batch_size=self.batch_size,
+                update_conflicts=True,
+                unique_fields=['isbn'],
+                update_fields=[name for name in BOOK_FIELDS if name != 'isbn'] + ['similarity_dirty', 'updated_at'],
+            )
+            # Upserted rows do not reliably report their pk on every backend.
+            pks = dict(Book.objects.filter(isbn__in=isbns).values_list('isbn', 'pk'))
+            for book in with_isbn:
+                book.pk = pks[book.isbn]
+        if without_isbn:
+            Book.objects.bulk_create(without_isbn, batch_size=self.batch_size)
+        if updated:
+            Book.objects.bulk_update(
+                updated,
+                [name for name in BOOK_FIELDS if name != 'isbn'] + ['similarity_dirty', 'updated_at'],
+                batch_size=self.batch_size,
+            )
+        return books
+
+    def replace_relations(self, through, column, book_ids, pairs):
+        through.objects.filter(book_id__in=book_ids).delete()
+        through.objects.bulk_create(
+            [through(book_id=book_id, **{column: value}) for book_id, value in dict.fromkeys(pairs)],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
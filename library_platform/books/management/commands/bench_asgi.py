@@ -0,0 +1,132 @@
+"""
+Compare the throughput of the sync (WSGI) and async (ASGI) read paths.
+
+Both variants of every endpoint are mounted under /bench/ in front of the
+project URLs and requested in-process on the current database: the sync
+views through the WSGI test client from a pool of threads (like a threaded
+WSGI server), the async views through the ASGI test client from concurrent
+tasks of one event loop. Server and network overhead are not measured.
+"""
+import asyncio
+import statistics
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.urls import path
+
+from books import async_views, views
+from books.models import Book
+from core.views import AsyncHomeView, HomeView
+
+
+def endpoints():
+    """Return ``[(route, sync_view, async_view)]``."""
+    return [
+        ('featured/', views.FeaturedBooksAPIView.as_view(), async_views.FeaturedBooksView.as_view()),
+        ('new-releases/', views.NewReleasesAPIView.as_view(), async_views.NewReleasesView.as_view()),
+        ('popular/', views.PopularBooksAPIView.as_view(), async_views.PopularBooksView.as_view()),
+        ('books/', views.BookViewSet.as_view({'get': 'list'}), async_views.BookListView.as_view()),
+        (
+            'books/<int:pk>/',
+            views.BookViewSet.as_view({'get': 'retrieve'}),
+            async_views.BookDetailView.as_view(),
+        ),
+        ('home/', HomeView.as_view(), AsyncHomeView.as_view()),
+    ]
+
+
+def build_urlconf(mode):
+    module = types.ModuleType(f'bench_{mode}_urls')
+    module.urlpatterns = [
+        path(f'bench/{route}', sync_view if mode == 'wsgi' else async_view)
+        for route, sync_view, async_view in endpoints()
+    ] + import_module(settings.ROOT_URLCONF).urlpatterns
+    return module
+
+
+def summarize(latencies, elapsed, errors):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': statistics.median(latencies) * 1000,
+        'p95': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'errors': errors,
+    }
+
+
+def run_wsgi(url, requests, concurrency):
+    local = threading.local()
+
+    def fetch(_):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        started = time.perf_counter()
+        response = local.client.get(url)
+        return time.perf_counter() - started, response.status_code
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(fetch, range(concurrency)))  # warm up
+        started = time.perf_counter()
+        results = list(executor.map(fetch, range(requests)))
+        elapsed = time.perf_counter() - started
+    return summarize([latency for latency, status in results], elapsed,
+                     sum(status != 200 for latency, status in results))
+
+
+async def run_asgi(url, requests, concurrency):
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(url)
+            return time.perf_counter() - started, response.status_code
+
+    await asyncio.gather(*(fetch() for _ in range(concurrency)))  # warm up
+    started = time.perf_counter()
+    results = await asyncio.gather(*(fetch() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return summarize([latency for latency, status in results], elapsed,
+                     sum(status != 200 for latency, status in results))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the sync (WSGI) and async (ASGI) read endpoints on the current dataset.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and mode.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--only', help='Comma-separated routes to run, e.g. "featured/,books/".')
+
+    def handle(self, *args, **options):
+        book = Book.objects.order_by('pk').first()
+        if book is None:
+            raise CommandError('The benchmark needs at least one book.')
+        only = set(filter(None, (options['only'] or '').split(',')))
+        routes = [route for route, sync_view, async_view in endpoints() if not only or route in only]
+
+        self.stdout.write(f"{'endpoint':<20}{'mode':<6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+        for route in routes:
+            url = '/bench/' + route.replace('<int:pk>', str(book.pk))
+            for mode in ('wsgi', 'asgi'):
+                with override_settings(
+                    ROOT_URLCONF=build_urlconf(mode),
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                    DEBUG=False,
+                ):
+                    if mode == 'wsgi':
+                        result = run_wsgi(url, options['requests'], options['concurrency'])
+                    else:
+                        result = asyncio.run(run_asgi(url, options['requests'], options['concurrency']))
+                self.stdout.write(
+                    f"{route:<20}{mode:<6}{result['rps']:>10.1f}{result['p50']:>10.2f}"
+                    f"{result['p95']:>10.2f}{result['errors']:>8}"
+                )
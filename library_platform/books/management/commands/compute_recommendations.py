@@ -0,0 +1,18 @@
+"""
+Recompute the collaborative filtering recommendations.
+"""
+from django.core.management.base import BaseCommand
+
+from books.recommender import compute_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Refresh recommendations (only users with new activity unless --full is given).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute similarities and every user.')
+        parser.add_argument('--limit', type=int, help='Recommendations per user.')
+
+    def handle(self, *args, **options):
+        total = compute_recommendations(incremental=not options['full'], limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Computed recommendations for {total} users.'))
@@ -0,0 +1,18 @@
+"""
+Recompute the precomputed similar-books table.
+"""
+from django.core.management.base import BaseCommand
+
+from books.similarity import TOP_K, compute_similar_books
+
+
+class Command(BaseCommand):
+    help = 'Recompute similar books (only outdated books unless --full is given).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every book.')
+        parser.add_argument('--top-k', type=int, default=TOP_K)
+
+    def handle(self, *args, **options):
+        total = compute_similar_books(incremental=not options['full'], top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f'Computed similar books for {total} books.'))
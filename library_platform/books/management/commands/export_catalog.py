@@ -0,0 +1,74 @@
+"""
+Export the catalog as NDJSON or CSV, optionally incrementally.
+"""
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from books.export import CHUNK_SIZE, FORMATS, export_chunks
+
+
+class Command(BaseCommand):
+    help = 'Stream the catalog to a file (or stdout) as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file, "-" for stdout.')
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output (implied by a .gz path).')
+        parser.add_argument(
+            '--since', help='Only export books updated, and tombstones of books deleted, at or after this ISO datetime.'
+        )
+        parser.add_argument(
+            '--state', help='Watermark file: read as --since and updated after a successful export.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        since = self.get_since(options)
+        # Rows changed while the export runs are picked up again by the next run.
+        watermark = timezone.now()
+        chunks = export_chunks(
+            output=options['format'],
+            since=since,
+            compress=options['gzip'] or options['path'].endswith('.gz'),
+            chunk_size=options['chunk_size'],
+        )
+
+        size = 0
+        if options['path'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+                size += len(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            temporary = f"{options['path']}.tmp"
+            with open(temporary, 'wb') as handle:
+                for chunk in chunks:
+                    handle.write(chunk)
+                    size += len(chunk)
+            os.replace(temporary, options['path'])
+
+        if options['state']:
+            with open(options['state'], 'w') as handle:
+                json.dump({'since': watermark.isoformat()}, handle)
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {size} bytes (since {since.isoformat() if since else "the beginning"}).'
+        ))
+
+    def get_since(self, options):
+        value = options['since']
+        if value is None and options['state'] and os.path.exists(options['state']):
+            with open(options['state']) as handle:
+                value = json.load(handle)['since']
+        if value is None:
+            return None
+        since = parse_datetime(value)
+        if since is None:
+            raise CommandError(f'Invalid datetime: {value}')
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
@@ -0,0 +1,39 @@
+"""
+Generate the resized versions of existing book covers and author photos.
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from books.tasks import generate_image_derivatives
+from books.thumbnails import IMAGE_FIELDS, update_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Backfill cover and photo derivatives (only missing or outdated ones unless --force).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['book', 'author'], help='Only process this model.')
+        parser.add_argument('--force', action='store_true', help='Regenerate up-to-date derivatives too.')
+        parser.add_argument('--queue', action='store_true', help='Queue Celery tasks instead of working inline.')
+
+    def handle(self, *args, **options):
+        for app_label, model_name, field_name in IMAGE_FIELDS:
+            if options['model'] and options['model'] != model_name.lower():
+                continue
+            model = apps.get_model(app_label, model_name)
+            pks = (
+                model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .order_by('pk').values_list('pk', flat=True)
+            )
+            done = 0
+            for pk in pks.iterator():
+                if options['queue']:
+                    generate_image_derivatives.delay(model._meta.label, pk, field_name, options['force'])
+                    done += 1
+                    continue
+                try:
+                    done += update_derivatives(model, pk, field_name, force=options['force'])
+                except (OSError, ValueError) as exc:
+                    self.stderr.write(f'{model_name} {pk}: {exc}')
+            verb = 'Queued' if options['queue'] else 'Generated'
+            self.stdout.write(self.style.SUCCESS(f'{verb} derivatives for {done} {model_name.lower()} images.'))
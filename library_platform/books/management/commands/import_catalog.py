@@ -0,0 +1,62 @@
+"""
+Bulk import a publisher catalog feed (CSV, JSON Lines or ONIX).
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books.importers import READERS, CatalogImporter
+
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.xml': 'onix',
+    '.onix': 'onix',
+}
+
+
+class Command(BaseCommand):
+    help = 'Import books from a CSV, JSON Lines or ONIX feed in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Validate and write nothing.')
+        parser.add_argument('--checkpoint', help='Checkpoint file (defaults to <path>.checkpoint).')
+        parser.add_argument('--restart', action='store_true', help='Ignore any existing checkpoint.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+        file_format = options['format'] or EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if file_format is None:
+            raise CommandError('Cannot infer the feed format, use --format.')
+
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        if options['restart'] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        importer = CatalogImporter(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            checkpoint_path=checkpoint,
+            progress=self.print_progress,
+        )
+        report = importer.run(READERS[file_format](path))
+
+        for position, message in report.errors:
+            self.stderr.write(f'Record {position}: {message}')
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}{report.processed} records imported ({report.created} created, '
+            f'{report.updated} updated, {len(report.errors)} rejected) '
+            f'at {report.rows_per_second:.0f} rows/s.'
+        ))
+        if not options['dry_run'] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+    def print_progress(self, report):
+        self.stdout.write(f'{report.processed} records, {report.rows_per_second:.0f} rows/s')
@@ -0,0 +1,17 @@
+"""
+Fill the normalized author and genre names used by the autocomplete endpoints.
+"""
+from django.core.management.base import BaseCommand
+
+from books.autocomplete import backfill_normalized_names
+
+
+class Command(BaseCommand):
+    help = 'Recompute the normalized names of every author and genre.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = backfill_normalized_names(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Normalized {total} author and genre names.'))
@@ -0,0 +1,17 @@
+"""
+Rebuild the trigram tables used by the fuzzy search.
+"""
+from django.core.management.base import BaseCommand
+
+from books.fuzzy import BATCH_SIZE, rebuild_trigrams
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the fuzzy search trigrams of every book title and author name.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        total = rebuild_trigrams(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} books and authors.'))
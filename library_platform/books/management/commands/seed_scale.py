@@ -0,0 +1,48 @@
+"""
+Generate a large synthetic dataset for load and scale testing.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from books.seeding import BATCH_SIZE, TABLES, default_sizes, seed
+
+
+class Command(BaseCommand):
+    help = 'Bulk insert synthetic books, authors, users, reviews, reading history and collections.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=100_000,
+                            help='Number of books; the other sizes scale with it unless given.')
+        for table in TABLES:
+            if table != 'books':
+                parser.add_argument(f'--{table.replace("_", "-")}', type=int, dest=table)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (same seed, same data).')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=1, help='Processes generating each table (ignored on SQLite).')
+        parser.add_argument('--only', nargs='+', choices=TABLES, help='Only generate these tables.')
+        parser.add_argument('--index', action='store_true', help='Rebuild the search index afterwards.')
+
+    def handle(self, *args, **options):
+        sizes = default_sizes(options['books'])
+        for table in TABLES:
+            if options.get(table) is not None:
+                sizes[table] = options[table]
+
+        self.stdout.write(', '.join(f'{sizes[table]} {table}' for table in TABLES))
+        reported = {}
+
+        def report(table, written):
+            self.stdout.write(f'{table}: ' + ', '.join(
+                f'{count} {label}' for label, count in written.items() if reported.get(label) != count
+            ))
+            reported.update(written)
+
+        try:
+            written = seed(
+                sizes, seed=options['seed'], batch_size=options['batch_size'], workers=options['workers'],
+                tables=options['only'] or TABLES, index=options['index'], progress=report,
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+        self.stdout.write(self.style.SUCCESS(
+            'Created ' + ', '.join(f'{count} {label}' for label, count in written.items()) + '.'
+        ))
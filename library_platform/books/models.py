@@ -17,6 +17,8 @@ class Genre(models.Model):
     name = models.CharField(_('name'), max_length=100, unique=True)
     description = models.TextField(_('description'), blank=True)
     color = models.CharField(_('color'), max_length=7, default='#3B82F6')  # Hex color
+    # Case and accent insensitive name for prefix search, see books.autocomplete
+    normalized_name = models.CharField(_('normalized name'), max_length=100, editable=False, db_index=True, default='')
     
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
@@ -35,12 +37,19 @@ class Author(models.Model):
     
     first_name = models.CharField(_('first name'), max_length=100)
     last_name = models.CharField(_('last name'), max_length=100)
+    # Case and accent insensitive names for prefix search, see books.autocomplete
+    normalized_name = models.CharField(_('normalized name'), max_length=201, editable=False, db_index=True, default='')
+    normalized_last_name = models.CharField(
+        _('normalized last name'), max_length=100, editable=False, db_index=True, default=''
+    )
     bio = HTMLField(_('biography'), blank=True)
     birth_date = models.DateField(_('birth date'), blank=True, null=True)
     death_date = models.DateField(_('death date'), blank=True, null=True)
     nationality = models.CharField(_('nationality'), max_length=100, blank=True)
     photo = models.ImageField(_('photo'), upload_to='authors/', blank=True, null=True)
     website = models.URLField(_('website'), blank=True)
+    # Resized versions of the photo, see books.thumbnails
+    photo_derivatives = models.JSONField(_('photo derivatives'), default=dict, blank=True, editable=False)
     
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
@@ -57,6 +66,42 @@ class Author(models.Model):
         return f"{self.first_name} {self.last_name}"
 
 
+class BookQuerySet(models.QuerySet):
+    """Book querysets with named loading profiles.
+    
+    Each profile loads the columns and relations read by one way of showing
+    books, so lists do not fetch the HTML description of every book nor run
+    a query per book for its authors.
+    """
+    
+    # Read by the book cards and BookListSerializer; sort keys included
+    CARD_FIELDS = (
+        'id', 'title', 'subtitle', 'language', 'status', 'is_featured', 'is_new',
+        'cover_image', 'cover_derivatives', 'pdf_file', 'epub_file', 'audio_file',
+        'publication_date', 'created_at', 'average_rating', 'total_ratings',
+        'bayesian_rating', 'trending_score',
+    )
+    
+    def available(self):
+        return self.filter(status='available')
+    
+    def for_card(self):
+        """Cover, title, authors and ratings."""
+        return self.only(*self.CARD_FIELDS).prefetch_related(
+            models.Prefetch('authors', queryset=Author.objects.only('id', 'first_name', 'last_name')),
+        )
+    
+    def for_list(self):
+        """Card columns plus the genre badges."""
+        return self.for_card().prefetch_related(
+            models.Prefetch('genres', queryset=Genre.objects.only('id', 'name', 'color')),
+        )
+    
+    def for_detail(self):
+        """Every column with authors, genres and tags."""
+        return self.prefetch_related('authors', 'genres', 'tags')
+
+
 class Book(models.Model):
     """Book model with multilingual support."""
     
@@ -91,6 +136,8 @@ class Book(models.Model):
     pdf_file = models.FileField(_('PDF file'), upload_to='books/pdf/', blank=True, null=True)
     epub_file = models.FileField(_('EPUB file'), upload_to='books/epub/', blank=True, null=True)
     audio_file = models.FileField(_('audio file'), upload_to='books/audio/', blank=True, null=True)
+    # Resized versions of the cover, see books.thumbnails
+    cover_derivatives = models.JSONField(_('cover derivatives'), default=dict, blank=True, editable=False)
     
     # Publication info
     publisher = models.CharField(_('publisher'), max_length=200, blank=True)
@@ -105,25 +152,43 @@ class Book(models.Model):
     # Ratings and stats
     average_rating = models.DecimalField(_('average rating'), max_digits=3, decimal_places=2, default=0)
     total_ratings = models.PositiveIntegerField(_('total ratings'), default=0)
+    rating_sum = models.PositiveIntegerField(_('rating sum'), default=0)
     view_count = models.PositiveIntegerField(_('view count'), default=0)
     download_count = models.PositiveIntegerField(_('download count'), default=0)
+    # Maintained by books.popularity
+    bayesian_rating = models.FloatField(_('weighted rating'), default=0)
+    trending_score = models.FloatField(_('trending score'), default=0)
+    # Kept apart from updated_at so score refreshes neither outdate every
+    # validator nor fill incremental exports
+    scores_updated_at = models.DateTimeField(_('scores updated at'), null=True, blank=True, editable=False)
     
     # SEO and tags
     tags = TaggableManager(verbose_name=_('tags'), blank=True)
     
+    # Set when genres, authors or tags change so similar books get recomputed
+    similarity_dirty = models.BooleanField(_('similar books outdated'), default=True, db_index=True)
+    
     # Timestamps
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
     
+    objects = BookQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('Book')
         verbose_name_plural = _('Books')
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['title']),
+            # Sort indexes end with the id tiebreak used by keyset pagination
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['title', 'id']),
             models.Index(fields=['language']),
             models.Index(fields=['status']),
-            models.Index(fields=['-average_rating']),
+            models.Index(fields=['-average_rating', '-id']),
+            models.Index(fields=['publication_date', 'id']),
+            # Popular and trending lists of available books read a single index range
+            models.Index(fields=['status', '-bayesian_rating', '-id']),
+            models.Index(fields=['status', '-trending_score', '-id']),
         ]
     
     def __str__(self):
@@ -149,13 +214,69 @@ class Book(models.Model):
         return bool(self.pdf_file or self.epub_file)
     
     def update_rating(self):
-        """Update average rating based on reviews."""
-        reviews = self.reviews.all()
-        if reviews:
-            total = sum([review.rating for review in reviews])
-            self.average_rating = total / len(reviews)
-            self.total_ratings = len(reviews)
-            self.save(update_fields=['average_rating', 'total_ratings'])
+        """Recompute the rating aggregates from the reviews table."""
+        from .ratings import reconcile_ratings
+        reconcile_ratings(book_ids=[self.pk])
+        self.refresh_from_db(fields=['average_rating', 'total_ratings', 'rating_sum'])
+
+
+class SimilarBook(models.Model):
+    """Precomputed similar books, ranked per book."""
+    
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similar_entries')
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField(_('score'))
+    rank = models.PositiveSmallIntegerField(_('rank'))
+    
+    class Meta:
+        verbose_name = _('Similar Book')
+        verbose_name_plural = _('Similar Books')
+        unique_together = ['book', 'similar']
+        ordering = ['book', 'rank']
+        indexes = [
+            models.Index(fields=['book', 'rank']),
+        ]
+    
+    def __str__(self):
+        return f"{self.book_id} -> {self.similar_id} ({self.score:.3f})"
+
+
+class BookActivity(models.Model):
+    """Daily view and download counts of a book, feeding the trending score."""
+    
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='activity')
+    date = models.DateField(_('date'))
+    views = models.PositiveIntegerField(_('views'), default=0)
+    downloads = models.PositiveIntegerField(_('downloads'), default=0)
+    
+    class Meta:
+        verbose_name = _('Book Activity')
+        verbose_name_plural = _('Book Activities')
+        unique_together = ['book', 'date']
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.book_id} {self.date}: {self.views} views, {self.downloads} downloads"
+
+
+class GenreTrendingBook(models.Model):
+    """Precomputed trending books, ranked per genre."""
+    
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, related_name='trending_entries')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField(_('score'))
+    rank = models.PositiveSmallIntegerField(_('rank'))
+    
+    class Meta:
+        verbose_name = _('Genre Trending Book')
+        verbose_name_plural = _('Genre Trending Books')
+        unique_together = ['genre', 'rank']
+        ordering = ['genre', 'rank']
+    
+    def __str__(self):
+        return f"{self.genre_id} #{self.rank}: {self.book_id} ({self.score:.1f})"
 
 
 class ReadingHistory(models.Model):
@@ -188,6 +309,8 @@ class ReadingHistory(models.Model):
     # Timestamps
     started_reading = models.DateTimeField(_('started reading'), blank=True, null=True)
     finished_reading = models.DateTimeField(_('finished reading'), blank=True, null=True)
+    # Client timestamp of the last progress event applied, used to ignore replays
+    progress_synced_at = models.DateTimeField(_('progress synced at'), blank=True, null=True)
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
     
@@ -196,6 +319,9 @@ class ReadingHistory(models.Model):
         verbose_name_plural = _('Reading Histories')
         unique_together = ['user', 'book']
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['user', '-updated_at', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.book.title} ({self.status})"
@@ -226,9 +352,19 @@ class Review(models.Model):
         verbose_name_plural = _('Reviews')
         unique_together = ['user', 'book']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.book.title} ({self.rating}/5)"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted rating so signals can apply rating deltas.
+        instance._loaded_rating = (instance.__dict__.get('book_id'), instance.__dict__.get('rating'))
+        return instance
 
 
 class BookCollection(models.Model):
@@ -261,4 +397,49 @@ class BookCollection(models.Model):
         ordering = ['-updated_at']
     
     def __str__(self):
-        return f"{self.user.email} - {self.name}"
\ No newline at end of file
+        return f"{self.user.email} - {self.name}"
+
+
+class BookTrigram(models.Model):
+    """Trigram of a book's normalized title, see books.fuzzy."""
+    
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='trigrams')
+    trigram = models.CharField(_('trigram'), max_length=3)
+    
+    class Meta:
+        verbose_name = _('Book Trigram')
+        verbose_name_plural = _('Book Trigrams')
+        # Also the index looking up the books sharing a trigram
+        unique_together = ['trigram', 'book']
+    
+    def __str__(self):
+        return f"{self.book_id}: {self.trigram}"
+
+
+class AuthorTrigram(models.Model):
+    """Trigram of an author's normalized full name, see books.fuzzy."""
+    
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='trigrams')
+    trigram = models.CharField(_('trigram'), max_length=3)
+    
+    class Meta:
+        verbose_name = _('Author Trigram')
+        verbose_name_plural = _('Author Trigrams')
+        unique_together = ['trigram', 'author']
+    
+    def __str__(self):
+        return f"{self.author_id}: {self.trigram}"
+
+
+class DeletedBook(models.Model):
+    """Id of a deleted book, exported as a tombstone by incremental exports (see books.export)."""
+    
+    book_id = models.PositiveBigIntegerField(_('book id'))
+    deleted_at = models.DateTimeField(_('deleted at'), auto_now_add=True, db_index=True)
+    
+    class Meta:
+        verbose_name = _('Deleted Book')
+        verbose_name_plural = _('Deleted Books')
+    
+    def __str__(self):
+        return f"{self.book_id} deleted at {self.deleted_at}"
@@ -0,0 +1,271 @@
+"""
+Keyset (cursor) pagination for books app.
+
+Pages are fetched with a ``WHERE (ordering columns) > (last row values)``
+condition instead of OFFSET, and without a COUNT(*), so the cost of a page
+does not depend on its depth. The primary key is always appended to the
+ordering as a tiebreak so rows sharing a sort value are neither skipped nor
+repeated. Cursors are opaque, URL-safe tokens bound to the ordering they
+were issued for.
+"""
+import base64
+import datetime
+import decimal
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.http import Http404
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class InvalidCursor(Exception):
+    """Raised for cursors that cannot be decoded or belong to another ordering."""
+
+
+def resolve_ordering(queryset):
+    """Return the queryset ordering as ``[(field, descending), ...]`` with a pk tiebreak."""
+    names = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+    ordering = []
+    for name in names:
+        if not isinstance(name, str):
+            raise InvalidCursor('Keyset pagination only supports ordering by field names.')
+        descending = name.startswith('-')
+        field = name.lstrip('-')
+        ordering.append(('id' if field == 'pk' else field, descending))
+    if not ordering or ordering[-1][0] != 'id':
+        ordering.append(('id', ordering[0][1] if ordering else False))
+    return ordering
+
+
+def serialize_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def row_position(row, ordering):
+    position = []
+    for field, descending in ordering:
+        value = row
+        for part in field.split('__'):
+            value = getattr(value, part)
+        position.append(serialize_value(value))
+    return position
+
+
+def encode_cursor(ordering, position, reverse=False):
+    payload = {
+        'o': ['-' + field if descending else field for field, descending in ordering],
+        'p': position,
+        'r': reverse,
+    }
+    data = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def ordering_field(model, name):
+    """Return the model field designated by the ordering ``name`` (``author__last_name`` style)."""
+    *relations, name = name.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def decode_cursor(cursor, ordering, model):
+    """Return the position and direction of ``cursor``, its values converted to the field types."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(data)
+        signature = ['-' + field if descending else field for field, descending in ordering]
+        if payload['o'] != signature or len(payload['p']) != len(ordering):
+            raise InvalidCursor('Cursor does not match the requested ordering.')
+        position = []
+        for (name, descending), value in zip(ordering, payload['p']):
+            field = ordering_field(model, name)
+            if value is None and not field.null:
+                raise InvalidCursor('Cursor value out of range.')
+            position.append(field.to_python(value))
+        return position, bool(payload['r'])
+    except (ValueError, TypeError, KeyError, ValidationError, FieldDoesNotExist) as exc:
+        raise InvalidCursor('Invalid cursor.') from exc
+
+
+def keyset_condition(ordering, position, forward=True):
+    """Build the condition selecting rows after ``position`` in ``ordering``."""
+    condition = Q()
+    equal = Q()
+    for (field, descending), value in zip(ordering, position):
+        lookup = 'lt' if descending == forward else 'gt'
+        condition |= equal & Q(**{f'{field}__{lookup}': value})
+        equal &= Q(**{field: value})
+    return condition
+
+
+class KeysetPage:
+    """A page of results with the cursors of its neighbours."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def load_fields(queryset, names):
+    """Make sure querysets trimmed with ``only()``/``defer()`` still load the concrete fields ``names``."""
+    field_names, defer = queryset.query.deferred_loading
+    if not field_names:
+        return queryset
+    concrete = {field.name for field in queryset.model._meta.concrete_fields}
+    keys = {name for name in names if name in concrete}
+    if defer:
+        if field_names & keys:
+            queryset = queryset.defer(None).defer(*(field_names - keys))
+        return queryset
+    if not keys <= field_names:
+        queryset = queryset.only(*(field_names | keys))
+    return queryset
+
+
+def load_ordering_fields(queryset, ordering):
+    """Make sure trimmed querysets still load the sort keys."""
+    return load_fields(queryset, [field for field, descending in ordering])
+
+
+def keyset_query(queryset, cursor, page_size):
+    """Return the query fetching a page (plus one look-ahead row) and its state."""
+    ordering = resolve_ordering(queryset)
+    queryset = load_ordering_fields(queryset, ordering)
+    queryset = queryset.order_by(*['-' + field if descending else field for field, descending in ordering])
+    position, reverse = decode_cursor(cursor, ordering, queryset.model) if cursor else (None, False)
+    if position is not None:
+        queryset = queryset.filter(keyset_condition(ordering, position, forward=not reverse))
+    if reverse:
+        queryset = queryset.reverse()
+    return queryset[:page_size + 1], (ordering, position, reverse, page_size)
+
+
+def keyset_page(rows, state):
+    """Build the :class:`KeysetPage` from the rows fetched by :func:`keyset_query`."""
+    ordering, position, reverse, page_size = state
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if reverse:
+        rows.reverse()
+
+    has_next = has_more if not reverse else True
+    has_previous = position is not None if not reverse else has_more
+    next_cursor = previous_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(ordering, row_position(rows[-1], ordering))
+    if rows and has_previous:
+        previous_cursor = encode_cursor(ordering, row_position(rows[0], ordering), reverse=True)
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def paginate(queryset, cursor=None, page_size=20):
+    """Return the :class:`KeysetPage` of ``queryset`` designated by ``cursor``."""
+    queryset, state = keyset_query(queryset, cursor, page_size)
+    return keyset_page(list(queryset), state)
+
+
+async def apaginate(queryset, cursor=None, page_size=20):
+    """Async version of :func:`paginate`."""
+    queryset, state = keyset_query(queryset, cursor, page_size)
+    return keyset_page([row async for row in queryset], state)
+
+
+class KeysetPagination(BasePagination):
+    """DRF pagination class using keyset cursors instead of page numbers."""
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = _('Invalid cursor')
+
+    def get_page_size(self, request):
+        page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 20)
+        params = getattr(request, 'query_params', request.GET)
+        try:
+            requested = int(params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        return min(max(requested, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.page = paginate(
+                queryset, request.query_params.get(self.cursor_query_param), self.get_page_size(request)
+            )
+        except InvalidCursor:
+            raise NotFound(self.invalid_cursor_message)
+        return self.page.object_list
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self.get_link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        return self.get_link(self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class KeysetPaginationMixin:
+    """ListView mixin paginating with keyset cursors (``?cursor=``).
+
+    ``page_obj`` is a :class:`KeysetPage` exposing ``next_cursor`` and
+    ``previous_cursor``; there is no paginator nor page count.
+    """
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        try:
+            page = paginate(queryset, self.request.GET.get(self.cursor_kwarg), page_size)
+        except InvalidCursor:
+            raise Http404(_('Invalid cursor'))
+        return (None, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,155 @@
+"""
+Materialized popularity scores.
+
+``Book.bayesian_rating`` is the average rating shrunk towards the catalog
+mean, as if every book had ``POPULARITY_PRIOR_RATINGS`` extra ratings at that
+mean, so a single 5-star review no longer beats books rated by thousands.
+
+``Book.trending_score`` sums the activity of the last ``WINDOW_DAYS`` days
+(views, downloads, new reviews and reading starts, weighted by ``WEIGHTS``),
+each event decaying by half every ``HALF_LIFE_DAYS`` days. Views and
+downloads come from the daily ``BookActivity`` buckets filled when the
+counters are flushed; the ``GenreTrendingBook`` table keeps the best
+trending books of every genre.
+
+Both are refreshed by the ``update_popularity`` Celery task and stored in
+columns indexed with ``status``, so popular and trending lists read one
+index range. Rows whose score changes get a new ``scores_updated_at``, read
+by the conditional GET validators of the responses rendering the scores;
+``updated_at`` is left alone, so scores decaying every run do not outdate
+the other validators nor add the whole catalog to incremental exports.
+"""
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, Q, Sum
+from django.db.models.functions import Cast, Round
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Book, BookActivity, GenreTrendingBook, ReadingHistory, Review
+
+WINDOW_DAYS = 7
+HALF_LIFE_DAYS = 3
+WEIGHTS = {
+    'views': 1.0,
+    'downloads': 3.0,
+    'reviews': 10.0,
+    'reading_starts': 5.0,
+}
+GENRE_TOP = 50
+WRITE_BATCH_SIZE = 1000
+
+# Sent after the stored scores changed, so cached lists can be dropped
+popularity_updated = Signal()
+
+
+def prior_ratings():
+    return getattr(settings, 'POPULARITY_PRIOR_RATINGS', 10)
+
+
+def record_activity(deltas, date=None):
+    """Add flushed counter deltas (``{book_id: {field: delta}}``) to the daily buckets."""
+    date = date or timezone.localdate()
+    for book_id, fields in deltas.items():
+        views, downloads = fields.get('view_count', 0), fields.get('download_count', 0)
+        if not views and not downloads:
+            continue
+        bucket = BookActivity.objects.filter(book_id=book_id, date=date)
+        if bucket.update(views=F('views') + views, downloads=F('downloads') + downloads):
+            continue
+        try:
+            with transaction.atomic():
+                BookActivity.objects.create(book_id=book_id, date=date, views=views, downloads=downloads)
+        except IntegrityError:
+            # Created concurrently by another flush
+            bucket.update(views=F('views') + views, downloads=F('downloads') + downloads)
+
+
+def update_bayesian_ratings():
+    """Recompute the weighted ratings against the current catalog mean; return the updated count."""
+    totals = Book.objects.aggregate(rating_sum=Sum('rating_sum'), total_ratings=Sum('total_ratings'))
+    mean = (totals['rating_sum'] or 0) / (totals['total_ratings'] or 1)
+    prior = prior_ratings()
+    weighted = Round(
+        (Cast(F('rating_sum'), FloatField()) + prior * mean) / (F('total_ratings') + prior), 4,
+    )
+    return Book.objects.filter(~Q(bayesian_rating=weighted)).update(
+        bayesian_rating=weighted, scores_updated_at=timezone.now(),
+    )
+
+
+def decay(age_days):
+    return 0.5 ** (max(age_days, 0) / HALF_LIFE_DAYS)
+
+
+def trending_scores(now=None):
+    """Return ``{book_id: score}`` of the books with activity in the window."""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    since = now - datetime.timedelta(days=WINDOW_DAYS)
+    scores = defaultdict(float)
+
+    buckets = BookActivity.objects.filter(date__gt=today - datetime.timedelta(days=WINDOW_DAYS))
+    for book_id, date, views, downloads in buckets.values_list('book_id', 'date', 'views', 'downloads'):
+        # Buckets count from the middle of their day
+        weight = decay((today - date).days + 0.5)
+        scores[book_id] += weight * (WEIGHTS['views'] * views + WEIGHTS['downloads'] * downloads)
+
+    events = (
+        ('reviews', Review.objects.filter(is_approved=True, created_at__gte=since)
+         .values_list('book_id', 'created_at')),
+        ('reading_starts', ReadingHistory.objects.filter(started_reading__gte=since)
+         .values_list('book_id', 'started_reading')),
+    )
+    for name, rows in events:
+        for book_id, happened in rows.iterator(chunk_size=10000):
+            scores[book_id] += WEIGHTS[name] * decay((now - happened).total_seconds() / 86400)
+    return scores
+
+
+def update_trending(now=None):
+    """Store the trending scores and rebuild the per-genre rankings; return the trending count."""
+    now = now or timezone.now()
+    scores = {book_id: round(score, 4) for book_id, score in trending_scores(now).items()}
+
+    with transaction.atomic():
+        stored = dict(Book.objects.filter(trending_score__gt=0).values_list('pk', 'trending_score'))
+        Book.objects.filter(pk__in=[book_id for book_id in stored if book_id not in scores]).update(
+            trending_score=0, scores_updated_at=now,
+        )
+        Book.objects.bulk_update(
+            [
+                Book(pk=book_id, trending_score=score, scores_updated_at=now)
+                for book_id, score in scores.items() if stored.get(book_id, 0) != score
+            ],
+            ['trending_score', 'scores_updated_at'], batch_size=WRITE_BATCH_SIZE,
+        )
+
+        ranked = defaultdict(list)
+        genres = Book.genres.through.objects.filter(
+            book__status='available', book__trending_score__gt=0,
+        ).values_list('genre_id', 'book_id', 'book__trending_score')
+        for genre_id, book_id, score in genres.iterator(chunk_size=10000):
+            ranked[genre_id].append((score, book_id))
+        entries = []
+        for genre_id, books in ranked.items():
+            books.sort(key=lambda item: (-item[0], -item[1]))
+            entries.extend(
+                GenreTrendingBook(genre_id=genre_id, book_id=book_id, score=score, rank=rank)
+                for rank, (score, book_id) in enumerate(books[:GENRE_TOP], start=1)
+            )
+        GenreTrendingBook.objects.all().delete()
+        GenreTrendingBook.objects.bulk_create(entries, batch_size=WRITE_BATCH_SIZE)
+    BookActivity.objects.filter(date__lte=timezone.localdate(now) - datetime.timedelta(days=WINDOW_DAYS)).delete()
+    return len(scores)
+
+
+def update_popularity():
+    """Refresh both scores; return ``(weighted ratings updated, trending books)``."""
+    rated = update_bayesian_ratings()
+    trending = update_trending()
+    popularity_updated.send(sender=Book)
+    return rated, trending
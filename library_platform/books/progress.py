@@ -0,0 +1,120 @@
+"""
+Batched reading progress sync.
+
+Reader clients send progress events in batches instead of one request per
+page turn. Events are coalesced to the latest one per book, and events no
+newer than the last applied one (``progress_synced_at``) are ignored, so a
+retried batch is a no-op. The remaining changes are written with at most one
+``bulk_update`` and one ``bulk_create`` per batch.
+"""
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Book, ReadingHistory
+
+PROGRESS_FIELDS = [
+    'status', 'progress_percentage', 'current_page', 'started_reading',
+    'finished_reading', 'progress_synced_at', 'updated_at',
+]
+
+
+def coalesce_events(events):
+    """Return ``{book_id: event}`` keeping the latest event of each book."""
+    now = timezone.now()
+    latest = {}
+    for event in events:
+        # Clock skew must not lock out later events from the same client.
+        event = dict(event, timestamp=min(event['timestamp'], now))
+        current = latest.get(event['book'])
+        if current is None or (event['timestamp'], event['progress']) > (current['timestamp'], current['progress']):
+            latest[event['book']] = event
+    return latest
+
+
+def apply_event(history, event, now):
+    history.progress_percentage = event['progress']
+    history.current_page = event['current_page']
+    if event['progress'] >= 100:
+        history.status = 'completed'
+        history.finished_reading = history.finished_reading or event['timestamp']
+    elif history.status in ('wishlist', 'abandoned'):
+        history.status = 'reading'
+    history.started_reading = history.started_reading or event['timestamp']
+    history.progress_synced_at = event['timestamp']
+    history.updated_at = now
+
+
+def sync_progress(user, events):
+    """Apply progress events for ``user``, returning a summary of the sync."""
+    latest = coalesce_events(events)
+    existing = {
+        history.book_id: history
+        for history in ReadingHistory.objects.filter(user=user, book_id__in=latest)
+    }
+    known_books = set(existing) | set(
+        Book.objects.filter(pk__in=set(latest) - set(existing)).values_list('pk', flat=True)
+    )
+
+    now = timezone.now()
+    updated, created, skipped = [], [], 0
+    for book_id, event in latest.items():
+        history = existing.get(book_id)
+        if history is None:
+            if book_id in known_books:
+                history = ReadingHistory(user=user, book_id=book_id, status='reading')
+                apply_event(history, event, now)
+                created.append(history)
+        elif history.progress_synced_at and history.progress_synced_at >= event['timestamp']:
+            skipped += 1
+        else:
+            apply_event(history, event, now)
+            updated.append(history)
+
+    if updated:
+        ReadingHistory.objects.bulk_update(updated, PROGRESS_FIELDS)
+    if created:
+        # A concurrent request may have created the row in the meantime.
+        ReadingHistory.objects.bulk_create(
+            created, update_conflicts=True, unique_fields=['user', 'book'], update_fields=PROGRESS_FIELDS,
+        )
+    return {
+        'received': len(events),
+        'applied': len(updated) + len(created),
+        'skipped': skipped,
+        'unknown_books': sorted(set(latest) - known_books),
+    }
+
+
+def set_reading_status(user, book, status):
+    """Create or update the reading history entry of ``book`` in a single statement.
+
+    Moving to ``reading`` also records ``started_reading`` the first time,
+    which the trending scores count.
+    """
+    now = timezone.now()
+    started = now if status == 'reading' else None
+    ReadingHistory.objects.bulk_create(
+        [ReadingHistory(user=user, book=book, status=status, started_reading=started)],
+        update_conflicts=True,
+        unique_fields=['user', 'book'],
+        update_fields=['status', 'updated_at'],
+    )
+    if started:
+        ReadingHistory.objects.filter(user=user, book=book, started_reading__isnull=True).update(
+            started_reading=started
+        )
+
+
+def start_reading(user, book):
+    """Mark ``book`` as being read, writing only when the entry is missing or wishlisted."""
+    status = ReadingHistory.objects.filter(user=user, book=book).values_list('status', flat=True).first()
+    now = timezone.now()
+    if status is None:
+        ReadingHistory.objects.bulk_create(
+            [ReadingHistory(user=user, book=book, status='reading', started_reading=now)], ignore_conflicts=True
+        )
+    elif status == 'wishlist':
+        ReadingHistory.objects.filter(user=user, book=book, status='wishlist').update(
+            status='reading', started_reading=Coalesce('started_reading', Value(now)), updated_at=now
+        )
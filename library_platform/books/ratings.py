@@ -0,0 +1,114 @@
+"""
+Incremental rating aggregation for books.
+
+Each book keeps a running ``rating_sum`` and ``total_ratings``; review
+changes apply their delta with a single atomic UPDATE instead of re-reading
+every review. ``reconcile_ratings`` recomputes drifted aggregates in bulk,
+and runs after migrations while some book has fewer rating points than
+ratings, as when ``rating_sum`` was added to books already reviewed.
+"""
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Now, NullIf, Round
+
+RECONCILE_BATCH_SIZE = 2000
+
+
+def average_expression(rating_sum, total_ratings):
+    """SQL expression for the average rating, 0 when there are no ratings."""
+    return Coalesce(
+        Round(Cast(rating_sum, FloatField()) / NullIf(total_ratings, Value(0)), 2),
+        Value(0.0),
+    )
+
+
+def apply_rating_delta(book_id, rating_delta, count_delta):
+    """Atomically add a rating delta to a book's running aggregates."""
+    from .models import Book
+
+    if not rating_delta and not count_delta:
+        return
+    rating_sum = F('rating_sum') + rating_delta
+    total_ratings = F('total_ratings') + count_delta
+    Book.objects.filter(pk=book_id).update(
+        rating_sum=rating_sum,
+        total_ratings=total_ratings,
+        average_rating=average_expression(rating_sum, total_ratings),
+        updated_at=Now(),
+    )
+
+
+def review_created(review):
+    apply_rating_delta(review.book_id, review.rating, 1)
+
+
+def review_updated(review, old_book_id, old_rating):
+    if old_book_id != review.book_id:
+        apply_rating_delta(old_book_id, -old_rating, -1)
+        apply_rating_delta(review.book_id, review.rating, 1)
+    else:
+        apply_rating_delta(review.book_id, review.rating - old_rating, 0)
+
+
+def review_deleted(review):
+    apply_rating_delta(review.book_id, -review.rating, -1)
+
+
+def reconcile_ratings(book_ids=None, batch_size=RECONCILE_BATCH_SIZE):
+    """Recompute aggregates that drifted from the reviews table.
+
+    Books are processed in primary key ranges of ``batch_size``, one UPDATE
+    statement per range that only touches rows whose stored aggregates
+    differ. Returns the number of corrected books.
+    """
+    from .models import Book, Review
+
+    reviews = Review.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    actual_sum = Coalesce(
+        Subquery(reviews.annotate(total=Sum('rating')).values('total')),
+        Value(0), output_field=IntegerField(),
+    )
+    actual_count = Coalesce(
+        Subquery(reviews.annotate(total=Count('pk')).values('total')),
+        Value(0), output_field=IntegerField(),
+    )
+
+    queryset = Book.objects.all()
+    if book_ids is not None:
+        queryset = queryset.filter(pk__in=book_ids)
+    queryset = queryset.order_by('pk')
+
+    corrected = 0
+    last_pk = 0
+    while True:
+        boundary = list(
+            queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[batch_size - 1:batch_size]
+        )
+        upper_pk = boundary[0] if boundary else None
+        batch = queryset.filter(pk__gt=last_pk)
+        if upper_pk is not None:
+            batch = batch.filter(pk__lte=upper_pk)
+        corrected += (
+            batch.annotate(actual_sum=actual_sum, actual_count=actual_count)
+            .filter(~Q(rating_sum=F('actual_sum')) | ~Q(total_ratings=F('actual_count')))
+            .update(
+                rating_sum=actual_sum,
+                total_ratings=actual_count,
+                average_rating=average_expression(actual_sum, actual_count),
+                updated_at=Now(),
+            )
+        )
+        if upper_pk is None:
+            return corrected
+        last_pk = upper_pk
+
+
+def backfill_rating_sums():
+    """Reconcile every book if some ``rating_sum`` was never filled; return the corrected count.
+
+    Ratings are 1 to 5, so a sum below the count is never up to date.
+    """
+    from .models import Book
+
+    if Book.objects.filter(total_ratings__gt=0, rating_sum__lt=F('total_ratings')).exists():
+        return reconcile_ratings()
+    return 0
@@ -0,0 +1,272 @@
+"""
+Item-item collaborative filtering recommendations.
+
+A sparse user x book matrix is built from reading history (status, progress
+and rating) and review ratings. Books are compared by the cosine similarity
+of their columns, computed in chunks of books with sparse products, and
+only the ``NEIGHBOURS`` most similar books of each book are kept. A user's
+candidates are scored by their similarity to the books the user read,
+weighted by how strongly; the best ``RECOMMENDATIONS_PER_USER`` are upserted
+as ``Recommendation`` rows.
+
+The neighbour matrix and the time of the last run are saved to
+``RECOMMENDATIONS_STATE_PATH``. Incremental runs reuse the saved neighbours
+and only rescore users whose history or reviews changed since the previous
+run; a full run recomputes the similarities and every user.
+"""
+import datetime
+import os
+from array import array
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .models import Book, ReadingHistory, Review
+
+NEIGHBOURS = 50
+SIMILARITY_CHUNK = 2000
+USER_CHUNK = 1000
+
+# Interaction strength of a reading history entry per status. Reading
+# entries add up to ``READING_PROGRESS`` more with their progress.
+STATUS_STRENGTH = {
+    'wishlist': 1.0,
+    'reading': 2.0,
+    'completed': 4.0,
+    'abandoned': 0.5,
+}
+READING_PROGRESS = 2.0
+REVIEW_STRENGTH = 2.0
+# Explicit ratings scale the interaction: poorly rated books barely count
+RATING_FACTOR = {1: 0.1, 2: 0.4, 3: 1.0, 4: 1.5, 5: 2.0}
+
+
+def per_user():
+    return getattr(settings, 'RECOMMENDATIONS_PER_USER', 20)
+
+
+def state_path():
+    return getattr(settings, 'RECOMMENDATIONS_STATE_PATH', settings.BASE_DIR / 'var' / 'recommender.npz')
+
+
+def interaction_strength(status, progress, rating):
+    strength = STATUS_STRENGTH.get(status, 1.0)
+    if status == 'reading':
+        strength += READING_PROGRESS * min(progress or 0, 100) / 100
+    return strength * RATING_FACTOR.get(rating, 1.0)
+
+
+def build_matrix():
+    """Return ``(matrix, user_ids, book_ids)``, the matrix indexed like the two id arrays."""
+    users, books, values = array('q'), array('q'), array('f')
+    history = ReadingHistory.objects.values_list('user_id', 'book_id', 'status', 'progress_percentage', 'rating')
+    for user_id, book_id, status, progress, rating in history.iterator(chunk_size=10000):
+        users.append(user_id)
+        books.append(book_id)
+        values.append(interaction_strength(status, progress, rating))
+    reviews = Review.objects.filter(is_approved=True).values_list('user_id', 'book_id', 'rating')
+    for user_id, book_id, rating in reviews.iterator(chunk_size=10000):
+        users.append(user_id)
+        books.append(book_id)
+        values.append(REVIEW_STRENGTH * RATING_FACTOR.get(rating, 1.0))
+
+    user_ids, rows = np.unique(np.frombuffer(users, dtype=np.int64), return_inverse=True)
+    book_ids, columns = np.unique(np.frombuffer(books, dtype=np.int64), return_inverse=True)
+    # Duplicate (user, book) entries, from history and a review, add up
+    matrix = sparse.csr_matrix(
+        (np.frombuffer(values, dtype=np.float32), (rows, columns)),
+        shape=(len(user_ids), len(book_ids)),
+    )
+    matrix.sum_duplicates()
+    return matrix, user_ids, book_ids
+
+
+def item_neighbours(matrix, neighbours=NEIGHBOURS, chunk_size=SIMILARITY_CHUNK):
+    """Return the book x book cosine similarities, keeping the top ``neighbours`` per column.
+
+    ``result[i, j]`` is the similarity of book ``i`` to book ``j`` when ``i``
+    is one of the nearest neighbours of ``j``.
+    """
+    columns = matrix.tocsc()
+    norms = np.sqrt(np.asarray(columns.multiply(columns).sum(axis=0)).ravel())
+    norms[norms == 0] = 1
+    normalized = (columns @ sparse.diags(1 / norms)).tocsc()
+    transposed = normalized.T.tocsr()
+
+    rows, cols, data = [], [], []
+    books = matrix.shape[1]
+    for start in range(0, books, chunk_size):
+        similarities = (transposed @ normalized[:, start:start + chunk_size]).tocsc()
+        for offset in range(similarities.shape[1]):
+            column = start + offset
+            low, high = similarities.indptr[offset], similarities.indptr[offset + 1]
+            indices, values = similarities.indices[low:high], similarities.data[low:high]
+            keep = indices != column
+            indices, values = indices[keep], values[keep]
+            if len(values) > neighbours:
+                top = np.argpartition(-values, neighbours)[:neighbours]
+                indices, values = indices[top], values[top]
+            rows.append(indices)
+            cols.append(np.full(len(indices), column, dtype=np.int32))
+            data.append(values)
+    if not data:
+        return sparse.csr_matrix((books, books), dtype=np.float32)
+    return sparse.csr_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(books, books),
+    )
+
+
+def reindex(neighbours, old_book_ids, book_ids):
+    """Map a saved neighbour matrix onto the current book ids (new books have no neighbours)."""
+    if np.array_equal(old_book_ids, book_ids):
+        return neighbours
+    positions = np.searchsorted(book_ids, old_book_ids)
+    positions[positions >= len(book_ids)] = 0
+    present = book_ids[positions] == old_book_ids
+    mapping = np.where(present, positions, -1)
+    entries = neighbours.tocoo()
+    rows, cols = mapping[entries.row], mapping[entries.col]
+    keep = (rows >= 0) & (cols >= 0)
+    return sparse.csr_matrix(
+        (entries.data[keep], (rows[keep], cols[keep])), shape=(len(book_ids), len(book_ids)),
+    )
+
+
+def load_state():
+    try:
+        with np.load(state_path()) as saved:
+            neighbours = sparse.csr_matrix(
+                (saved['data'], saved['indices'], saved['indptr']), shape=tuple(saved['shape'])
+            )
+            return neighbours, saved['book_ids'], float(saved['updated_at'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save_state(neighbours, book_ids, updated_at):
+    path = state_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write beside and rename, so a crash never leaves a truncated state
+    temporary = f'{path}.tmp.npz'
+    np.savez(
+        temporary, data=neighbours.data, indices=neighbours.indices, indptr=neighbours.indptr,
+        shape=np.array(neighbours.shape), book_ids=book_ids, updated_at=updated_at,
+    )
+    os.replace(temporary, path)
+
+
+def score_users(matrix, neighbours, rows, candidates, limit):
+    """Yield ``(row, [(column, confidence, because_column), ...])`` for the matrix ``rows``.
+
+    The confidence is the average similarity of the book to the user's
+    books, weighted by interaction strength, as a percentage.
+    """
+    interactions = matrix[rows]
+    scores = (interactions @ neighbours).tocsr()
+    totals = np.asarray(interactions.sum(axis=1)).ravel()
+    for position, row in enumerate(rows):
+        low, high = scores.indptr[position], scores.indptr[position + 1]
+        columns, values = scores.indices[low:high], scores.data[low:high]
+        seen = interactions.indices[interactions.indptr[position]:interactions.indptr[position + 1]]
+        keep = candidates[columns] & ~np.isin(columns, seen)
+        columns, values = columns[keep], values[keep]
+        if not len(columns) or not totals[position]:
+            yield row, []
+            continue
+        if len(columns) > limit:
+            top = np.argpartition(-values, limit)[:limit]
+            columns, values = columns[top], values[top]
+        order = np.argsort(-values, kind='stable')
+        columns, values = columns[order], values[order]
+        # The read book contributing most to each recommendation explains it
+        weights = interactions.data[interactions.indptr[position]:interactions.indptr[position + 1]]
+        contributions = neighbours[seen][:, columns].toarray() * weights[:, None]
+        because = seen[contributions.argmax(axis=0)]
+        confidences = np.minimum(values / totals[position], 1.0) * 100
+        yield row, list(zip(columns.tolist(), confidences.tolist(), because.tolist()))
+
+
+def write_recommendations(results, titles):
+    """Upsert the recommendations of a chunk of users and deactivate their stale ones.
+
+    ``results`` maps user ids to ``[(book_id, confidence, because_book_id), ...]``.
+    """
+    from recommendations.models import Recommendation
+
+    existing = {
+        (user_id, book_id): pk
+        for pk, user_id, book_id in Recommendation.objects.filter(user_id__in=results)
+        .values_list('pk', 'user_id', 'book_id')
+    }
+    to_create, to_update, current = [], [], set()
+    for user_id, entries in results.items():
+        for book_id, confidence, because_id in entries:
+            recommendation = Recommendation(
+                pk=existing.get((user_id, book_id)),
+                user_id=user_id,
+                book_id=book_id,
+                confidence_score=round(confidence, 2),
+                reason=_('Because you read "%(title)s"') % {'title': titles.get(because_id, '')},
+                is_active=True,
+            )
+            if recommendation.pk is None:
+                to_create.append(recommendation)
+            else:
+                current.add(recommendation.pk)
+                to_update.append(recommendation)
+    stale = [pk for pk in existing.values() if pk not in current]
+    with transaction.atomic():
+        Recommendation.objects.bulk_update(to_update, ['confidence_score', 'reason', 'is_active'], batch_size=1000)
+        Recommendation.objects.bulk_create(to_create, batch_size=1000)
+        Recommendation.objects.filter(pk__in=stale, is_active=True).update(is_active=False)
+    return len(to_create) + len(to_update)
+
+
+def changed_users(since):
+    """Return the ids of users whose reading history or reviews changed after ``since``."""
+    users = set(ReadingHistory.objects.filter(updated_at__gt=since).values_list('user_id', flat=True))
+    users.update(Review.objects.filter(updated_at__gt=since).values_list('user_id', flat=True))
+    return users
+
+
+def compute_recommendations(incremental=True, limit=None):
+    """Refresh recommendations and return the number of users processed.
+
+    Without a saved state, incremental runs fall back to a full run.
+    """
+    started = timezone.now()
+    limit = limit or per_user()
+    matrix, user_ids, book_ids = build_matrix()
+    state = load_state() if incremental else None
+
+    if state is None:
+        neighbours = item_neighbours(matrix)
+        rows = np.arange(len(user_ids))
+    else:
+        saved, saved_book_ids, updated_at = state
+        neighbours = reindex(saved, saved_book_ids, book_ids)
+        since = datetime.datetime.fromtimestamp(updated_at, tz=datetime.timezone.utc)
+        changed = np.fromiter(changed_users(since), dtype=np.int64)
+        rows = np.flatnonzero(np.isin(user_ids, changed))
+
+    available = set(Book.objects.filter(status='available').values_list('pk', flat=True))
+    candidates = np.fromiter((book_id in available for book_id in book_ids.tolist()), dtype=bool, count=len(book_ids))
+
+    for start in range(0, len(rows), USER_CHUNK):
+        results = {
+            int(user_ids[row]): [
+                (int(book_ids[column]), confidence, int(book_ids[because]))
+                for column, confidence, because in entries
+            ]
+            for row, entries in score_users(matrix, neighbours, rows[start:start + USER_CHUNK], candidates, limit)
+        }
+        because_ids = {entry[2] for entries in results.values() for entry in entries}
+        titles = dict(Book.objects.filter(pk__in=because_ids).values_list('pk', 'title'))
+        write_recommendations(results, titles)
+
+    save_state(neighbours, book_ids, started.timestamp())
+    return len(rows)
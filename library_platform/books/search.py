@@ -0,0 +1,241 @@
+"""
+Full-text search engine for books.
+
+Books are indexed into an inverted index (SQLite FTS5 by default) that is
+kept in sync from model signals. The backend is pluggable through the
+``BOOKS_SEARCH_BACKEND`` setting so deployments on another database can
+fall back to plain ``icontains`` matching or provide their own engine.
+"""
+import html
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.html import strip_tags
+from django.utils.module_loading import import_string
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+DEFAULT_MAX_RESULTS = 1000
+
+
+def max_results():
+    return getattr(settings, 'BOOKS_SEARCH_MAX_RESULTS', DEFAULT_MAX_RESULTS)
+
+
+def html_to_text(value):
+    """Return the plain text content of an HTML fragment."""
+    if not value:
+        return ''
+    text = html.unescape(strip_tags(value))
+    return ' '.join(text.split())
+
+
+def tokenize(query):
+    """Split a user query into search terms."""
+    return TOKEN_RE.findall(query or '')
+
+
+def rank_queryset(queryset, pks):
+    """Restrict ``queryset`` to ``pks``, ordered like the list (``search_rank`` annotation)."""
+    if not pks:
+        return queryset.none()
+    ranking = Case(
+        *[When(pk=pk, then=Value(position)) for position, pk in enumerate(pks)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(pk__in=pks).annotate(search_rank=ranking).order_by('search_rank')
+
+
+def first_matches(queryset, batches, limit):
+    """Return the first ``limit`` ids of ``batches`` (ranked id lists) that ``queryset`` contains.
+
+    Batches are read until enough of their ids pass the filters of
+    ``queryset``, so narrow filters are not starved by a cap on the matches.
+    """
+    pks = []
+    candidates = queryset.order_by().prefetch_related(None)
+    for batch in batches:
+        kept = set(candidates.filter(pk__in=batch).values_list('pk', flat=True))
+        pks.extend(pk for pk in batch if pk in kept)
+        if len(pks) >= limit:
+            break
+    return pks[:limit]
+
+
+def book_document(book):
+    """Build the searchable document for a book."""
+    return {
+        'title': book.title,
+        'subtitle': book.subtitle,
+        'authors': ' '.join(author.get_full_name() for author in book.authors.all()),
+        'description': html_to_text(book.description),
+        'tags': ' '.join(tag.name for tag in book.tags.all()),
+    }
+
+
+class BaseSearchBackend:
+    """Interface implemented by search backends."""
+
+    def setup(self):
+        """Create the index structures if they do not exist yet."""
+
+    def index_books(self, books):
+        """Add or refresh the given books in the index."""
+        raise NotImplementedError
+
+    def remove_books(self, book_ids):
+        """Drop the given book ids from the index."""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove every document from the index."""
+        raise NotImplementedError
+
+    def search(self, query, limit=None, offset=0):
+        """Return book ids matching ``query``, best match first."""
+        raise NotImplementedError
+
+    def batches(self, query, size):
+        offset = 0
+        while True:
+            batch = self.search(query, size, offset)
+            if batch:
+                yield batch
+            if len(batch) < size:
+                return
+            offset += size
+
+    def filter_queryset(self, queryset, query):
+        """Restrict ``queryset`` to the best matches of ``query`` it contains, ordered by relevance."""
+        limit = max_results()
+        return rank_queryset(queryset, first_matches(queryset, self.batches(query, limit), limit))
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Fallback backend matching with ``icontains`` lookups, without an index."""
+
+    def index_books(self, books):
+        pass
+
+    def remove_books(self, book_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, limit=None, offset=0):
+        from .models import Book
+
+        condition = Q()
+        for term in tokenize(query):
+            condition &= (
+                Q(title__icontains=term) |
+                Q(authors__first_name__icontains=term) |
+                Q(authors__last_name__icontains=term) |
+                Q(description__icontains=term)
+            )
+        limit = limit or max_results()
+        matches = Book.objects.filter(condition).values_list('pk', flat=True).distinct().order_by('pk')
+        return list(matches[offset:offset + limit])
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Inverted index stored in an SQLite FTS5 virtual table, ranked with BM25."""
+
+    table = 'books_book_fts'
+    columns = ['title', 'subtitle', 'authors', 'description', 'tags']
+    # BM25 weights, in the same order as ``columns``.
+    weights = [10.0, 4.0, 6.0, 1.0, 2.0]
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                f"{', '.join(self.columns)}, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def index_books(self, books):
+        rows = []
+        for book in books:
+            document = book_document(book)
+            rows.append([book.pk] + [document[column] for column in self.columns])
+        if not rows:
+            return
+        placeholders = ', '.join(['%s'] * (len(self.columns) + 1))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s", [[row[0]] for row in rows]
+            )
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, {', '.join(self.columns)}) "
+                f"VALUES ({placeholders})",
+                rows,
+            )
+
+    def remove_books(self, book_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s", [[pk] for pk in book_ids]
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def build_match_expression(self, query):
+        """Quote every term and allow prefix matching on the last one."""
+        terms = ['"%s"' % term.replace('"', '""') for term in tokenize(query)]
+        if not terms:
+            return ''
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def search(self, query, limit=None, offset=0):
+        expression = self.build_match_expression(query)
+        if not expression:
+            return []
+        limit = limit or max_results()
+        weights = ', '.join(str(weight) for weight in self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY bm25({self.table}, {weights}), rowid LIMIT %s OFFSET %s",
+                [expression, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+def get_search_backend():
+    """Return the configured search backend instance."""
+    path = getattr(settings, 'BOOKS_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return DatabaseSearchBackend()
+
+
+def search_books(queryset, query):
+    """Filter a Book queryset with the search engine, best matches first."""
+    return get_search_backend().filter_queryset(queryset, query)
+
+
+def rebuild_index(batch_size=500):
+    """Reindex every book, returning the number of indexed books."""
+    from .models import Book
+
+    backend = get_search_backend()
+    backend.setup()
+    backend.clear()
+    total = 0
+    last_pk = 0
+    queryset = Book.objects.order_by('pk').prefetch_related('authors', 'tags')
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return total
+        backend.index_books(batch)
+        total += len(batch)
+        last_pk = batch[-1].pk
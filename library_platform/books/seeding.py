@@ -0,0 +1,387 @@
+"""
+Fast synthetic data for load and scale testing.
+
+Rows are built in memory and written with ``bulk_create`` in batches, one
+transaction per batch, so no model signals run. Every batch ("chunk") is
+generated from its own random stream derived from the seed, the table and
+the chunk number, and primary keys are assigned explicitly, so the same
+seed and sizes produce the same rows whether chunks run in one process or
+are spread over a pool of workers.
+
+Distributions are meant to look like a real catalog:
+
+- book popularity follows a Zipf law: a few books get most reviews,
+  reading history entries, collection entries and views;
+- most books have one author, some two or three, and prolific authors
+  write many books;
+- the number of reviews and books read per user is heavy-tailed.
+
+Generated rows are appended after the existing ones. Rating aggregates,
+weighted ratings and facet counts are refreshed at the end; the search
+and trigram indexes only on request, since indexing a large catalog takes
+a while.
+"""
+import datetime
+import math
+import multiprocessing
+import random
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from taggit.models import Tag, TaggedItem
+
+from . import facets
+from .autocomplete import set_normalized_names
+from .models import Author, Book, BookCollection, Genre, ReadingHistory, Review
+from .popularity import update_bayesian_ratings
+from .ratings import reconcile_ratings
+from .fuzzy import rebuild_trigrams
+from .search import rebuild_index
+
+BATCH_SIZE = 5000
+# Exponent of the popularity law; around 1 for book sales and loans
+ZIPF_EXPONENT = 1.0
+
+WORDS = (
+    'night river garden empire shadow glass winter city letters silence '
+    'ocean memory forest storm crown voyage stranger island mirror fire '
+    'house journey secret light war children stone dream road summer'
+).split()
+FIRST_NAMES = (
+    'Anna Louis Marie Jules Claire Victor Emma Hugo Alice Paul Sofia Marc '
+    'Lucia Pedro Greta Hans Elena Marco Ines Tomas'
+).split()
+LAST_NAMES = (
+    'Martin Bernard Dubois Garcia Rossi Muller Smith Moreau Laurent Lopez '
+    'Fischer Ricci Brown Weber Leroy Romano Novak Silva Costa Blanc'
+).split()
+
+# Order of generation: later tables reference the earlier ones
+TABLES = ('genres', 'tags', 'authors', 'users', 'books', 'reviews', 'reading_history', 'collections')
+
+
+def default_sizes(books):
+    """Return the row counts generated alongside ``books`` books."""
+    return {
+        'genres': 60,
+        'tags': 300,
+        'authors': max(books // 4, 10),
+        'users': max(books // 5, 50),
+        'books': books,
+        'reviews': books * 3,
+        'reading_history': books * 5,
+        'collections': max(books // 20, 5),
+    }
+
+
+def words(rng, low, high):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+def title(rng):
+    return words(rng, 1, 4).capitalize()
+
+
+class ZipfSampler:
+    """Draw ids from ``[offset, offset + n)`` with Zipf-distributed popularity.
+
+    Ranks are spread over the id range by a fixed permutation, so popular
+    rows are not simply the oldest ones.
+    """
+
+    def __init__(self, offset, n, exponent=ZIPF_EXPONENT):
+        self.offset, self.n = offset, n
+        self.cum_weights = list(accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+        self.stride = next(
+            stride for stride in range(int(n * 0.618) | 1, 2 * n + 2) if math.gcd(stride, n) == 1
+        )
+        self.inverse = pow(self.stride, -1, n) if n > 1 else 0
+        self.ranks = range(n)
+
+    def id_for_rank(self, rank):
+        return self.offset + rank * self.stride % self.n
+
+    def rank_of(self, pk):
+        return (pk - self.offset) * self.inverse % self.n
+
+    def choice(self, rng):
+        return self.id_for_rank(rng.choices(self.ranks, cum_weights=self.cum_weights)[0])
+
+    def sample(self, rng, k):
+        """Return ``k`` distinct ids, popular ones more likely."""
+        k = min(k, self.n)
+        chosen = set()
+        draws = 0
+        while len(chosen) < k and draws < 20 * k:
+            ranks = rng.choices(self.ranks, cum_weights=self.cum_weights, k=k - len(chosen))
+            chosen.update(self.id_for_rank(rank) for rank in ranks)
+            draws += len(ranks)
+        if len(chosen) < k:
+            # Asking for most of a small range: the tail would take ages to draw
+            rest = [pk for pk in range(self.offset, self.offset + self.n) if pk not in chosen]
+            chosen.update(rng.sample(rest, k - len(chosen)))
+        return sorted(chosen)
+
+
+_samplers = {}
+
+
+def sampler(plan, table):
+    """Return the (per process) cached sampler over the ids of ``table``."""
+    key = (table, plan['start'][table], plan['sizes'][table])
+    if key not in _samplers:
+        _samplers[key] = ZipfSampler(plan['start'][table], plan['sizes'][table])
+    return _samplers[key]
+
+
+def per_user(rng, mean):
+    """Heavy-tailed number of rows for one user, ``mean`` on average."""
+    return int(rng.expovariate(1 / mean)) if mean else 0
+
+
+def genre_rows(plan, rng, pks):
+    return {Genre: [set_normalized_names(Genre(pk=pk, name=f'{title(rng)} {pk}')) for pk in pks]}
+
+
+def tag_rows(plan, rng, pks):
+    return {Tag: [Tag(pk=pk, name=f'tag-{pk}', slug=f'tag-{pk}') for pk in pks]}
+
+
+def author_rows(plan, rng, pks):
+    return {Author: [
+        set_normalized_names(Author(
+            pk=pk,
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            bio=words(rng, 10, 40),
+            nationality=rng.choice(('French', 'English', 'Spanish', 'German', 'Italian')),
+        ))
+        for pk in pks
+    ]}
+
+
+def user_rows(plan, rng, pks):
+    User = get_user_model()
+    # Unusable password: hashing one per user would dominate the run
+    return {User: [User(pk=pk, username=f'user{pk}', email=f'user{pk}@example.com', password='!') for pk in pks]}
+
+
+def book_rows(plan, rng, pks):
+    books, authors, genres, tags = [], [], [], []
+    popularity = sampler(plan, 'books')
+    author_sampler, genre_sampler, tag_sampler = (sampler(plan, table) for table in ('authors', 'genres', 'tags'))
+    languages = [code for code, label in Book.LANGUAGE_CHOICES]
+    book_type = ContentType.objects.get_for_model(Book)
+    for pk in pks:
+        # Views follow popularity: the top book is seen most, then roughly 1/rank
+        views = int(200_000 / (popularity.rank_of(pk) + 1) ** ZIPF_EXPONENT * rng.uniform(0.5, 1.5))
+        books.append(Book(
+            pk=pk,
+            title=title(rng),
+            description=words(rng, 40, 120),
+            isbn=f'979{pk:010d}',
+            language=rng.choices(languages, weights=(40, 30, 12, 10, 8))[0],
+            pages=rng.randint(60, 900),
+            publication_date=datetime.date(min(2025, int(rng.triangular(1900, 2026, 2020))), rng.randint(1, 12), 1),
+            status=rng.choices(('available', 'unavailable', 'coming_soon'), weights=(94, 4, 2))[0],
+            is_featured=rng.random() < 0.005,
+            is_new=rng.random() < 0.02,
+            view_count=views,
+            download_count=views // rng.randint(5, 20),
+            cover_image='',
+        ))
+        count = rng.choices((1, 2, 3, 4), weights=(75, 18, 5, 2))[0]
+        authors.extend(Book.authors.through(book_id=pk, author_id=author_id)
+                       for author_id in author_sampler.sample(rng, count))
+        genres.extend(Book.genres.through(book_id=pk, genre_id=genre_id)
+                      for genre_id in genre_sampler.sample(rng, rng.choices((1, 2, 3), weights=(60, 30, 10))[0]))
+        tags.extend(TaggedItem(content_type=book_type, object_id=pk, tag_id=tag_id)
+                    for tag_id in tag_sampler.sample(rng, rng.randint(0, 5)))
+    return {Book: books, Book.authors.through: authors, Book.genres.through: genres, TaggedItem: tags}
+
+
+def review_rows(plan, rng, pks):
+    # Chunks of this table cover users, so (user, book) pairs never collide
+    books = sampler(plan, 'books')
+    mean = plan['sizes']['reviews'] / plan['sizes']['users']
+    return {Review: [
+        Review(
+            user_id=user_id,
+            book_id=book_id,
+            title=title(rng),
+            content=words(rng, 20, 150),
+            rating=rng.choices((1, 2, 3, 4, 5), weights=(5, 8, 20, 37, 30))[0],
+            helpful_votes=int(rng.paretovariate(2)) - 1,
+        )
+        for user_id in pks
+        for book_id in books.sample(rng, per_user(rng, mean))
+    ]}
+
+
+def reading_history_rows(plan, rng, pks):
+    books = sampler(plan, 'books')
+    mean = plan['sizes']['reading_history'] / plan['sizes']['users']
+    now = timezone.now()
+    rows = []
+    for user_id in pks:
+        for book_id in books.sample(rng, per_user(rng, mean)):
+            status = rng.choices(('wishlist', 'reading', 'completed', 'abandoned'), weights=(30, 20, 40, 10))[0]
+            started = None if status == 'wishlist' else now - datetime.timedelta(days=rng.uniform(0, 730))
+            progress = {'wishlist': 0, 'completed': 100}.get(status) or rng.randint(1, 99)
+            rows.append(ReadingHistory(
+                user_id=user_id,
+                book_id=book_id,
+                status=status,
+                progress_percentage=progress,
+                rating=rng.randint(1, 5) if status == 'completed' and rng.random() < 0.5 else None,
+                started_reading=started,
+                finished_reading=started + datetime.timedelta(days=rng.uniform(1, 60))
+                if status == 'completed' else None,
+            ))
+    return {ReadingHistory: rows}
+
+
+def collection_rows(plan, rng, pks):
+    users, books = sampler(plan, 'users'), sampler(plan, 'books')
+    collections, entries = [], []
+    for pk in pks:
+        collections.append(BookCollection(
+            pk=pk,
+            user_id=users.choice(rng),
+            name=title(rng),
+            visibility=rng.choices(('private', 'public', 'friends'), weights=(50, 40, 10))[0],
+        ))
+        entries.extend(BookCollection.books.through(bookcollection_id=pk, book_id=book_id)
+                       for book_id in books.sample(rng, rng.randint(1, 30)))
+    return {BookCollection: collections, BookCollection.books.through: entries}
+
+
+BUILDERS = {
+    'genres': genre_rows,
+    'tags': tag_rows,
+    'authors': author_rows,
+    'users': user_rows,
+    'books': book_rows,
+    'reviews': review_rows,
+    'reading_history': reading_history_rows,
+    'collections': collection_rows,
+}
+
+# Tables whose chunks are ranges of user ids rather than rows of their own
+USER_CHUNKED = ('reviews', 'reading_history')
+# Tables other rows point to
+REFERENCED = ('genres', 'tags', 'authors', 'users', 'books')
+
+
+def table_model(table):
+    return {
+        'genres': Genre, 'tags': Tag, 'authors': Author, 'users': get_user_model(), 'books': Book,
+        'reviews': Review, 'reading_history': ReadingHistory, 'collections': BookCollection,
+    }[table]
+
+
+def make_plan(sizes, seed, tables=TABLES):
+    """Fix the primary key range of every table.
+
+    Generated rows come after the existing ones; tables that are not
+    generated but referenced by generated rows are sampled from their
+    existing rows.
+    """
+    sizes = dict(sizes)
+    start = {}
+    for table in TABLES:
+        if table in USER_CHUNKED:
+            continue
+        model = table_model(table)
+        if table in tables:
+            start[table] = (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        elif table in REFERENCED:
+            bounds = model.objects.aggregate(first=Min('pk'), last=Max('pk'), count=Count('pk'))
+            if bounds['count'] and bounds['last'] - bounds['first'] + 1 != bounds['count']:
+                raise ValueError(f'Existing {table} do not have contiguous ids, generate them too.')
+            start[table], sizes[table] = bounds['first'] or 1, bounds['count']
+    return {'sizes': sizes, 'seed': seed, 'start': start}
+
+
+def chunks(plan, table, batch_size):
+    if table in USER_CHUNKED:
+        first, total = plan['start']['users'], plan['sizes']['users']
+    else:
+        first, total = plan['start'][table], plan['sizes'][table]
+    for index, offset in enumerate(range(0, total, batch_size)):
+        yield table, index, range(first + offset, first + min(offset + batch_size, total))
+
+
+def write_chunk(plan, table, index, pks):
+    """Generate and insert one chunk in its own transaction; return the rows written per model."""
+    rng = random.Random(f'{plan["seed"]}:{table}:{index}')
+    rows = BUILDERS[table](plan, rng, pks)
+    with transaction.atomic():
+        for model, objects in rows.items():
+            model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    return table, {model._meta.label: len(objects) for model, objects in rows.items()}
+
+
+def _write_chunk(args):
+    return write_chunk(*args)
+
+
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+def reset_sequences(tables):
+    models = [table_model(table) for table in tables if table not in USER_CHUNKED]
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def seed(sizes, seed=0, batch_size=BATCH_SIZE, workers=1, tables=TABLES, index=False, progress=None):
+    """Generate ``sizes`` rows per table (see :func:`default_sizes`).
+
+    ``reviews`` and ``reading_history`` sizes are averages: each user gets a
+    random, heavy-tailed share. Chunks of a table run on ``workers``
+    processes; tables are still generated one after the other. Returns the
+    number of rows written per model.
+    """
+    plan = make_plan(sizes, seed, tables)
+    written = {}
+    pool = None
+    # SQLite serializes writers: parallel transactions would only wait on each other's locks
+    if workers > 1 and connection.vendor != 'sqlite':
+        # Children must open their own database connections
+        connections.close_all()
+        pool = multiprocessing.Pool(workers, initializer=_init_worker)
+    try:
+        for table in TABLES:
+            if table not in tables or not sizes.get(table):
+                continue
+            jobs = [(plan, *chunk) for chunk in chunks(plan, table, batch_size)]
+            results = pool.imap_unordered(_write_chunk, jobs) if pool else map(_write_chunk, jobs)
+            for _, counts in results:
+                for label, count in counts.items():
+                    written[label] = written.get(label, 0) + count
+                if progress:
+                    progress(table, written)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    reset_sequences(tables)
+    if 'reviews' in tables:
+        reconcile_ratings()
+    update_bayesian_ratings()
+    facets.invalidate()
+    if index:
+        rebuild_index()
+        rebuild_trigrams()
+    return written
@@ -1,11 +1,153 @@
 """
 Serializers for books app.
 """
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
 from rest_framework import serializers
+from taggit.managers import TaggableManager
+from taggit.serializers import TagListSerializerField, TaggitSerializer
 from .models import Book, Genre, Author, Review, ReadingHistory, BookCollection
+from .thumbnails import FORMATS as IMAGE_FORMATS
 
 
-class GenreSerializer(serializers.ModelSerializer):
+class SparseFieldsetsMixin:
+    """Serializer mixin honouring the ``?fields=`` and ``?expand=`` query parameters.
+    
+    ``?fields=id,title`` restricts the top-level fields of the representation.
+    ``?expand=authors`` swaps a field for the richer serializer declared in
+    ``Meta.expandable_fields`` as ``{name: (serializer_class, kwargs)}``.
+    Serializer method fields declare the model paths they read in
+    ``Meta.field_sources`` so querysets can be shaped to match (see
+    :func:`shape_queryset`).
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self._context.get('request') if hasattr(self, '_context') else None
+        if request is None:
+            return
+        params = getattr(request, 'query_params', request.GET)
+        
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name in split_param(params.get('expand')):
+            if name in expandable and name in self.fields:
+                serializer_class, options = expandable[name]
+                self.fields[name] = serializer_class(**options)
+        
+        requested = split_param(params.get('fields'))
+        if requested:
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+
+
+def split_param(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+class QueryShape:
+    """Columns and relations a serializer reads from its model."""
+    
+    def __init__(self, model):
+        self.model = model
+        self.columns = {'pk'}
+        self.complete = True
+        self.related = {}
+        self.prefetched = {}
+    
+    def add_path(self, path):
+        """Record a dotted attribute path such as ``book.title``; return the relation's shape."""
+        name, _, rest = path.partition('.')
+        try:
+            field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            self.complete = False
+            return None
+        if not field.is_relation:
+            self.columns.add(name)
+            return None
+        if field.many_to_many or field.one_to_many:
+            shape = self.prefetched.setdefault(name, QueryShape(field.related_model))
+            if field.one_to_many:
+                # The prefetch joins back on the reverse foreign key
+                shape.columns.add(field.field.name)
+            # Managers such as taggit's cannot take a trimmed prefetch queryset
+            if isinstance(field, TaggableManager):
+                shape.complete = False
+        else:
+            self.columns.add(name)
+            shape = self.related.setdefault(name, QueryShape(field.related_model))
+        if rest:
+            shape.add_path(rest)
+        return shape
+    
+    def add_serializer(self, serializer):
+        sources = getattr(getattr(serializer, 'Meta', None), 'field_sources', {})
+        for name, field in serializer.fields.items():
+            if name in sources:
+                for path in sources[name]:
+                    self.add_path(path)
+            elif field.source == '*':
+                self.complete = False
+            else:
+                shape = self.add_path(field.source)
+                child = getattr(field, 'child', field)
+                if shape is not None and isinstance(child, serializers.BaseSerializer):
+                    shape.add_serializer(child)
+    
+    def only_paths(self, prefix=''):
+        paths = [prefix + column for column in self.columns if column != 'pk']
+        paths.append(prefix + self.model._meta.pk.name)
+        for name, shape in self.related.items():
+            if shape.columns != {'pk'}:
+                paths.extend(shape.only_paths(f'{prefix}{name}__'))
+        return paths
+    
+    def apply(self, queryset):
+        if self.complete and all(shape.complete for shape in self.related.values()):
+            queryset = queryset.only(*self.only_paths())
+        # Plain foreign keys rendered as ids need no join
+        joined = [name for name, shape in self.related.items() if shape.columns != {'pk'}]
+        if joined:
+            queryset = queryset.select_related(*joined)
+        # Prefetches of a loading profile give way to the serializer's own
+        lookups = [
+            lookup for lookup in queryset._prefetch_related_lookups
+            if getattr(lookup, 'prefetch_to', lookup).split('__')[0] not in self.prefetched
+        ]
+        if len(lookups) < len(queryset._prefetch_related_lookups):
+            queryset = queryset.prefetch_related(None).prefetch_related(*lookups)
+        for name, shape in self.prefetched.items():
+            if shape.complete:
+                related = shape.apply(shape.model._default_manager.all())
+                queryset = queryset.prefetch_related(Prefetch(name, queryset=related))
+            else:
+                queryset = queryset.prefetch_related(name)
+        return queryset
+
+
+def shape_queryset(queryset, serializer):
+    """Trim ``queryset`` with ``only()`` and prefetches to what ``serializer`` renders."""
+    shape = QueryShape(queryset.model)
+    shape.add_serializer(serializer)
+    return shape.apply(queryset)
+
+
+def image_derivatives(image, derivatives, request=None):
+    """Represent the resized versions of an image, or ``None`` until they are generated."""
+    if not image or not derivatives or derivatives.get('source') != image.name:
+        return None
+    
+    def url(name):
+        url = image.storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    
+    data = {key: derivatives[key] for key in ('width', 'height', 'placeholder')}
+    for key in IMAGE_FORMATS:
+        data[key] = [{'width': width, 'url': url(name)} for width, name in derivatives[key]]
+    return data
+
+
+class GenreSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """Serializer for Genre model."""
     
     class Meta:
@@ -13,46 +155,121 @@ class GenreSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'color']
 
 
-class AuthorSerializer(serializers.ModelSerializer):
+class AuthorSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """Serializer for Author model."""
     
     full_name = serializers.SerializerMethodField()
+    photo_sizes = serializers.SerializerMethodField()
     
     class Meta:
         model = Author
         fields = [
             'id', 'first_name', 'last_name', 'full_name', 'bio',
-            'birth_date', 'death_date', 'nationality', 'photo', 'website'
+            'birth_date', 'death_date', 'nationality', 'photo', 'photo_sizes', 'website'
         ]
+        field_sources = {
+            'full_name': ['first_name', 'last_name'],
+            'photo_sizes': ['photo', 'photo_derivatives'],
+        }
+    
+    def get_full_name(self, obj):
+        return obj.get_full_name()
+    
+    def get_photo_sizes(self, obj):
+        return image_derivatives(obj.photo, obj.photo_derivatives, self.context.get('request'))
+
+
+class GenreSummarySerializer(serializers.ModelSerializer):
+    """Compact Genre representation for book lists."""
+    
+    class Meta:
+        model = Genre
+        fields = ['id', 'name', 'color']
+
+
+class AuthorSummarySerializer(serializers.ModelSerializer):
+    """Compact Author representation for book lists."""
+    
+    full_name = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Author
+        fields = ['id', 'full_name']
+        field_sources = {'full_name': ['first_name', 'last_name']}
     
     def get_full_name(self, obj):
         return obj.get_full_name()
 
 
-class BookSerializer(serializers.ModelSerializer):
+BOOK_FIELD_SOURCES = {
+    'authors_display': ['authors.first_name', 'authors.last_name'],
+    'genres_display': ['genres.name'],
+    'has_audio': ['audio_file'],
+    'has_ebook': ['pdf_file', 'epub_file'],
+    'cover_sizes': ['cover_image', 'cover_derivatives'],
+}
+
+
+class BookListSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    """Lightweight Book representation used by list endpoints."""
+    
+    authors = AuthorSummarySerializer(many=True, read_only=True)
+    genres = GenreSummarySerializer(many=True, read_only=True)
+    has_audio = serializers.SerializerMethodField()
+    has_ebook = serializers.SerializerMethodField()
+    cover_sizes = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Book
+        fields = [
+            'id', 'title', 'subtitle', 'authors', 'genres', 'language',
+            'cover_image', 'cover_sizes', 'publication_date', 'status', 'is_featured', 'is_new',
+            'average_rating', 'total_ratings', 'has_audio', 'has_ebook'
+        ]
+        read_only_fields = fields
+        field_sources = BOOK_FIELD_SOURCES
+        expandable_fields = {
+            'authors': (AuthorSerializer, {'many': True, 'read_only': True}),
+            'genres': (GenreSerializer, {'many': True, 'read_only': True}),
+        }
+    
+    def get_has_audio(self, obj):
+        return obj.has_audio()
+    
+    def get_has_ebook(self, obj):
+        return obj.has_ebook()
+    
+    def get_cover_sizes(self, obj):
+        return image_derivatives(obj.cover_image, obj.cover_derivatives, self.context.get('request'))
+
+
+class BookSerializer(SparseFieldsetsMixin, TaggitSerializer, serializers.ModelSerializer):
     """Serializer for Book model."""
     
     authors = AuthorSerializer(many=True, read_only=True)
     genres = GenreSerializer(many=True, read_only=True)
+    tags = TagListSerializerField(required=False)
     authors_display = serializers.SerializerMethodField()
     genres_display = serializers.SerializerMethodField()
     has_audio = serializers.SerializerMethodField()
     has_ebook = serializers.SerializerMethodField()
+    cover_sizes = serializers.SerializerMethodField()
     
     class Meta:
         model = Book
         fields = [
             'id', 'title', 'subtitle', 'authors', 'genres', 'description',
-            'isbn', 'language', 'pages', 'cover_image', 'pdf_file', 'epub_file',
+            'isbn', 'language', 'pages', 'cover_image', 'cover_sizes', 'pdf_file', 'epub_file',
             'audio_file', 'publisher', 'publication_date', 'edition', 'status',
-            'is_featured', 'is_new', 'average_rating', 'total_ratings',
+            'is_featured', 'is_new', 'average_rating', 'total_ratings', 'bayesian_rating', 'trending_score',
             'view_count', 'download_count', 'tags', 'created_at', 'updated_at',
             'authors_display', 'genres_display', 'has_audio', 'has_ebook'
         ]
         read_only_fields = [
-            'average_rating', 'total_ratings', 'view_count', 'download_count',
+            'average_rating', 'total_ratings', 'bayesian_rating', 'trending_score', 'view_count', 'download_count',
             'created_at', 'updated_at'
         ]
+        field_sources = BOOK_FIELD_SOURCES
     
     def get_authors_display(self, obj):
         return obj.get_authors_display()
@@ -65,9 +282,12 @@ class BookSerializer(serializers.ModelSerializer):
     
     def get_has_ebook(self, obj):
         return obj.has_ebook()
+    
+    def get_cover_sizes(self, obj):
+        return image_derivatives(obj.cover_image, obj.cover_derivatives, self.context.get('request'))
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """Serializer for Review model."""
     
     user_name = serializers.SerializerMethodField()
@@ -82,12 +302,13 @@ class ReviewSerializer(serializers.ModelSerializer):
             'user', 'is_approved', 'is_featured', 'helpful_votes',
             'created_at', 'updated_at'
         ]
+        field_sources = {'user_name': ['user.first_name', 'user.last_name', 'user.username']}
     
     def get_user_name(self, obj):
         return obj.user.get_full_name() or obj.user.username
 
 
-class ReadingHistorySerializer(serializers.ModelSerializer):
+class ReadingHistorySerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """Serializer for ReadingHistory model."""
     
     book_title = serializers.SerializerMethodField()
@@ -98,9 +319,10 @@ class ReadingHistorySerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'book', 'book_title', 'book_cover', 'status',
             'progress_percentage', 'current_page', 'rating', 'notes',
-            'started_reading', 'finished_reading', 'created_at', 'updated_at'
+            'started_reading', 'finished_reading', 'progress_synced_at', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['user', 'created_at', 'updated_at']
+        read_only_fields = ['user', 'progress_synced_at', 'created_at', 'updated_at']
+        field_sources = {'book_title': ['book.title'], 'book_cover': ['book.cover_image']}
     
     def get_book_title(self, obj):
         return obj.book.title
@@ -111,7 +333,22 @@ class ReadingHistorySerializer(serializers.ModelSerializer):
         return None
 
 
-class BookCollectionSerializer(serializers.ModelSerializer):
+class ProgressEventSerializer(serializers.Serializer):
+    """A reading progress event sent by a reader client."""
+    
+    book = serializers.IntegerField(min_value=1)
+    current_page = serializers.IntegerField(min_value=0)
+    progress = serializers.IntegerField(min_value=0, max_value=100)
+    timestamp = serializers.DateTimeField()
+
+
+class ProgressSyncSerializer(serializers.Serializer):
+    """A batch of reading progress events."""
+    
+    events = ProgressEventSerializer(many=True, allow_empty=False, max_length=500)
+
+
+class BookCollectionSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """Serializer for BookCollection model."""
     
     books_count = serializers.SerializerMethodField()
@@ -123,6 +360,8 @@ class BookCollectionSerializer(serializers.ModelSerializer):
             'visibility', 'created_at', 'updated_at'
         ]
         read_only_fields = ['user', 'created_at', 'updated_at']
+        field_sources = {'books_count': ['books']}
     
     def get_books_count(self, obj):
-        return obj.books.count()
\ No newline at end of file
+        # Counts the prefetched books instead of querying per collection
+        return len(obj.books.all())
\ No newline at end of file
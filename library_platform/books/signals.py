@@ -1,18 +1,202 @@
 """
 Signals for books app.
 """
-from django.db.models.signals import post_save, post_delete
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate, m2m_changed
 from django.dispatch import receiver
-from .models import Review
+from django.utils import timezone
+from . import facets, fuzzy, ratings, suggest
+from .autocomplete import set_normalized_names
+from .models import Author, Book, DeletedBook, Genre, Review
+from .search import get_search_backend
+from .thumbnails import IMAGE_FIELDS, needs_derivatives
 
 
 @receiver(post_save, sender=Review)
-def update_book_rating_on_review_save(sender, instance, **kwargs):
-    """Update book rating when a review is saved."""
-    instance.book.update_rating()
+def update_book_rating_on_review_save(sender, instance, created, **kwargs):
+    """Apply the review's rating delta to the book aggregates."""
+    loaded = getattr(instance, '_loaded_rating', None)
+    if created:
+        ratings.review_created(instance)
+    elif loaded is not None and None not in loaded:
+        ratings.review_updated(instance, *loaded)
+    else:
+        ratings.reconcile_ratings(book_ids=[instance.book_id])
+    instance._loaded_rating = (instance.book_id, instance.rating)
 
 
 @receiver(post_delete, sender=Review)
 def update_book_rating_on_review_delete(sender, instance, **kwargs):
-    """Update book rating when a review is deleted."""
-    instance.book.update_rating()
\ No newline at end of file
+    """Remove the deleted review's rating from the book aggregates."""
+    ratings.review_deleted(instance)
+
+
+def reindex_books(book_ids):
+    """Refresh the search index for the given books once the transaction commits."""
+    book_ids = list(book_ids)
+
+    def reindex():
+        books = Book.objects.filter(pk__in=book_ids).prefetch_related('authors', 'tags')
+        get_search_backend().index_books(books)
+
+    transaction.on_commit(reindex)
+
+
+@receiver(post_migrate)
+def create_search_index(sender, **kwargs):
+    """Create the search index structures after migrations."""
+    if sender.name == 'books':
+        get_search_backend().setup()
+
+
+@receiver(post_migrate)
+def backfill_ratings(sender, **kwargs):
+    """Fill the running rating sums of books reviewed before they existed."""
+    if sender.name == 'books':
+        ratings.backfill_rating_sums()
+
+
+@receiver(post_save, sender=Book)
+def index_book_on_save(sender, instance, **kwargs):
+    """Index a book when it is saved."""
+    reindex_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book_on_delete(sender, instance, **kwargs):
+    """Remove a deleted book from the search index."""
+    book_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove_books([book_id]))
+
+
+@receiver(post_delete, sender=Book)
+def record_deleted_book(sender, instance, **kwargs):
+    """Keep a tombstone for incremental exports."""
+    DeletedBook.objects.create(book_id=instance.pk)
+
+
+@receiver(request_started)
+def warm_suggestions(sender, **kwargs):
+    """Start building this process's typeahead index on its first request."""
+    suggest.warm()
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+def update_suggestions_on_save(sender, instance, **kwargs):
+    """Update this process's typeahead index once the transaction commits."""
+    update = suggest.index.update_book if sender is Book else suggest.index.update_author
+    transaction.on_commit(lambda: update(instance))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+def index_trigrams_on_save(sender, instance, **kwargs):
+    """Refresh the fuzzy search trigrams of a saved book title or author name."""
+    index = fuzzy.index_books if sender is Book else fuzzy.index_authors
+    pk = instance.pk
+    transaction.on_commit(lambda: index([pk]))
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+def remove_suggestions_on_delete(sender, instance, **kwargs):
+    """Drop a deleted book or author from this process's typeahead index."""
+    kind, pk = ('book' if sender is Book else 'author'), instance.pk
+    transaction.on_commit(lambda: suggest.index.remove_item(kind, pk))
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.tags.through)
+def index_book_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Reindex books whose authors or tags changed."""
+    if not reverse:
+        if isinstance(instance, Book) and action in ('post_add', 'post_remove', 'post_clear'):
+            reindex_books([instance.pk])
+    elif sender is Book.authors.through:
+        if action in ('post_add', 'post_remove'):
+            reindex_books(pk_set)
+        elif action == 'pre_clear':
+            reindex_books(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.tags.through)
+def flag_similarity_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Flag books whose genres, authors or tags changed for similar-books recomputation."""
+    if not reverse:
+        if isinstance(instance, Book) and action in ('post_add', 'post_remove', 'post_clear'):
+            Book.objects.filter(pk=instance.pk).update(similarity_dirty=True)
+    elif action in ('post_add', 'post_remove'):
+        Book.objects.filter(pk__in=pk_set).update(similarity_dirty=True)
+    elif action == 'pre_clear' and hasattr(instance, 'book_set'):
+        instance.book_set.update(similarity_dirty=True)
+
+
+@receiver(post_save, sender=Author)
+def index_books_on_author_save(sender, instance, created, **kwargs):
+    """Reindex the books of an author whose name may have changed."""
+    if not created:
+        reindex_books(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.tags.through)
+def touch_books_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Bump ``updated_at`` of books whose authors, genres or tags changed (HTTP validators)."""
+    if not reverse:
+        if isinstance(instance, Book) and action in ('post_add', 'post_remove', 'post_clear'):
+            Book.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+    elif action in ('post_add', 'post_remove'):
+        Book.objects.filter(pk__in=pk_set).update(updated_at=timezone.now())
+    elif action == 'pre_clear' and hasattr(instance, 'book_set'):
+        instance.book_set.update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=Author)
+@receiver(pre_save, sender=Genre)
+def normalize_names_on_save(sender, instance, **kwargs):
+    """Keep the prefix search columns in sync with the names."""
+    set_normalized_names(instance)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def touch_books_on_related_save(sender, instance, created, **kwargs):
+    """Bump ``updated_at`` of the books embedding an edited author or genre."""
+    if not created:
+        instance.book_set.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+def queue_image_derivatives(sender, instance, **kwargs):
+    """Generate resized versions of a new or replaced cover / photo in the background.
+
+    Queuing is robust: with the broker down the save still succeeds and the
+    error is logged; ``generate_image_derivatives`` fills the gaps later.
+    """
+    from .tasks import generate_image_derivatives
+
+    for app_label, model_name, field_name in IMAGE_FIELDS:
+        if sender.__name__ == model_name and needs_derivatives(instance, field_name):
+            transaction.on_commit(
+                lambda field_name=field_name: generate_image_derivatives.delay(
+                    sender._meta.label, instance.pk, field_name
+                ),
+                robust=True,
+            )
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(m2m_changed, sender=Book.genres.through)
+def invalidate_facets(sender, **kwargs):
+    """Drop the cached catalog facet counts."""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        facets.invalidate()
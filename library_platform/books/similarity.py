@@ -0,0 +1,229 @@
+"""
+Precomputed similar books.
+
+A batch job scores candidate pairs by genre overlap (Jaccard), shared
+authors and shared tags, and stores the top K matches of every book in the
+``SimilarBook`` table, so the detail page reads them with a single indexed
+lookup. Books whose genres, authors or tags changed are flagged
+``similarity_dirty`` and recomputed incrementally, reading only the
+features around them; a nightly full run corrects the remaining drift.
+"""
+import heapq
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, Min, Prefetch
+from taggit.models import TaggedItem
+
+from .models import Book, SimilarBook
+
+TOP_K = 12
+
+# Relative weight of each feature in the similarity score.
+WEIGHTS = {
+    'genres': 0.5,
+    'authors': 0.3,
+    'tags': 0.2,
+}
+
+# Cap on the books considered per feature value: broad genres such as
+# "Fiction" would otherwise make every book a candidate of every other.
+MAX_POSTINGS = 2000
+
+WRITE_BATCH_SIZE = 1000
+
+
+def jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    shared = len(first & second)
+    return shared / (len(first) + len(second) - shared)
+
+
+def chunked(ids, size=WRITE_BATCH_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def feature_pairs(name, book_ids=None, values=None):
+    """Return the ``(book_id, value)`` rows of a feature, restricted to some books or values."""
+    if name == 'tags':
+        rows = TaggedItem.objects.filter(content_type=ContentType.objects.get_for_model(Book))
+        book_field, value_field = 'object_id', 'tag_id'
+    else:
+        rows = getattr(Book, name).through.objects.all()
+        book_field, value_field = 'book_id', f'{name[:-1]}_id'
+    if book_ids is not None:
+        rows = rows.filter(**{f'{book_field}__in': book_ids})
+    if values is not None:
+        rows = rows.filter(**{f'{value_field}__in': values})
+    return rows.values_list(book_field, value_field)
+
+
+def popularity_key(row):
+    pk, total_ratings, average_rating = row
+    return -total_ratings, -average_rating, pk
+
+
+class FeatureIndex:
+    """In-memory book features with an inverted index per feature."""
+
+    def __init__(self):
+        self.features = {name: defaultdict(set) for name in WEIGHTS}
+        self.postings = {name: defaultdict(list) for name in WEIGHTS}
+
+    @classmethod
+    def load(cls, book_ids=None):
+        """Load the features needed to rank the matches of ``book_ids``, or of every book.
+
+        For given books, only their features, the books sharing one of them
+        and the features of those are read.
+        """
+        index = cls()
+        # Candidates are available books, most popular first so that capped
+        # postings keep the best-known titles.
+        available = Book.objects.filter(status='available')
+        if book_ids is None:
+            for name in WEIGHTS:
+                index.add(name, feature_pairs(name).iterator(chunk_size=10000))
+            candidates = list(
+                available.order_by('-total_ratings', '-average_rating', 'pk').values_list('pk', flat=True)
+            )
+        else:
+            related = set(book_ids)
+            for name in WEIGHTS:
+                for chunk in chunked(book_ids):
+                    index.add(name, feature_pairs(name, book_ids=chunk))
+                values = {value for book_id in book_ids for value in index.features[name].get(book_id, ())}
+                for chunk in chunked(values):
+                    related.update(book_id for book_id, value in feature_pairs(name, values=chunk))
+            rows = []
+            for chunk in chunked(related - set(book_ids)):
+                for name in WEIGHTS:
+                    index.add(name, feature_pairs(name, book_ids=chunk))
+            for chunk in chunked(related):
+                rows.extend(available.filter(pk__in=chunk).values_list('pk', 'total_ratings', 'average_rating'))
+            candidates = [row[0] for row in sorted(rows, key=popularity_key)]
+        for name, features in index.features.items():
+            postings = index.postings[name]
+            for book_id in candidates:
+                for value in features.get(book_id, ()):
+                    if len(postings[value]) < MAX_POSTINGS:
+                        postings[value].append(book_id)
+        return index
+
+    def add(self, name, pairs):
+        features = self.features[name]
+        for book_id, value in pairs:
+            features[book_id].add(value)
+
+    def candidates(self, book_id):
+        candidates = set()
+        for name in WEIGHTS:
+            for value in self.features[name].get(book_id, ()):
+                candidates.update(self.postings[name].get(value, ()))
+        candidates.discard(book_id)
+        return candidates
+
+    def score(self, book_id, other_id):
+        return sum(
+            weight * jaccard(self.features[name].get(book_id), self.features[name].get(other_id))
+            for name, weight in WEIGHTS.items()
+        )
+
+    def top_similar(self, book_id, top_k=TOP_K):
+        scored = ((self.score(book_id, other_id), other_id) for other_id in self.candidates(book_id))
+        return heapq.nlargest(top_k, scored, key=lambda item: (item[0], -item[1]))
+
+
+def write_similar(book_ids, index, top_k=TOP_K):
+    """Replace the stored similar books of ``book_ids``."""
+    entries = []
+    for book_id in book_ids:
+        for rank, (score, other_id) in enumerate(index.top_similar(book_id, top_k), start=1):
+            if score > 0:
+                entries.append(SimilarBook(book_id=book_id, similar_id=other_id, score=score, rank=rank))
+    with transaction.atomic():
+        SimilarBook.objects.filter(book_id__in=book_ids).delete()
+        SimilarBook.objects.bulk_create(entries, batch_size=WRITE_BATCH_SIZE)
+
+
+def promoted_books(changed, index, top_k=TOP_K):
+    """Return the books whose stored matches a changed book may now enter."""
+    scores = defaultdict(float)
+    for book_id in changed:
+        for other_id in index.candidates(book_id):
+            if other_id not in changed:
+                scores[other_id] = max(scores[other_id], index.score(other_id, book_id))
+    weakest = {}
+    for chunk in chunked(scores):
+        weakest.update(
+            (book_id, score if count >= top_k else 0)
+            for book_id, count, score in SimilarBook.objects.filter(book_id__in=chunk).order_by().values('book_id')
+            .annotate(count=Count('pk'), weakest=Min('score')).values_list('book_id', 'count', 'weakest')
+        )
+    return {book_id for book_id, score in scores.items() if score > weakest.get(book_id, 0)}
+
+
+def flag(book_ids, dirty=True):
+    for chunk in chunked(book_ids):
+        Book.objects.filter(pk__in=chunk).update(similarity_dirty=dirty)
+
+
+def claim_dirty(incremental):
+    """Clear the ``similarity_dirty`` flags this run handles and return the flagged books.
+
+    Flags are cleared before the features are read, so books changed
+    during the run are flagged again and picked up by the next one.
+    """
+    with transaction.atomic():
+        flagged = Book.objects.select_for_update().filter(similarity_dirty=True)
+        dirty = set(flagged.values_list('pk', flat=True))
+        if incremental:
+            flag(dirty, False)
+        else:
+            flagged.update(similarity_dirty=False)
+    return dirty
+
+
+def compute_similar_books(incremental=True, top_k=TOP_K):
+    """Recompute the similar-books table, returning the number of books processed.
+
+    In incremental mode only books flagged ``similarity_dirty`` are
+    recomputed, together with the books currently listing one of them and
+    the books one of them now ranks high enough for. Matches may still
+    drift when capped postings change, which the scheduled full run
+    (``rebuild-similar-books``) corrects.
+    """
+    dirty = claim_dirty(incremental)
+    try:
+        if incremental:
+            if not dirty:
+                return 0
+            targets = set(dirty)
+            for chunk in chunked(dirty):
+                targets.update(SimilarBook.objects.filter(similar_id__in=chunk).values_list('book_id', flat=True))
+            targets.update(promoted_books(dirty, FeatureIndex.load(sorted(dirty)), top_k))
+            targets = sorted(targets)
+            index = FeatureIndex.load(targets)
+        else:
+            targets = list(Book.objects.order_by('pk').values_list('pk', flat=True))
+            index = FeatureIndex.load()
+        for start in range(0, len(targets), WRITE_BATCH_SIZE):
+            write_similar(targets[start:start + WRITE_BATCH_SIZE], index, top_k)
+    except Exception:
+        flag(dirty)
+        raise
+    return len(targets)
+
+
+def get_similar_books(book, limit=6):
+    """Return the precomputed similar books of ``book``, best match first."""
+    entries = (
+        SimilarBook.objects.filter(book=book, similar__status='available')
+        .prefetch_related(Prefetch('similar', queryset=Book.objects.for_list()))
+        .order_by('rank')[:limit]
+    )
+    return [entry.similar for entry in entries]
@@ -0,0 +1,286 @@
+"""
+In-process prefix index for title and author typeahead.
+
+Normalized keys (see :func:`books.autocomplete.normalize_name`) are kept in
+a sorted list searched with ``bisect``, next to a parallel ``array`` of
+item references: book ids, and author ids negated. A book is indexed by its
+title and the titles from its second and third words, an author by full
+and last name. Matches are ranked by popularity, views and downloads
+weighted as in :mod:`books.popularity` (summed over their books for
+authors), and the best items of large prefix ranges are cached.
+
+Each process builds its index from the database in the background from its
+first request (:func:`warm`, on ``request_started``), never at import: a
+preloading server would fork the building thread's locks without the
+thread. Lookups arriving before the build wait for it, and never touch the
+database.
+Book and author signals update the index of the process that saved them,
+and every index is rebuilt in the background once older than
+``SUGGEST_REFRESH_INTERVAL`` seconds to catch other processes' changes and
+new counts. Bulk writes that send no signals call :func:`invalidate`, which
+bumps a version in the shared cache: every process compares it with the
+version of its index every ``CACHE_VERSION_TIMEOUT`` seconds and rebuilds
+when it changed.
+"""
+import heapq
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum
+
+from core.cache import initial_version
+
+from .autocomplete import normalize_name
+from .models import Author, Book
+from .popularity import WEIGHTS
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+# Prefix ranges longer than this are ranked once and cached
+SCAN_LIMIT = 1000
+# Title suffixes indexed after the full title, so inner words match too
+WORD_KEYS = 2
+END = '\U0010ffff'
+VERSION_KEY = 'suggest:version'
+
+
+def refresh_interval():
+    return getattr(settings, 'SUGGEST_REFRESH_INTERVAL', 600)
+
+
+def version_check_interval():
+    return getattr(settings, 'CACHE_VERSION_TIMEOUT', 5)
+
+
+def book_popularity(prefix=''):
+    return WEIGHTS['views'] * F(f'{prefix}view_count') + WEIGHTS['downloads'] * F(f'{prefix}download_count')
+
+
+def title_keys(title):
+    words = normalize_name(title).split()
+    return [' '.join(words[index:]) for index in range(min(len(words), WORD_KEYS + 1))]
+
+
+def author_keys(first_name, last_name):
+    full_name, last = normalize_name(f'{first_name} {last_name}'), normalize_name(last_name)
+    return [key for key in {full_name, last} if key]
+
+
+class SuggestIndex:
+    """Sorted prefix keys over books and authors."""
+
+    def __init__(self):
+        self.keys = []
+        self.refs = array('q')
+        # ref: (type, id, text, popularity, keys)
+        self.items = {}
+        self.top = {}
+        self.built_at = None
+        # Shared version the index was built for, and when it was last compared
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.RLock()
+        self.build_lock = threading.Lock()
+        self.building = False
+        # Updates received while a build reads the database, replayed on top of it
+        self.pending = None
+
+    def after_fork(self):
+        """Give a forked child fresh locks: the threads holding the parent's were not copied."""
+        self.lock = threading.RLock()
+        self.build_lock = threading.Lock()
+        self.building = False
+        self.pending = None
+
+    @staticmethod
+    def ref(kind, pk):
+        return pk if kind == 'book' else -pk
+
+    def load(self):
+        """Read the items to index; return ``{ref: item}``."""
+        items = {}
+        books = (
+            Book.objects.available().annotate(popularity=book_popularity())
+            .values_list('pk', 'title', 'popularity')
+        )
+        for pk, title, popularity in books.iterator(chunk_size=10000):
+            items[pk] = ('book', pk, title, float(popularity), title_keys(title))
+        popularity = dict(
+            Book.authors.through.objects.filter(book__status='available').values('author_id')
+            .annotate(popularity=Sum(book_popularity('book__')))
+            .values_list('author_id', 'popularity')
+        )
+        for pk, first_name, last_name in Author.objects.values_list('pk', 'first_name', 'last_name').iterator(
+            chunk_size=10000
+        ):
+            items[-pk] = (
+                'author', pk, f'{first_name} {last_name}', float(popularity.get(pk) or 0),
+                author_keys(first_name, last_name),
+            )
+        return items
+
+    def build(self):
+        """Rebuild the whole index from the database."""
+        with self.build_lock:
+            started = time.monotonic()
+            version = cache.get(VERSION_KEY)
+            with self.lock:
+                self.pending = []
+            items = self.load()
+            entries = sorted((key, ref) for ref, item in items.items() for key in item[4])
+            keys = [key for key, ref in entries]
+            refs = array('q', (ref for key, ref in entries))
+            with self.lock:
+                self.keys, self.refs, self.items, self.top = keys, refs, items, {}
+                self.built_at, self.version, self.checked_at = started, version, started
+                pending, self.pending = self.pending, None
+                for ref, item in pending:
+                    self.replace(ref, item)
+            return len(items)
+
+    def stale(self):
+        return self.built_at is None or time.monotonic() - self.built_at > refresh_interval()
+
+    def outdated(self):
+        """Tell whether :func:`invalidate` was called since the build, checking at most every few seconds."""
+        now = time.monotonic()
+        if now - self.checked_at < version_check_interval():
+            return False
+        self.checked_at = now
+        return cache.get(VERSION_KEY) != self.version
+
+    def ensure_built(self):
+        if self.built_at is None:
+            # Waits for a build started by warm()
+            with self.build_lock:
+                built = self.built_at is not None
+            if not built:
+                self.build()
+        elif not self.building and (self.stale() or self.outdated()):
+            self.refresh()
+
+    def refresh(self):
+        """Rebuild in a background thread, serving the current index meanwhile."""
+        with self.lock:
+            if self.building:
+                return
+            self.building = True
+
+        def run():
+            try:
+                self.build()
+            finally:
+                self.building = False
+
+        threading.Thread(target=run, name='suggest-index', daemon=True).start()
+
+    def range(self, prefix):
+        return bisect_left(self.keys, prefix), bisect_right(self.keys, prefix + END)
+
+    def rank(self, refs, limit):
+        items = self.items
+        return heapq.nlargest(limit, set(refs), key=lambda ref: (items[ref][3], -abs(ref)))
+
+    def lookup(self, query, limit=DEFAULT_LIMIT):
+        """Return ``[{type, id, text}]`` of the most popular items starting with ``query``."""
+        prefix = normalize_name(query)
+        if not prefix:
+            return []
+        self.ensure_built()
+        limit = min(limit, MAX_LIMIT)
+        with self.lock:
+            low, high = self.range(prefix)
+            if high - low <= SCAN_LIMIT:
+                refs = self.rank(self.refs[low:high], limit)
+            else:
+                if prefix not in self.top:
+                    self.top[prefix] = self.rank(self.refs[low:high], MAX_LIMIT)
+                refs = self.top[prefix][:limit]
+            return [{'type': self.items[ref][0], 'id': self.items[ref][1], 'text': self.items[ref][2]} for ref in refs]
+
+    def remove(self, ref):
+        item = self.items.pop(ref, None)
+        if item is None:
+            return
+        for key in item[4]:
+            low, high = bisect_left(self.keys, key), bisect_right(self.keys, key)
+            for position in range(low, high):
+                if self.refs[position] == ref:
+                    del self.keys[position]
+                    del self.refs[position]
+                    break
+            self.forget(key)
+
+    def insert(self, ref, item):
+        self.items[ref] = item
+        for key in item[4]:
+            position = bisect_right(self.keys, key)
+            self.keys.insert(position, key)
+            self.refs.insert(position, ref)
+            self.forget(key)
+
+    def forget(self, key):
+        """Drop the cached rankings of the prefixes of ``key``."""
+        for length in range(1, len(key) + 1):
+            self.top.pop(key[:length], None)
+
+    def replace(self, ref, item):
+        self.remove(ref)
+        if item is not None:
+            self.insert(ref, item)
+
+    def upsert(self, ref, item):
+        """Index ``item`` under ``ref``, or remove ``ref`` when ``item`` is ``None``."""
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((ref, item))
+            if self.built_at is not None:
+                self.replace(ref, item)
+
+    def update_book(self, book):
+        ref = self.ref('book', book.pk)
+        if book.status != 'available':
+            self.upsert(ref, None)
+            return
+        popularity = WEIGHTS['views'] * book.view_count + WEIGHTS['downloads'] * book.download_count
+        self.upsert(ref, ('book', book.pk, book.title, float(popularity), title_keys(book.title)))
+
+    def update_author(self, author):
+        ref = self.ref('author', author.pk)
+        previous = self.items.get(ref)
+        popularity = previous[3] if previous else 0.0
+        self.upsert(ref, (
+            'author', author.pk, author.get_full_name(), popularity,
+            author_keys(author.first_name, author.last_name),
+        ))
+
+    def remove_item(self, kind, pk):
+        self.upsert(self.ref(kind, pk), None)
+
+
+index = SuggestIndex()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=index.after_fork)
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    return index.lookup(query, limit)
+
+
+def invalidate():
+    """Make every process rebuild its index, after writes that bypassed the signals."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, initial_version(), None)
+
+
+def warm():
+    """Start building this process's index in the background, so the first lookups do not wait for it."""
+    if index.built_at is None and not index.building and getattr(settings, 'SUGGEST_WARM_ON_START', True):
+        index.refresh()
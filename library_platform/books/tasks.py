@@ -0,0 +1,57 @@
+"""
+Celery tasks for books app.
+"""
+from celery import shared_task
+from django.apps import apps
+
+from .counters import flush_counters
+from .export import prune_tombstones
+from .popularity import update_popularity
+from .ratings import reconcile_ratings
+from .similarity import compute_similar_books
+from .thumbnails import update_derivatives
+
+
+@shared_task
+def reconcile_book_ratings():
+    """Recompute book rating aggregates that drifted from the reviews."""
+    return reconcile_ratings()
+
+
+@shared_task
+def flush_book_counters():
+    """Write buffered view and download hits to the database."""
+    return flush_counters()
+
+
+@shared_task
+def update_book_popularity():
+    """Refresh the weighted ratings and trending scores."""
+    return update_popularity()
+
+
+@shared_task
+def update_similar_books(incremental=True):
+    """Recompute the similar-books table (only outdated books by default)."""
+    return compute_similar_books(incremental=incremental)
+
+
+@shared_task
+def prune_deleted_books():
+    """Delete the export tombstones older than the retention period."""
+    return prune_tombstones()
+
+
+@shared_task
+def update_recommendations(incremental=True):
+    """Refresh collaborative filtering recommendations (only users with new activity by default)."""
+    # NumPy and SciPy are only needed, and loaded, by the workers running this task
+    from .recommender import compute_recommendations
+
+    return compute_recommendations(incremental=incremental)
+
+
+@shared_task
+def generate_image_derivatives(model_label, pk, field_name, force=False):
+    """Generate the resized and placeholder versions of an uploaded image."""
+    return update_derivatives(apps.get_model(model_label), pk, field_name, force=force)
@@ -0,0 +1,44 @@
+"""
+Template tags rendering responsive book covers and author photos.
+"""
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from ..thumbnails import srcset
+
+register = template.Library()
+
+# Matches the book card grid: col-lg-2 / col-md-3 / col-sm-4 / col-6
+DEFAULT_SIZES = '(min-width: 992px) 17vw, (min-width: 768px) 25vw, (min-width: 576px) 33vw, 50vw'
+FALLBACK_WIDTH = 320
+
+
+@register.simple_tag
+def responsive_image(image, derivatives, sizes=DEFAULT_SIZES, **attrs):
+    """Render ``<picture>`` with WebP/JPEG ``srcset`` and a blurred placeholder.
+
+    Usage: ``{% responsive_image book.cover_image book.cover_derivatives alt=book.title class="book-cover" %}``.
+    Falls back to the original image until its derivatives are generated.
+    """
+    if not image:
+        return ''
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    if not derivatives or derivatives.get('source') != image.name:
+        return format_html('<img src="{}"{}>', image.url, flatatt(attrs))
+
+    url = image.storage.url
+    jpeg = derivatives['jpeg']
+    fallback = next((name for width, name in jpeg if width >= FALLBACK_WIDTH), jpeg[-1][1])
+    attrs.update({
+        'width': derivatives['width'],
+        'height': derivatives['height'],
+        'style': f"background: url({derivatives['placeholder']}) center / cover no-repeat",
+    })
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        srcset(derivatives, 'webp', url), sizes, url(fallback), srcset(derivatives, 'jpeg', url), sizes,
+        flatatt(attrs),
+    )
@@ -1,3 +1,738 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models.fields.files import FieldFile
+from django.core.files.base import ContentFile
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.cache import tiered
+from core.testing import QueryBudgetMixin
+
+from . import async_views, similarity, suggest
+from .autocomplete import author_suggestions, genre_suggestions, prefix_filter
+from .counters import CacheCounterBackend, LocalCounterBackend
+from .delivery import is_first_request, serve_file
+from .export import export_chunks, prune_tombstones
+from .fuzzy import fuzzy_filter, match_authors, rebuild_trigrams, trigrams
+from .importers import CatalogImporter
+from .models import Author, Book, BookActivity, DeletedBook, Genre, GenreTrendingBook, ReadingHistory, Review
+from .pagination import encode_cursor
+from .popularity import update_bayesian_ratings, update_trending
+from .ratings import backfill_rating_sums
+from .search import rebuild_index, search_books
+from .similarity import compute_similar_books, get_similar_books
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_book(title, authors=(), genres=(), **fields):
+    fields.setdefault('publication_date', datetime.date(2020, 1, 1))
+    book = Book.objects.create(title=title, cover_image='book_covers/cover.jpg', **fields)
+    book.authors.set(authors)
+    book.genres.set(genres)
+    return book
+
+
+# Typeahead builds started by the test requests would query from another thread
+@override_settings(SUGGEST_WARM_ON_START=False)
+class CatalogTestCase(TestCase):
+    """Small catalog shared by the API tests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='reader', email='reader@example.com', password='secret'
+        )
+        cls.genre = Genre.objects.create(name='Fantasy')
+        cls.authors = [
+            Author.objects.create(first_name='John', last_name='Tolkien'),
+            Author.objects.create(first_name='Ursula', last_name='Le Guin'),
+        ]
+        cls.books = [
+            create_book(f'Book {index}', cls.authors, [cls.genre]) for index in range(5)
+        ]
+
+
+class QueryBudgetTests(QueryBudgetMixin, CatalogTestCase):
+    """Serializer fields reading related rows must not query once per row."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        readers = [
+            get_user_model().objects.create_user(username=f'user{index}', password='secret')
+            for index in range(5)
+        ]
+        for reader, book in zip(readers, cls.books):
+            Review.objects.create(user=reader, book=book, content='Good', rating=4)
+        for book in cls.books:
+            ReadingHistory.objects.create(user=cls.user, book=book, status='reading')
+
+    def test_book_list(self):
+        response = self.assertEndpointBudget(reverse('books:book-list'), max_queries=4, max_duplicates=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 5)
+
+    def test_book_detail(self):
+        url = reverse('books:book-detail', args=[self.books[0].pk])
+        response = self.assertEndpointBudget(url, max_queries=6, max_duplicates=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Tolkien', response.json()['authors_display'])
+
+    def test_review_list(self):
+        response = self.assertEndpointBudget(reverse('books:review-list'), max_queries=3, max_duplicates=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 5)
+
+    def test_reading_history_list(self):
+        self.client.force_login(self.user)
+        response = self.assertEndpointBudget(
+            reverse('books:readinghistory-list'), max_queries=5, max_duplicates=0
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 5)
+
+
+class DeliveryTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.book = Book(title='Files')
+        self.book.pdf_file.save('book.pdf', ContentFile(bytes(range(100))), save=False)
+
+    def get(self, byte_range=None):
+        headers = {'Range': byte_range} if byte_range else {}
+        return RequestFactory().get('/', headers=headers)
+
+    def test_first_request(self):
+        for byte_range, first in (
+            (None, True), ('bytes=0-', True), ('bytes=0-99', True),
+            ('bytes=0-1', False), ('bytes=50-', False), ('bytes=-10', False),
+        ):
+            with self.subTest(byte_range=byte_range):
+                self.assertEqual(is_first_request(self.get(byte_range), 100), first)
+
+    def test_stream_range(self):
+        response = serve_file(self.get('bytes=10-19'), self.book.pdf_file)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+        self.assertEqual(serve_file(self.get('bytes=200-'), self.book.pdf_file).status_code, 416)
+
+    @override_settings(BOOKS_DELIVERY_MODE='sendfile')
+    def test_sendfile_falls_back_to_streaming_without_local_path(self):
+        response = serve_file(self.get(), self.book.pdf_file)
+        self.assertEqual(response['X-Sendfile'], self.book.pdf_file.path)
+        # Like remote storages, which have no local path
+        with mock.patch.object(FieldFile, 'path', new_callable=mock.PropertyMock, side_effect=NotImplementedError):
+            response = serve_file(self.get(), self.book.pdf_file)
+        self.assertNotIn('X-Sendfile', response)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100)))
+
+    @override_settings(BOOKS_DELIVERY_MODE='accel')
+    def test_accel_quotes_the_path(self):
+        self.book.pdf_file.name = 'books/my book#1.pdf'
+        response = serve_file(self.get(), self.book.pdf_file)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/books/my%20book%231.pdf')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CounterTests(CatalogTestCase):
+    def assertCounts(self, book, views, downloads):
+        book.refresh_from_db()
+        self.assertEqual((book.view_count, book.download_count), (views, downloads))
+
+    def test_local_backend(self):
+        backend = LocalCounterBackend(flush_interval=3600)
+        book = self.books[0]
+        backend.record('view', book.pk)
+        backend.record('view', book.pk)
+        backend.record('download', book.pk)
+        self.assertEqual(backend.pending_deltas([book.pk]), {book.pk: {'view_count': 2, 'download_count': 1}})
+        self.assertCounts(book, 0, 0)
+
+        self.assertEqual(backend.flush(), 1)
+        self.assertCounts(book, 2, 1)
+        self.assertEqual(backend.pending_deltas([book.pk]), {})
+        activity = BookActivity.objects.get(book=book)
+        self.assertEqual((activity.views, activity.downloads), (2, 1))
+
+    def test_local_backend_flushes_in_the_background(self):
+        backend = LocalCounterBackend(flush_interval=3600)
+        book = self.books[0]
+        with mock.patch('books.counters.write_deltas', side_effect=DatabaseError('down')):
+            backend.record('view', book.pk)
+            with self.assertLogs('books.counters', 'ERROR'):
+                self.assertEqual(backend.try_flush(), 0)
+        self.assertTrue(backend.flusher.is_alive())
+        # Failed hits are kept for the next flush
+        self.assertEqual(backend.pending_deltas([book.pk]), {book.pk: {'view_count': 1}})
+        self.assertEqual(backend.try_flush(), 1)
+        self.assertCounts(book, 1, 0)
+
+    def test_cache_backend_drains_closed_generations(self):
+        backend = CacheCounterBackend(flush_interval=3600)
+        book = self.books[0]
+        backend.record('view', book.pk)
+        backend.record('view', book.pk)
+        self.assertEqual(backend.pending_deltas([book.pk]), {book.pk: {'view_count': 2}})
+
+        # The first flush closes the generation, the next one writes it
+        backend.flush()
+        backend.record('view', book.pk)
+        self.assertEqual(backend.flush(), 1)
+        self.assertCounts(book, 2, 0)
+        self.assertEqual(backend.pending_deltas([book.pk]), {book.pk: {'view_count': 1}})
+        backend.flush()
+        self.assertCounts(book, 3, 0)
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    def walk(self, url, params):
+        seen = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            seen.extend(book['id'] for book in page['results'])
+            if not page['next']:
+                return seen
+            response = self.client.get(page['next'])
+
+    def test_pages_cover_every_book_once(self):
+        Book.objects.filter(pk__in=[book.pk for book in self.books[:3]]).update(title='Same title')
+        url = reverse('books:book-list')
+        for ordering in ('title', '-title', '-created_at'):
+            with self.subTest(ordering=ordering):
+                seen = self.walk(url, {'page_size': 2, 'ordering': ordering})
+                self.assertEqual(sorted(seen), sorted(book.pk for book in self.books))
+                self.assertEqual(len(seen), len(set(seen)))
+
+    def test_previous_link_returns_the_previous_page(self):
+        url = reverse('books:book-list')
+        first = self.client.get(url, {'page_size': 2}).json()
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_invalid_cursor(self):
+        url = reverse('books:book-list')
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 404)
+        cursor = self.client.get(url, {'page_size': 2, 'ordering': 'title'}).json()['next']
+        # A cursor only applies to the ordering it was issued for
+        response = self.client.get(cursor.replace('ordering=title', 'ordering=-publication_date'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor(self):
+        url = reverse('books:book-list')
+        for ordering, position in (
+            ('publication_date', ['yesterday', 1]),
+            ('average_rating', ['high', 1]),
+            ('title', ['Book 1', 'one']),
+            ('title', [None, 1]),
+        ):
+            with self.subTest(ordering=ordering, position=position):
+                fields = [ordering, 'id']
+                cursor = encode_cursor([(field, False) for field in fields], position)
+                response = self.client.get(url, {'ordering': ordering, 'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class SimilarBooksTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.history = Genre.objects.create(name='History')
+        cls.loner = create_book('Loner', genres=[cls.history])
+        cls.unrelated = create_book('Unrelated')
+
+    def similar(self, book):
+        return [similar.pk for similar in get_similar_books(book, limit=10)]
+
+    def test_full(self):
+        self.assertEqual(compute_similar_books(incremental=False), 7)
+        self.assertEqual(len(self.similar(self.books[0])), 4)
+        self.assertNotIn(self.loner.pk, self.similar(self.books[0]))
+        self.assertEqual(self.similar(self.loner), [])
+        self.assertFalse(Book.objects.filter(similarity_dirty=True).exists())
+        self.assertEqual(compute_similar_books(), 0)
+
+    def test_incremental_updates_the_books_a_change_ranks_for(self):
+        compute_similar_books(incremental=False)
+        newcomer = create_book('Newcomer', genres=[self.history])
+        self.assertEqual(compute_similar_books(), 2)
+        self.assertEqual(self.similar(self.loner), [newcomer.pk])
+        self.assertEqual(self.similar(newcomer), [self.loner.pk])
+
+        # Books listing a changed book drop it once it no longer matches
+        newcomer.genres.clear()
+        compute_similar_books()
+        self.assertEqual(self.similar(self.loner), [])
+
+    def test_changes_during_a_run_stay_flagged(self):
+        write_similar = similarity.write_similar
+
+        def edit_during_run(*args, **kwargs):
+            Book.objects.filter(pk=self.loner.pk).update(similarity_dirty=True)
+            return write_similar(*args, **kwargs)
+
+        with mock.patch.object(similarity, 'write_similar', edit_during_run):
+            compute_similar_books(incremental=False)
+        self.assertEqual(list(Book.objects.filter(similarity_dirty=True)), [self.loner])
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def test_list_not_modified_until_a_book_changes(self):
+        url = reverse('books:book-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        book = self.books[0]
+        book.title = 'Renamed'
+        book.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_tag_changes_outdate_the_validators(self):
+        url = reverse('books:book-detail', args=[self.books[0].pk])
+        etag = self.client.get(url)['ETag']
+        self.books[0].tags.add('dragons')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pages_have_their_own_validators(self):
+        url = reverse('books:book-list')
+        first = self.client.get(url, {'page_size': 2})
+        second = self.client.get(first.json()['next'])
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_detail(self):
+        url = reverse('books:book-detail', args=[self.books[0].pk])
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_malformed_or_unknown_keys_are_not_found(self):
+        for url in (
+            reverse('books:book-list') + 'abc/',
+            reverse('books:author-list') + 'abc/',
+            reverse('books:book-detail', args=[0]),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class AsyncViewTests(CatalogTestCase):
+    def get(self, view, path='/', **kwargs):
+        request = AsyncRequestFactory().get(path, **kwargs)
+        return async_to_sync(view.as_view())(request, **getattr(self, 'view_kwargs', {}))
+
+    def test_list(self):
+        response = self.get(async_views.BookListView, data={'page_size': 2, 'ordering': 'title'})
+        data = json.loads(response.content)
+        self.assertEqual([book['title'] for book in data['results']], ['Book 0', 'Book 1'])
+        self.assertIn('cursor=', data['next'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(
+                async_views.BookListView, data={'page_size': 2, 'ordering': 'title'},
+                headers={'If-None-Match': response['ETag']},
+            )
+        self.assertEqual(response.status_code, 304)
+        # Validated over the fetched page, not an aggregate over the catalog
+        self.assertFalse([query for query in queries if 'MAX(' in query['sql']])
+
+    def test_list_invalid_cursor(self):
+        response = self.get(async_views.BookListView, data={'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_detail(self):
+        self.view_kwargs = {'pk': self.books[0].pk}
+        response = self.get(async_views.BookDetailView)
+        self.assertEqual(json.loads(response.content)['title'], 'Book 0')
+        self.assertEqual(self.get(async_views.BookDetailView, headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+        Book.objects.filter(pk=self.books[0].pk).update(status='unavailable')
+        self.assertEqual(self.get(async_views.BookDetailView).status_code, 404)
+        self.view_kwargs = {'pk': 0}
+        self.assertEqual(self.get(async_views.BookDetailView).status_code, 404)
+
+    def test_selection(self):
+        Book.objects.filter(pk=self.books[1].pk).update(is_featured=True)
+        response = self.get(async_views.FeaturedBooksView)
+        self.assertEqual([book['id'] for book in json.loads(response.content)], [self.books[1].pk])
+
+
+class RatingTests(CatalogTestCase):
+    def assertRatings(self, book, rating_sum, total_ratings, average_rating):
+        book.refresh_from_db()
+        self.assertEqual(
+            (book.rating_sum, book.total_ratings, float(book.average_rating)),
+            (rating_sum, total_ratings, average_rating),
+        )
+
+    def test_deltas(self):
+        book, other = self.books[:2]
+        reader = get_user_model().objects.create_user(username='other', password='secret')
+        review = Review.objects.create(user=self.user, book=book, content='Good', rating=4)
+        Review.objects.create(user=reader, book=book, content='Fine', rating=3)
+        self.assertRatings(book, 7, 2, 3.5)
+
+        review.rating = 5
+        review.save()
+        self.assertRatings(book, 8, 2, 4.0)
+
+        review.book = other
+        review.save()
+        self.assertRatings(book, 3, 1, 3.0)
+        self.assertRatings(other, 5, 1, 5.0)
+
+        review.delete()
+        self.assertRatings(other, 0, 0, 0.0)
+
+    def test_backfill(self):
+        book = self.books[0]
+        Review.objects.create(user=self.user, book=book, content='Good', rating=4)
+        self.assertEqual(backfill_rating_sums(), 0)
+        # As left by the migration adding rating_sum
+        Book.objects.filter(pk=book.pk).update(rating_sum=0)
+        self.assertEqual(backfill_rating_sums(), 1)
+        self.assertRatings(book, 4, 1, 4.0)
+
+
+@override_settings(POPULARITY_PRIOR_RATINGS=2)
+class PopularityTests(CatalogTestCase):
+    def stamps(self):
+        return dict(Book.objects.values_list('pk', 'updated_at'))
+
+    def test_bayesian_ratings(self):
+        Book.objects.filter(pk=self.books[0].pk).update(rating_sum=5, total_ratings=1)
+        Book.objects.filter(pk=self.books[1].pk).update(rating_sum=30, total_ratings=10)
+        stamps = self.stamps()
+        self.assertEqual(update_bayesian_ratings(), 5)
+        # Catalog mean 35 / 11, two prior ratings at the mean
+        mean = 35 / 11
+        self.books[0].refresh_from_db()
+        self.assertAlmostEqual(self.books[0].bayesian_rating, (5 + 2 * mean) / 3, places=4)
+        self.assertIsNotNone(self.books[0].scores_updated_at)
+        self.assertEqual(self.stamps(), stamps)
+        self.assertEqual(update_bayesian_ratings(), 0)
+
+    def test_trending(self):
+        genre_book, other = self.books[0], create_book('Other')
+        BookActivity.objects.create(book=genre_book, date=datetime.date.today(), views=10)
+        BookActivity.objects.create(book=other, date=datetime.date.today(), downloads=10)
+        Review.objects.create(user=self.user, book=genre_book, content='Good', rating=5)
+        stamps = self.stamps()
+        self.assertEqual(update_trending(), 2)
+        other.refresh_from_db()
+        self.assertGreater(other.trending_score, 0)
+        self.assertEqual(
+            list(GenreTrendingBook.objects.values_list('book_id', 'rank')), [(genre_book.pk, 1)]
+        )
+        self.assertEqual(self.stamps(), stamps)
+
+        BookActivity.objects.filter(book=other).delete()
+        update_trending()
+        other.refresh_from_db()
+        self.assertEqual(other.trending_score, 0)
+        self.assertEqual(self.stamps(), stamps)
+
+    def test_validators(self):
+        Book.objects.filter(pk=self.books[0].pk).update(rating_sum=5, total_ratings=1)
+        list_url, detail_url = reverse('books:book-list'), reverse('books:book-detail', args=[self.books[0].pk])
+        list_etag = self.client.get(list_url)['ETag']
+        detail_etag = self.client.get(detail_url)['ETag']
+        popular_etag = self.client.get(reverse('books:api_popular'))['ETag']
+        update_bayesian_ratings()
+        # The list does not render the scores, the detail and popular books do
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+        self.assertNotEqual(self.client.get(reverse('books:api_popular'))['ETag'], popular_etag)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FacetTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_genre = Genre.objects.create(name='History')
+        create_book(
+            'Old', genres=[cls.other_genre], language='en', publication_date=datetime.date(1985, 6, 1),
+            average_rating=4.5, audio_file='books/audio/old.mp3',
+        )
+
+    def setUp(self):
+        # Entries cached by earlier tests outlive their rolled back rows
+        tiered.shared.clear()
+        tiered.local.clear()
+
+    def facets(self, **params):
+        response = self.client.get(reverse('books:book-facets'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def values(self, facet):
+        return {item['value']: item['count'] for item in facet}
+
+    def test_counts(self):
+        facets = self.facets()
+        self.assertEqual(facets['total'], 6)
+        self.assertEqual(self.values(facets['genre']), {self.genre.pk: 5, self.other_genre.pk: 1})
+        self.assertEqual(self.values(facets['language']), {'fr': 5, 'en': 1})
+        self.assertEqual(self.values(facets['decade']), {2020: 5, 1980: 1})
+        self.assertEqual(self.values(facets['min_rating']), {4: 1, 3: 1, 2: 1, 1: 1})
+        self.assertEqual(self.values(facets['has_audio']), {True: 1})
+        self.assertEqual(facets['has_ebook'], [])
+
+    def test_filtered_counts(self):
+        facets = self.facets(language='en')
+        self.assertEqual(facets['total'], 1)
+        self.assertEqual(self.values(facets['genre']), {self.other_genre.pk: 1})
+
+    def test_cached_counts_follow_book_changes(self):
+        self.assertEqual(self.facets()['total'], 6)
+        create_book('New')
+        self.assertEqual(self.facets()['total'], 7)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogImporterTests(TestCase):
+    records = [
+        {
+            'isbn': '978-0-00-000001-7', 'title': 'Dune', 'authors': 'Frank Herbert',
+            'genres': 'Science Fiction', 'tags': 'desert;spice', 'publication_date': '1965',
+        },
+        {'title': 'Untitled Notes', 'authors': 'Jane Doe;John Doe', 'publication_date': '2001-02-03'},
+        {'title': 'Untitled Notes', 'authors': 'Someone Else', 'publication_date': '2002'},
+        {'title': '', 'publication_date': '2000'},
+        {'title': 'Bad date', 'publication_date': 'soon'},
+    ]
+
+    def test_import(self):
+        report = CatalogImporter().run(self.records)
+        self.assertEqual((report.processed, report.created, report.updated), (3, 3, 0))
+        self.assertEqual([position for position, message in report.errors], [4, 5])
+
+        dune = Book.objects.get(isbn='9780000000017')
+        self.assertEqual(dune.publication_date, datetime.date(1965, 1, 1))
+        self.assertEqual(list(dune.authors.values_list('first_name', 'last_name')), [('Frank', 'Herbert')])
+        self.assertEqual(list(dune.genres.values_list('name', flat=True)), ['Science Fiction'])
+        self.assertEqual(sorted(dune.tags.names()), ['desert', 'spice'])
+        self.assertEqual(Book.objects.filter(title='Untitled Notes').count(), 2)
+
+    def test_rerun_updates_instead_of_duplicating(self):
+        CatalogImporter().run(self.records)
+        changed = [dict(record, pages='500') for record in self.records]
+        report = CatalogImporter().run(changed)
+        self.assertEqual((report.created, report.updated), (0, 3))
+        self.assertEqual(Book.objects.count(), 3)
+        self.assertEqual(set(Book.objects.values_list('pages', flat=True)), {500})
+
+    def test_dry_run_writes_nothing(self):
+        report = CatalogImporter(dry_run=True).run(self.records)
+        self.assertEqual(report.processed, 3)
+        self.assertFalse(Book.objects.exists())
+
+    def test_resumes_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'feed.checkpoint')
+            CatalogImporter(batch_size=1, checkpoint_path=checkpoint).run(self.records[:1])
+            report = CatalogImporter(batch_size=1, checkpoint_path=checkpoint).run(self.records[:3])
+        self.assertEqual(report.processed, 2)
+        self.assertEqual(Book.objects.count(), 3)
+
+
+class FuzzySearchTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.hobbit = create_book('The Hobbit', genres=[cls.genre])
+        cls.other = create_book('Habit Forming')
+        rebuild_trigrams()
+
+    def test_trigrams(self):
+        self.assertEqual(trigrams('Ab'), {'  a', ' ab', 'ab '})
+        self.assertEqual(trigrams('ÉTÉ'), trigrams('ete'))
+
+    def test_misspelled_author(self):
+        self.assertEqual([pk for pk, similarity in match_authors('tolkein')], [self.authors[0].pk])
+
+    def test_books_match_through_title_and_authors(self):
+        matches = list(fuzzy_filter(Book.objects.all(), 'hobit').values_list('pk', flat=True))
+        self.assertEqual(matches[0], self.hobbit.pk)
+        by_author = set(fuzzy_filter(Book.objects.all(), 'tolkein').values_list('pk', flat=True))
+        self.assertEqual(by_author, {book.pk for book in self.books})
+
+    @override_settings(FUZZY_SEARCH_MAX_RESULTS=1)
+    def test_filters_apply_before_the_cap(self):
+        queryset = Book.objects.exclude(pk=self.hobbit.pk)
+        self.assertEqual(list(fuzzy_filter(queryset, 'hobit').values_list('pk', flat=True)), [self.other.pk])
+
+    def test_api(self):
+        response = self.client.get(reverse('books:book-list'), {'fuzzy': 'hobit'})
+        self.assertEqual(response.json()['results'][0]['id'], self.hobbit.pk)
+
+
+class ExportTests(CatalogTestCase):
+    def export(self, **kwargs):
+        return b''.join(export_chunks(**kwargs)).decode()
+
+    def rows(self, **kwargs):
+        return [json.loads(line) for line in self.export(**kwargs).splitlines()]
+
+    def test_full(self):
+        rows = self.rows()
+        self.assertEqual([row['id'] for row in rows], [book.pk for book in self.books])
+        self.assertEqual(rows[0]['authors'], ['Ursula Le Guin', 'John Tolkien'])
+        self.assertEqual(rows[0]['genres'], ['Fantasy'])
+        self.assertEqual((rows[0]['view_count'], rows[0]['deleted']), (0, False))
+
+    def test_incremental(self):
+        since = timezone.now()
+        self.books[1].title = 'Renamed'
+        self.books[1].save()
+        deleted_pk = self.books[2].pk
+        self.books[2].delete()
+        rows = self.rows(since=since)
+        self.assertEqual(rows, [
+            dict(rows[0], id=self.books[1].pk, title='Renamed', deleted=False),
+            {'id': deleted_pk, 'deleted': True},
+        ])
+        self.assertNotIn('view_count', rows[0])
+        header = self.export(output='csv', since=since).splitlines()[0]
+        self.assertNotIn('view_count', header.split(','))
+
+    def test_command_watermark(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path, state = os.path.join(directory, 'books.ndjson'), os.path.join(directory, 'state.json')
+            call_command('export_catalog', path, state=state, stderr=io.StringIO())
+            self.books[0].save()
+            call_command('export_catalog', path, state=state, stderr=io.StringIO())
+            with open(path) as handle:
+                self.assertEqual([json.loads(line)['id'] for line in handle], [self.books[0].pk])
+
+    @override_settings(BOOKS_TOMBSTONE_RETENTION_DAYS=30)
+    def test_prune_tombstones(self):
+        old, recent = DeletedBook.objects.create(book_id=1), DeletedBook.objects.create(book_id=2)
+        DeletedBook.objects.filter(pk=old.pk).update(deleted_at=timezone.now() - datetime.timedelta(days=31))
+        self.assertEqual(prune_tombstones(), 1)
+        self.assertEqual(list(DeletedBook.objects.all()), [recent])
+
+
+class AutocompleteTests(CatalogTestCase):
+    def test_prefixes(self):
+        self.assertEqual(author_suggestions('le g'), [{'id': self.authors[1].pk, 'text': 'Ursula Le Guin'}])
+        self.assertEqual(author_suggestions('JOHN'), [{'id': self.authors[0].pk, 'text': 'John Tolkien'}])
+        self.assertEqual(genre_suggestions('fan'), [{'id': self.genre.pk, 'text': 'Fantasy'}])
+        self.assertEqual(genre_suggestions('an'), [])
+
+    def test_prefixes_use_the_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            author_suggestions('tol')
+        self.assertNotIn(' LIKE ', queries[0]['sql'])
+        if connection.vendor == 'sqlite':
+            plan = Genre.objects.filter(prefix_filter('normalized_name', 'fan')).explain()
+            self.assertIn('SEARCH', plan)
+            self.assertNotIn('SCAN', plan)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SuggestTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.popular = create_book('Booklet Of Hits', view_count=1000)
+        cls.hidden = create_book('Book Draft', status='unavailable')
+
+    def setUp(self):
+        self.index = suggest.SuggestIndex()
+        self.index.build()
+
+    def texts(self, query, limit=suggest.DEFAULT_LIMIT):
+        return [item['text'] for item in self.index.lookup(query, limit)]
+
+    def test_prefix_ranked_by_popularity(self):
+        texts = self.texts('boo', limit=3)
+        self.assertEqual(texts[0], 'Booklet Of Hits')
+        self.assertNotIn('Book Draft', self.texts('book d'))
+
+    def test_inner_words_and_authors(self):
+        self.assertEqual(self.texts('hits'), ['Booklet Of Hits'])
+        self.assertEqual(self.texts('tolk'), ['John Tolkien'])
+        self.assertEqual(self.texts('ursula le'), ['Ursula Le Guin'])
+
+    def test_updates(self):
+        self.popular.status = 'unavailable'
+        self.index.update_book(self.popular)
+        self.assertEqual(self.texts('booklet'), [])
+        self.index.remove_item('author', self.authors[0].pk)
+        self.assertEqual(self.texts('tolk'), [])
+
+    def test_invalidate_outdates_every_index(self):
+        self.index.checked_at = 0
+        self.assertFalse(self.index.outdated())
+        suggest.invalidate()
+        self.index.checked_at = 0
+        self.assertTrue(self.index.outdated())
+
+    def test_forked_index_gets_fresh_locks(self):
+        # As in a child forked while the parent was building
+        self.index.build_lock.acquire()
+        self.index.building = True
+        self.index.after_fork()
+        self.index.built_at = None
+        self.assertEqual(self.texts('hits'), ['Booklet Of Hits'])
+
+    @override_settings(SUGGEST_WARM_ON_START=True)
+    def test_warm_on_first_request(self):
+        index = suggest.SuggestIndex()
+        with mock.patch.object(suggest, 'index', index), mock.patch.object(index, 'refresh') as refresh:
+            self.client.get(reverse('books:book-suggest'), {'q': ''})
+            refresh.assert_called_once()
+            index.built_at = 1.0
+            self.client.get(reverse('books:book-suggest'), {'q': ''})
+            refresh.assert_called_once()
+
+    def test_api(self):
+        with mock.patch.object(suggest, 'index', self.index):
+            response = self.client.get(reverse('books:book-suggest'), {'q': 'booklet'})
+        self.assertEqual(response.json(), [{'type': 'book', 'id': self.popular.pk, 'text': 'Booklet Of Hits'}])
+
+
+class SearchTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # The longest title ranks last
+        cls.dragon = create_book('Tales of the old dragon keepers of the north', genres=[cls.genre])
+        cls.dragons = [create_book(f'Dragon {index}') for index in range(3)]
+        rebuild_index()
+
+    def test_ranks_title_matches(self):
+        results = list(search_books(Book.objects.all(), 'dragon').values_list('pk', flat=True))
+        self.assertEqual(results[-1], self.dragon.pk)
+        self.assertEqual(search_books(Book.objects.all(), 'drag').count(), 4)
+        self.assertEqual(list(search_books(Book.objects.all(), 'dragon keepers')), [self.dragon])
+
+    @override_settings(BOOKS_SEARCH_MAX_RESULTS=1)
+    def test_filters_apply_before_the_cap(self):
+        url = reverse('books:book-list')
+        response = self.client.get(url, {'search': 'dragon', 'genre': self.genre.pk})
+        self.assertEqual([book['id'] for book in response.json()['results']], [self.dragon.pk])
+        queryset = Book.objects.exclude(pk=self.dragon.pk)
+        self.assertEqual(search_books(queryset, 'dragon').count(), 1)
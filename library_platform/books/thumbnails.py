@@ -0,0 +1,136 @@
+"""
+Responsive derivatives of book covers and author photos.
+
+Every uploaded image is resized to a few fixed widths in WebP and JPEG and
+reduced to a tiny blurred placeholder inlined as a data URI. Derivatives
+are stored next to the original, named after a hash of its content, so
+they can be cached forever and regenerating them is idempotent. Their
+names are kept in a JSON field of the model (``cover_derivatives``,
+``photo_derivatives``)::
+
+    {
+        "source": "book_covers/dune.jpg",
+        "width": 1200, "height": 1800,
+        "placeholder": "data:image/jpeg;base64,...",
+        "webp": [[160, "book_covers/dune.3f2a9c1e.160w.webp"], ...],
+        "jpeg": [[160, "book_covers/dune.3f2a9c1e.160w.jpg"], ...]
+    }
+"""
+import base64
+import hashlib
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.db.models.functions import Now
+from PIL import Image, ImageFilter, ImageOps
+
+WIDTHS = (160, 320, 640)
+
+FORMATS = {
+    # format: (Pillow format, extension, save options)
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+PLACEHOLDER_WIDTH = 16
+
+# (app label, model, image field) -> field holding its derivatives
+IMAGE_FIELDS = {
+    ('books', 'Book', 'cover_image'): 'cover_derivatives',
+    ('books', 'Author', 'photo'): 'photo_derivatives',
+}
+
+
+def derivatives_field(model, field_name):
+    return IMAGE_FIELDS[(model._meta.app_label, model.__name__, field_name)]
+
+
+def flatten(image):
+    """Return an RGB copy of ``image``, alpha composited onto white."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def encode(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def placeholder(image):
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.resize((PLACEHOLDER_WIDTH, height), Image.Resampling.BILINEAR)
+    data = encode(tiny.filter(ImageFilter.GaussianBlur(1)), 'JPEG', quality=40)
+    return 'data:image/jpeg;base64,' + base64.b64encode(data).decode()
+
+
+def generate_derivatives(field_file):
+    """Write the derivatives of an image field file and return their description."""
+    storage = field_file.storage
+    with field_file.open('rb') as handle:
+        content = handle.read()
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    image = flatten(Image.open(io.BytesIO(content)))
+    stem = os.path.splitext(field_file.name)[0]
+
+    result = {
+        'source': field_file.name,
+        'width': image.width,
+        'height': image.height,
+        'placeholder': placeholder(image),
+    }
+    # Never upscale; small originals get a single derivative at their own width.
+    widths = sorted({min(width, image.width) for width in WIDTHS})
+    for key, (image_format, extension, options) in FORMATS.items():
+        result[key] = []
+        for width in widths:
+            name = f'{stem}.{digest}.{width}w.{extension}'
+            if not storage.exists(name):
+                height = max(1, round(image.height * width / image.width))
+                resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+                name = storage.save(name, ContentFile(encode(resized, image_format, **options)))
+            result[key].append([width, name])
+    return result
+
+
+def derivative_names(derivatives):
+    return {name for key in FORMATS for width, name in (derivatives or {}).get(key, [])}
+
+
+def update_derivatives(model, pk, field_name, force=False):
+    """(Re)generate the derivatives of one image, removing the outdated ones.
+
+    Returns ``False`` when the stored derivatives were already up to date.
+    """
+    target = derivatives_field(model, field_name)
+    instance = model.objects.filter(pk=pk).only(field_name, target).first()
+    if instance is None:
+        return False
+    field_file = getattr(instance, field_name)
+    previous = getattr(instance, target) or {}
+    if not force and previous.get('source', '') == (field_file.name or ''):
+        return False
+
+    derivatives = generate_derivatives(field_file) if field_file else {}
+    # Queryset update: no signals, so this does not queue another task.
+    model.objects.filter(pk=pk).update(**{target: derivatives, 'updated_at': Now()})
+    for name in derivative_names(previous) - derivative_names(derivatives):
+        field_file.storage.delete(name)
+    return True
+
+
+def needs_derivatives(instance, field_name):
+    field_file = getattr(instance, field_name)
+    derivatives = getattr(instance, derivatives_field(type(instance), field_name)) or {}
+    return derivatives.get('source', '') != (field_file.name or '')
+
+
+def srcset(derivatives, key, url):
+    """Return the ``srcset`` attribute value of a derivative format."""
+    return ', '.join(f'{url(name)} {width}w' for width, name in derivatives.get(key, []))
@@ -1,9 +1,10 @@
 """
 URL configuration for books app.
 """
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 # API URLs
 router = DefaultRouter()
@@ -11,8 +12,8 @@ router.register(r'books', views.BookViewSet)
 router.register(r'genres', views.GenreViewSet)
 router.register(r'authors', views.AuthorViewSet)
 router.register(r'reviews', views.ReviewViewSet)
-router.register(r'reading-history', views.ReadingHistoryViewSet)
-router.register(r'collections', views.BookCollectionViewSet)
+router.register(r'reading-history', views.ReadingHistoryViewSet, basename='readinghistory')
+router.register(r'collections', views.BookCollectionViewSet, basename='bookcollection')
 
 app_name = 'books'
 
@@ -21,6 +22,7 @@ urlpatterns = [
     path('', views.BookListView.as_view(), name='list'),
     path('<int:pk>/', views.BookDetailView.as_view(), name='detail'),
     path('<int:pk>/read/', views.BookReaderView.as_view(), name='read'),
+    path('<int:pk>/download/<str:file_format>/', views.BookDownloadView.as_view(), name='download'),
     path('<int:pk>/review/', views.ReviewCreateView.as_view(), name='review'),
     path('search/', views.BookSearchView.as_view(), name='search'),
     path('genres/', views.GenreListView.as_view(), name='genres'),
@@ -33,4 +35,19 @@ urlpatterns = [
     path('api/featured/', views.FeaturedBooksAPIView.as_view(), name='api_featured'),
     path('api/new-releases/', views.NewReleasesAPIView.as_view(), name='api_new_releases'),
     path('api/popular/', views.PopularBooksAPIView.as_view(), name='api_popular'),
-]
\ No newline at end of file
+    path('api/trending/', views.TrendingBooksAPIView.as_view(), name='api_trending'),
+    path('api/export/', views.CatalogExportAPIView.as_view(), name='api_export'),
+]
+
+# Async read path, routed in front of the DRF views when served over ASGI
+async_urlpatterns = [
+    path('api/books/', async_views.BookListView.as_view(), name='api_async_books'),
+    path('api/books/<int:pk>/', async_views.BookDetailView.as_view(), name='api_async_book'),
+    path('api/featured/', async_views.FeaturedBooksView.as_view(), name='api_async_featured'),
+    path('api/new-releases/', async_views.NewReleasesView.as_view(), name='api_async_new_releases'),
+    path('api/popular/', async_views.PopularBooksView.as_view(), name='api_async_popular'),
+    path('api/trending/', async_views.TrendingBooksView.as_view(), name='api_async_trending'),
+]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns = async_urlpatterns + urlpatterns
@@ -5,25 +5,44 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.http import Http404, StreamingHttpResponse
 from django.views.generic import ListView, DetailView, CreateView, TemplateView
-from django.db.models import Q, Avg, Count
+from django.db.models import Q, Avg, Count, Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import gettext_lazy as _
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticatedOrReadOnly, IsAuthenticated, SAFE_METHODS
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Book, Genre, Author, Review, ReadingHistory, BookCollection
+from core.cache import cached_queryset
+from core.instrumentation import InstrumentedViewMixin
+from .models import Book, Genre, GenreTrendingBook, Author, Review, ReadingHistory, BookCollection
+from .autocomplete import author_suggestions, genre_suggestions, parse_limit
+from . import suggest as suggestions
+from .similarity import TOP_K, get_similar_books
 from .serializers import (
-    BookSerializer, GenreSerializer, AuthorSerializer, 
-    ReviewSerializer, ReadingHistorySerializer, BookCollectionSerializer
+    BookSerializer, BookListSerializer, GenreSerializer, AuthorSerializer, 
+    ReviewSerializer, ReadingHistorySerializer, BookCollectionSerializer,
+    ProgressEventSerializer, ProgressSyncSerializer, shape_queryset
 )
+from .conditional import SCORE_VALIDATOR_FIELDS, ConditionalViewSetMixin, conditional, object_validators
+from .counters import apply_live_counts, record_download, record_view
+from .delivery import is_first_request, serve_file
+from .export import FORMATS, export_chunks
+from .facets import facet_counts, is_filtered
 from .forms import ReviewForm
-from .filters import BookFilter
+from .pagination import KeysetPagination, KeysetPaginationMixin
+from .progress import set_reading_status, start_reading, sync_progress
+from .filtres import BookFilter, FullTextSearchFilter, FuzzySearchFilter
+from .fuzzy import fuzzy_filter
+from .search import search_books
 
 
-class BookListView(ListView):
+class BookListView(KeysetPaginationMixin, ListView):
     """List view for books with filtering and search."""
     model = Book
     template_name = 'books/book_list.html'
@@ -31,17 +50,7 @@ class BookListView(ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        queryset = Book.objects.filter(status='available').prefetch_related('authors', 'genres')
-        
-        # Search functionality
-        search_query = self.request.GET.get('search')
-        if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) |
-                Q(authors__first_name__icontains=search_query) |
-                Q(authors__last_name__icontains=search_query) |
-                Q(description__icontains=search_query)
-            ).distinct()
+        queryset = Book.objects.available().for_list()
         
         # Filter by genre
         genre_id = self.request.GET.get('genre')
@@ -53,6 +62,14 @@ class BookListView(ListView):
         if language:
             queryset = queryset.filter(language=language)
         
+        # Search functionality (ranked by relevance unless a sort is requested),
+        # typo-tolerant with ?fuzzy=1; after the filters, which narrow the matches
+        search_query = self.request.GET.get('search')
+        if search_query and self.request.GET.get('fuzzy'):
+            queryset = fuzzy_filter(queryset, search_query)
+        elif search_query:
+            queryset = search_books(queryset, search_query)
+        
         # Sorting
         sort_by = self.request.GET.get('sort', '-created_at')
         if sort_by in ['title', '-title', 'average_rating', '-average_rating', 'publication_date', '-publication_date']:
@@ -62,9 +79,10 @@ class BookListView(ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['genres'] = Genre.objects.all()
+        context['genres'] = cached_queryset(Genre.objects.all())
         context['languages'] = Book.LANGUAGE_CHOICES
         context['current_search'] = self.request.GET.get('search', '')
+        context['current_fuzzy'] = bool(self.request.GET.get('fuzzy'))
         context['current_genre'] = self.request.GET.get('genre', '')
         context['current_language'] = self.request.GET.get('language', '')
         context['current_sort'] = self.request.GET.get('sort', '-created_at')
@@ -74,14 +92,15 @@ class BookListView(ListView):
 class BookDetailView(DetailView):
     """Detail view for a single book."""
     model = Book
+    queryset = Book.objects.for_detail()
     template_name = 'books/book_detail.html'
     context_object_name = 'book'
     
     def get_object(self):
         obj = super().get_object()
-        # Increment view count
-        obj.view_count += 1
-        obj.save(update_fields=['view_count'])
+        # Buffer the hit; counters are flushed to the database in batches
+        record_view(obj.pk)
+        apply_live_counts([obj])
         return obj
     
     def get_context_data(self, **kwargs):
@@ -101,11 +120,8 @@ class BookDetailView(DetailView):
         context['reviews'] = book.reviews.filter(is_approved=True).order_by('-created_at')[:10]
         context['review_form'] = ReviewForm()
         
-        # Get similar books (same genres)
-        context['similar_books'] = Book.objects.filter(
-            genres__in=book.genres.all(),
-            status='available'
-        ).exclude(id=book.id).distinct()[:6]
+        # Get similar books (precomputed by the similar-books job)
+        context['similar_books'] = get_similar_books(book)
         
         return context
 
@@ -118,18 +134,37 @@ class BookReaderView(LoginRequiredMixin, DetailView):
     
     def get_object(self):
         obj = super().get_object()
-        # Create or update reading history
-        history, created = ReadingHistory.objects.get_or_create(
-            user=self.request.user,
-            book=obj,
-            defaults={'status': 'reading'}
-        )
-        if created or history.status == 'wishlist':
-            history.status = 'reading'
-            history.save()
+        start_reading(self.request.user, obj)
         return obj
 
 
+class BookDownloadView(LoginRequiredMixin, DetailView):
+    """Deliver a book's PDF, EPUB or audio file to authenticated users."""
+    model = Book
+    file_fields = {
+        'pdf': 'pdf_file',
+        'epub': 'epub_file',
+        'audio': 'audio_file',
+    }
+    
+    def get_queryset(self):
+        return Book.objects.available().only('pk', *self.file_fields.values())
+    
+    def get(self, request, *args, **kwargs):
+        file_format = kwargs['file_format']
+        if file_format not in self.file_fields:
+            raise Http404
+        book = self.get_object()
+        fieldfile = getattr(book, self.file_fields[file_format])
+        if not fieldfile:
+            raise Http404
+        # Range requests resuming or seeking the same file are not new downloads
+        if is_first_request(request, fieldfile.size):
+            record_download(book.pk)
+        # Audio is played in the browser, documents are saved
+        return serve_file(request, fieldfile, as_attachment=file_format != 'audio')
+
+
 class BookSearchView(ListView):
     """Advanced search view for books."""
     model = Book
@@ -138,12 +173,16 @@ class BookSearchView(ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        form = BookFilter(self.request.GET, queryset=Book.objects.filter(status='available'))
-        return form.qs
+        self.filterset = BookFilter(self.request.GET, queryset=Book.objects.available().for_list())
+        return self.filterset.qs
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['filter'] = BookFilter(self.request.GET, queryset=self.get_queryset())
+        context['filter'] = self.filterset
+        if is_filtered(self.request.GET, BookFilter.base_filters):
+            context['facets'] = facet_counts(self.filterset.qs)
+        else:
+            context['facets'] = facet_counts(self.filterset.qs, cache_name='available')
         return context
 
 
@@ -162,8 +201,8 @@ class GenreDetailView(DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['books'] = Book.objects.filter(
-            genres=self.object, status='available'
+        context['books'] = Book.objects.available().for_card().filter(
+            genres=self.object
         ).order_by('-average_rating')[:20]
         return context
 
@@ -184,8 +223,8 @@ class AuthorDetailView(DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['books'] = Book.objects.filter(
-            authors=self.object, status='available'
+        context['books'] = Book.objects.available().for_card().filter(
+            authors=self.object
         ).order_by('-publication_date')
         return context
 
@@ -207,9 +246,6 @@ class ReviewCreateView(LoginRequiredMixin, CreateView):
         
         response = super().form_valid(form)
         
-        # Update book rating
-        form.instance.book.update_rating()
-        
         messages.success(self.request, _('Your review has been submitted.'))
         return response
     
@@ -218,32 +254,49 @@ class ReviewCreateView(LoginRequiredMixin, CreateView):
 
 
 # API Views
-class BookViewSet(viewsets.ModelViewSet):
+class SparseFieldsetsViewMixin:
+    """Viewset mixin shaping querysets to the fields the serializer will render.
+    
+    Honours ``?fields=`` and ``?expand=`` (see ``SparseFieldsetsMixin``) and
+    uses ``list_serializer_class``, when set, for the list action.
+    """
+    list_serializer_class = None
+    
+    def get_serializer_class(self):
+        if self.action == 'list' and self.list_serializer_class is not None:
+            return self.list_serializer_class
+        return super().get_serializer_class()
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS and self.action in ('list', 'retrieve'):
+            queryset = shape_queryset(queryset, self.get_serializer())
+        return queryset
+
+
+class BookViewSet(InstrumentedViewMixin, ConditionalViewSetMixin, SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     """API viewset for books."""
-    queryset = Book.objects.filter(status='available')
+    queryset = Book.objects.available()
     serializer_class = BookSerializer
+    list_serializer_class = BookListSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter, FuzzySearchFilter]
     filterset_class = BookFilter
-    search_fields = ['title', 'authors__first_name', 'authors__last_name', 'description']
-    ordering_fields = ['title', 'average_rating', 'publication_date', 'created_at']
+    ordering_fields = ['title', 'average_rating', 'bayesian_rating', 'trending_score', 'publication_date', 'created_at']
     ordering = ['-created_at']
     
+    def get_validator_fields(self):
+        # Only the detail representation renders the popularity scores
+        if self.action == 'retrieve':
+            return SCORE_VALIDATOR_FIELDS
+        return super().get_validator_fields()
+    
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def add_to_reading_list(self, request, pk=None):
         """Add book to user's reading list."""
         book = self.get_object()
-        status = request.data.get('status', 'wishlist')
-        
-        history, created = ReadingHistory.objects.get_or_create(
-            user=request.user,
-            book=book,
-            defaults={'status': status}
-        )
-        
-        if not created:
-            history.status = status
-            history.save()
+        set_reading_status(request.user, book, request.data.get('status', 'wishlist'))
         
         return Response({'status': 'success', 'message': 'Book added to reading list'})
     
@@ -251,45 +304,98 @@ class BookViewSet(viewsets.ModelViewSet):
     def update_progress(self, request, pk=None):
         """Update reading progress."""
         book = self.get_object()
-        progress = request.data.get('progress', 0)
-        current_page = request.data.get('current_page', 0)
-        
-        history, created = ReadingHistory.objects.get_or_create(
-            user=request.user,
-            book=book,
-            defaults={'status': 'reading'}
-        )
-        
-        history.progress_percentage = progress
-        history.current_page = current_page
-        if progress >= 100:
-            history.status = 'completed'
-        history.save()
+        event = ProgressEventSerializer(data={
+            'book': book.pk,
+            'progress': request.data.get('progress', 0),
+            'current_page': request.data.get('current_page', 0),
+            'timestamp': request.data.get('timestamp') or timezone.now(),
+        })
+        event.is_valid(raise_exception=True)
+        sync_progress(request.user, [event.validated_data])
+        progress = event.validated_data['progress']
         
         return Response({'status': 'success', 'progress': progress})
-
-
-class GenreViewSet(viewsets.ReadOnlyModelViewSet):
+    
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Return the precomputed similar books."""
+        book = get_object_or_404(Book, pk=pk, status='available')
+        serializer = BookListSerializer(
+            get_similar_books(book, limit=TOP_K), many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """Typeahead over titles and author names (``?q=&limit=``), from the in-process index."""
+        limit = parse_limit(request.query_params.get('limit'), suggestions.DEFAULT_LIMIT, suggestions.MAX_LIMIT)
+        return Response(suggestions.suggest(request.query_params.get('q', ''), limit))
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Return facet counts for the books matching the current filters."""
+        queryset = self.filter_queryset(self.get_queryset())
+        filters_used = [*BookFilter.base_filters, FullTextSearchFilter.search_param, FuzzySearchFilter.fuzzy_param]
+        cache_name = None if is_filtered(request.query_params, filters_used) else 'all'
+        return Response(facet_counts(queryset, cache_name=cache_name))
+    
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """Return live counters, including hits not flushed yet."""
+        book = apply_live_counts([self.get_object()])[0]
+        return Response({
+            'view_count': book.view_count,
+            'download_count': book.download_count,
+            'average_rating': book.average_rating,
+            'total_ratings': book.total_ratings,
+        })
+
+
+class GenreViewSet(InstrumentedViewMixin, ConditionalViewSetMixin, SparseFieldsetsViewMixin, viewsets.ReadOnlyModelViewSet):
     """API viewset for genres."""
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
+    
+    @action(detail=True, methods=['get'])
+    def trending(self, request, pk=None):
+        """Books trending this week in the genre, from the precomputed ranking."""
+        genre = self.get_object()
+        books = [
+            entry.book for entry in GenreTrendingBook.objects.filter(genre=genre)
+            .prefetch_related(Prefetch('book', queryset=Book.objects.for_list()))
+            .order_by('rank')[:20]
+        ]
+        return Response(BookListSerializer(books, many=True, context={'request': request}).data)
+    
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Genres whose name starts with ``?q=``, as ``[{id, text}]``."""
+        limit = parse_limit(request.query_params.get('limit'))
+        return Response(genre_suggestions(request.query_params.get('q', ''), limit))
 
 
-class AuthorViewSet(viewsets.ReadOnlyModelViewSet):
+class AuthorViewSet(InstrumentedViewMixin, ConditionalViewSetMixin, SparseFieldsetsViewMixin, viewsets.ReadOnlyModelViewSet):
     """API viewset for authors."""
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter, FuzzySearchFilter]
     search_fields = ['first_name', 'last_name', 'nationality']
     ordering_fields = ['last_name', 'first_name']
     ordering = ['last_name', 'first_name']
+    
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Authors whose full or last name starts with ``?q=``, as ``[{id, text}]``."""
+        limit = parse_limit(request.query_params.get('limit'))
+        return Response(author_suggestions(request.query_params.get('q', ''), limit))
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(InstrumentedViewMixin, ConditionalViewSetMixin, SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     """API viewset for reviews."""
     queryset = Review.objects.filter(is_approved=True)
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['book', 'rating']
     ordering_fields = ['created_at', 'rating', 'helpful_votes']
@@ -299,24 +405,34 @@ class ReviewViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
 
 
-class ReadingHistoryViewSet(viewsets.ModelViewSet):
+class ReadingHistoryViewSet(InstrumentedViewMixin, ConditionalViewSetMixin, SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     """API viewset for reading history."""
+    queryset = ReadingHistory.objects.all()
     serializer_class = ReadingHistorySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['status', 'rating']
     ordering_fields = ['updated_at', 'created_at']
     ordering = ['-updated_at']
     
     def get_queryset(self):
-        return ReadingHistory.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+    
+    @action(detail=False, methods=['post'])
+    def sync(self, request):
+        """Apply a batch of progress events, keeping the latest one per book."""
+        serializer = ProgressSyncSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(sync_progress(request.user, serializer.validated_data['events']))
 
 
-class BookCollectionViewSet(viewsets.ModelViewSet):
+class BookCollectionViewSet(InstrumentedViewMixin, ConditionalViewSetMixin, SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     """API viewset for book collections."""
+    queryset = BookCollection.objects.all()
     serializer_class = BookCollectionSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -325,34 +441,88 @@ class BookCollectionViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
     
     def get_queryset(self):
-        return BookCollection.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
-class FeaturedBooksAPIView(APIView):
+class FeaturedBooksAPIView(InstrumentedViewMixin, APIView):
     """API view for featured books."""
     
     def get(self, request):
-        books = Book.objects.filter(is_featured=True, status='available')[:10]
-        serializer = BookSerializer(books, many=True)
-        return Response(serializer.data)
+        books = list(Book.objects.available().for_detail().filter(is_featured=True)[:10])
+        return conditional(
+            request, object_validators(request, books, fields=SCORE_VALIDATOR_FIELDS),
+            lambda: Response(BookSerializer(books, many=True).data),
+        )
 
 
-class NewReleasesAPIView(APIView):
+class NewReleasesAPIView(InstrumentedViewMixin, APIView):
     """API view for new releases."""
     
     def get(self, request):
-        books = Book.objects.filter(is_new=True, status='available').order_by('-created_at')[:10]
-        serializer = BookSerializer(books, many=True)
-        return Response(serializer.data)
+        books = list(Book.objects.available().for_detail().filter(is_new=True).order_by('-created_at')[:10])
+        return conditional(
+            request, object_validators(request, books, fields=SCORE_VALIDATOR_FIELDS),
+            lambda: Response(BookSerializer(books, many=True).data),
+        )
 
 
-class PopularBooksAPIView(APIView):
-    """API view for popular books."""
+class PopularBooksAPIView(InstrumentedViewMixin, APIView):
+    """API view for popular books of all time, by weighted rating."""
     
     def get(self, request):
-        books = Book.objects.filter(status='available').order_by('-average_rating', '-total_ratings')[:10]
-        serializer = BookSerializer(books, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        books = list(Book.objects.available().for_detail().order_by('-bayesian_rating', '-id')[:10])
+        return conditional(
+            request, object_validators(request, books, fields=SCORE_VALIDATOR_FIELDS),
+            lambda: Response(BookSerializer(books, many=True).data),
+        )
+
+
+class TrendingBooksAPIView(InstrumentedViewMixin, APIView):
+    """API view for books trending this week."""
+    
+    def get(self, request):
+        books = list(
+            Book.objects.available().for_detail().filter(trending_score__gt=0)
+            .order_by('-trending_score', '-id')[:10]
+        )
+        return conditional(
+            request, object_validators(request, books, fields=SCORE_VALIDATOR_FIELDS),
+            lambda: Response(BookSerializer(books, many=True).data),
+        )
+
+
+class CatalogExportAPIView(InstrumentedViewMixin, APIView):
+    """Staff-only streaming export of the whole catalog (``?output=ndjson|csv&since=&gzip=1``)."""
+    permission_classes = [IsAdminUser]
+    
+    content_types = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+    
+    def get(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in FORMATS:
+            raise ValidationError({'output': _('Unknown export format.')})
+        since = request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                raise ValidationError({'since': _('Invalid datetime.')})
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        compress = request.query_params.get('gzip') in ('1', 'true')
+        
+        watermark = timezone.now()
+        response = StreamingHttpResponse(
+            export_chunks(output=output, since=since or None, compress=compress),
+            content_type='application/gzip' if compress else self.content_types[output],
+        )
+        filename = f'catalog.{output}' + ('.gz' if compress else '')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        # Clients pass this back as ``since`` for the next incremental export.
+        response['X-Export-Watermark'] = watermark.isoformat()
+        return response
@@ -0,0 +1,162 @@
+"""
+Reproducible benchmarks of the books and core endpoints.
+
+``generate_dataset`` fills the database with a synthetic catalog of a given
+scale (deterministic for a given seed, see :mod:`books.seeding`), and
+``run_benchmarks`` requests each endpoint in-process through the test
+client, recording latency percentiles and query counts. Results are plain JSON so runs can be stored and compared
+(see the ``run_benchmarks`` and ``compare_benchmarks`` commands).
+"""
+import platform
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from books import seeding
+from books.models import Book
+
+from .instrumentation import QueryRecorder
+
+SCALES = {
+    '1k': 1_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+
+
+def generate_dataset(books, seed=42, workers=1, progress=None):
+    """Create a synthetic catalog of ``books`` books, appended to the existing rows."""
+    return seeding.seed(seeding.default_sizes(books), seed=seed, workers=workers, index=True, progress=progress)
+
+
+def benchmark_host():
+    """Return a host name accepted by ``ALLOWED_HOSTS``, so requests reach the views."""
+    for host in settings.ALLOWED_HOSTS:
+        host = host.lstrip('.')
+        if host and host != '*':
+            return host
+    return 'localhost'
+
+
+def is_success(status):
+    return 200 <= status < 300 or status == 304
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+def default_endpoints():
+    """Return ``{name: url}`` of the benchmarked endpoints for the current dataset."""
+    book = Book.objects.filter(status='available').order_by('pk').first()
+    word = seeding.WORDS[0]
+    endpoints = {
+        'api_book_list': reverse('books:book-list'),
+        'api_book_list_filtered': reverse('books:book-list') + '?language=en&ordering=-average_rating',
+        'api_book_search': reverse('books:book-list') + f'?search={word}',
+        'api_book_facets': reverse('books:book-facets'),
+        'api_book_suggest': reverse('books:book-suggest') + f'?q={word[:3]}',
+        'api_featured': reverse('books:api_featured'),
+        'api_popular': reverse('books:api_popular'),
+        'api_trending': reverse('books:api_trending'),
+        'book_list': reverse('books:list'),
+        'book_search': reverse('books:list') + f'?search={word}',
+        'home': reverse('core:home'),
+    }
+    if book is not None:
+        endpoints['api_book_detail'] = reverse('books:book-detail', args=[book.pk])
+        endpoints['book_detail'] = reverse('books:detail', args=[book.pk])
+    return endpoints
+
+
+def measure(client, url, iterations, warmup, cold=False):
+    latencies, queries, statuses = [], [], set()
+    for index in range(warmup + iterations):
+        if cold:
+            cache.clear()
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with recorder.capture():
+            response = client.get(url)
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+        if index >= warmup:
+            latencies.append(elapsed * 1000)
+            queries.append(recorder.count)
+            statuses.add(response.status_code)
+    return {
+        'url': url,
+        'status': sorted(statuses),
+        # Error responses measure the error path, not the endpoint
+        'ok': all(is_success(status) for status in statuses),
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'queries': statistics.median_high(queries),
+        'max_queries': max(queries),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(endpoints=None, iterations=50, warmup=5, cold=False, progress=None):
+    """Benchmark ``endpoints`` (default: :func:`default_endpoints`) and return the results."""
+    endpoints = endpoints or default_endpoints()
+    client = Client(raise_request_exception=False, HTTP_HOST=benchmark_host())
+    results = {}
+    for name, url in endpoints.items():
+        results[name] = measure(client, url, iterations, warmup, cold)
+        if progress:
+            progress(name, results[name])
+    return {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'books': Book.objects.count(),
+            'iterations': iterations,
+            'warmup': warmup,
+            'cold_cache': cold,
+        },
+        'results': results,
+    }
+
+
+def compare_results(base, current, metrics=('p50_ms', 'p95_ms', 'p99_ms', 'queries')):
+    """Return ``[(endpoint, metric, base, current, change_percent)]`` for endpoints of both runs."""
+    rows = []
+    for name, result in current['results'].items():
+        previous = base['results'].get(name)
+        if previous is None:
+            continue
+        for metric in metrics:
+            before, after = previous[metric], result[metric]
+            change = (after - before) / before * 100 if before else (0.0 if after == before else float('inf'))
+            rows.append((name, metric, before, after, change))
+    return rows
+
+
+def failed_endpoints(results):
+    """Return the names of the endpoints that answered with an error status."""
+    return sorted(name for name, result in results['results'].items() if not result.get('ok', True))
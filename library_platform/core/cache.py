@@ -0,0 +1,268 @@
+"""
+Two-tier cache: a small per-process LRU (L1) in front of the shared cache (L2).
+
+L1 answers repeated lookups of hot entries (genre lists, home blocks, facet
+counts) without a round trip to the ``CACHE_L2_ALIAS`` cache, Redis or the
+filesystem depending on the settings. Entries live in L1 for at most
+``CACHE_L1_TIMEOUT`` seconds and at most ``CACHE_L1_MAX_ENTRIES`` entries
+are kept, least recently used first out.
+
+Keys of model-dependent entries embed a version per model, stored in L2
+and bumped by signals of the models registered with :func:`watch`. A
+change made by one process is therefore seen by every process once its
+locally cached version expires, after ``CACHE_VERSION_TIMEOUT`` seconds at
+most; the changing process sees it immediately. Cached values are shared
+between callers and must be treated as read-only.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.forms.models import ModelChoiceIterator
+
+DEFAULT_L1_MAX_ENTRIES = 1000
+DEFAULT_L1_TIMEOUT = 60
+DEFAULT_VERSION_TIMEOUT = 5
+DEFAULT_TIMEOUT = 300
+
+MISSING = object()
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+class LocalCache:
+    """Thread-safe LRU with per-entry expiry."""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                self.stats['expirations'] += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TieredCache:
+    """L1 :class:`LocalCache` in front of a Django cache."""
+
+    def __init__(self):
+        self._local = None
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LocalCache(
+                setting('CACHE_L1_MAX_ENTRIES', DEFAULT_L1_MAX_ENTRIES),
+                setting('CACHE_L1_TIMEOUT', DEFAULT_L1_TIMEOUT),
+            )
+        return self._local
+
+    @property
+    def shared(self):
+        return caches[setting('CACHE_L2_ALIAS', 'default')]
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is not MISSING:
+            self.count('l1_hits')
+            return value
+        value = self.shared.get(key, MISSING)
+        if value is MISSING:
+            self.count('misses')
+            return default
+        self.count('l2_hits')
+        self.local.set(key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.count('sets')
+        self.shared.set(key, value, timeout)
+        self.local.set(key, value, timeout)
+
+    async def aget(self, key, default=None):
+        value = self.local.get(key)
+        if value is not MISSING:
+            self.count('l1_hits')
+            return value
+        value = await self.shared.aget(key, MISSING)
+        if value is MISSING:
+            self.count('misses')
+            return default
+        self.count('l2_hits')
+        self.local.set(key, value)
+        return value
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.count('sets')
+        await self.shared.aset(key, value, timeout)
+        self.local.set(key, value, timeout)
+
+    def delete(self, key):
+        self.shared.delete(key)
+        self.local.delete(key)
+
+    def get_or_set(self, key, build, timeout=DEFAULT_TIMEOUT):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            value = build()
+            self.set(key, value, timeout)
+        return value
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats.update(self.local.stats)
+        lookups = sum(stats.get(name, 0) for name in ('l1_hits', 'l2_hits', 'misses'))
+        stats['l1_entries'] = len(self.local.entries)
+        stats['hit_ratio'] = round((stats.get('l1_hits', 0) + stats.get('l2_hits', 0)) / lookups, 3) if lookups else None
+        return stats
+
+
+tiered = TieredCache()
+
+
+def version_key(model):
+    return f'cache:version:{model._meta.label_lower}'
+
+
+def initial_version():
+    # Not 1: a version key evicted from L2 must not come back as a value
+    # that entries cached before the eviction still use
+    return int(time.time() * 1000)
+
+
+def model_versions(*models):
+    """Return the current version of each model, from L1 when recent enough."""
+    keys = [version_key(model) for model in models]
+    versions = {key: tiered.local.get(key) for key in keys}
+    missing = [key for key, version in versions.items() if version is MISSING]
+    if missing:
+        found = tiered.shared.get_many(missing)
+        for key in missing:
+            if key not in found:
+                tiered.shared.add(key, initial_version(), None)
+                found[key] = tiered.shared.get(key, 1)
+            versions[key] = found[key]
+            tiered.local.set(key, found[key], setting('CACHE_VERSION_TIMEOUT', DEFAULT_VERSION_TIMEOUT))
+    return [versions[key] for key in keys]
+
+
+def invalidate_model(*models):
+    """Make every cached entry depending on ``models`` stale, in all processes."""
+    for model in models:
+        key = version_key(model)
+        try:
+            tiered.shared.incr(key)
+        except ValueError:
+            tiered.shared.add(key, initial_version(), None)
+        tiered.local.delete(key)
+
+
+def versioned_key(key, models):
+    versions = model_versions(*models)
+    return ':'.join([key] + [f'{model._meta.label_lower}.{version}' for model, version in zip(models, versions)])
+
+
+def cached(key, build, models=(), timeout=DEFAULT_TIMEOUT):
+    """Return ``build()``, cached under ``key`` until one of ``models`` changes."""
+    return tiered.get_or_set(versioned_key(key, list(models)), build, timeout)
+
+
+def queryset_key(queryset):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(f'{sql}{params!r}'.encode(), usedforsecurity=False).hexdigest()
+    return f'queryset:{queryset.model._meta.label_lower}:{digest}'
+
+
+def cached_queryset(queryset, models=None, timeout=DEFAULT_TIMEOUT, key=None):
+    """Return the results of ``queryset`` as a list, cached until its model (or ``models``) change.
+
+    Prefetched relations are cached with the objects: list the related
+    models in ``models`` so their changes invalidate the entry too.
+    """
+    models = models or [queryset.model]
+    return cached(key or queryset_key(queryset), lambda: list(queryset), models, timeout)
+
+
+def _invalidate_sender(sender, **kwargs):
+    invalidate_model(sender)
+
+
+def _invalidate_relation(sender, instance, action, model, **kwargs):
+    if action.startswith('post_') or action == 'pre_clear':
+        invalidate_model(type(instance), model, sender)
+
+
+def watch(*models):
+    """Invalidate the cached entries of ``models`` when they are saved or deleted.
+
+    Pass many-to-many through models to catch ``add()``/``remove()`` too;
+    they invalidate both sides of the relation.
+    """
+    for model in models:
+        uid = f'core.cache:{model._meta.label_lower}'
+        if model._meta.auto_created:
+            m2m_changed.connect(_invalidate_relation, sender=model, dispatch_uid=uid)
+        else:
+            post_save.connect(_invalidate_sender, sender=model, dispatch_uid=uid)
+            post_delete.connect(_invalidate_sender, sender=model, dispatch_uid=uid)
+
+
+class CachedModelChoiceIterator(ModelChoiceIterator):
+    """Form field choices read from :func:`cached_queryset` instead of the database."""
+
+    def objects(self):
+        return cached_queryset(self.queryset)
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in self.objects():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.objects()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.objects())
@@ -0,0 +1,208 @@
+"""
+Cached building blocks of the home page.
+
+Each block (featured books, new releases, ...) is cached separately, per
+language, under a version number that signals bump whenever the rows it
+depends on change. When a block is missing or expired, a short-lived lock
+ensures only one worker rebuilds it while the others keep serving the
+stale copy, or wait briefly for the fresh one.
+
+Block contents go through the two-tier cache (``core.cache``), so hot
+blocks are usually served from process memory; versions and locks live in
+the shared cache only.
+
+The async variants (``aget_block``) use the async cache API. Block builders
+run through ``sync_to_async(thread_sensitive=False)``, each on a worker
+thread and database connection of its own, so blocks gathered together
+are built in parallel; the connection is closed once the block is built.
+"""
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count
+from django.utils import translation
+
+from books.models import Book, Genre
+from groups.models import ReadingGroup
+
+from .cache import initial_version, tiered
+
+DEFAULT_TIMEOUT = 300
+LOCK_TIMEOUT = 30
+WAIT_INTERVAL = 0.05
+WAIT_ATTEMPTS = 40
+
+
+def build_featured_books():
+    return list(
+        Book.objects.available().for_card().filter(is_featured=True)[:6]
+    )
+
+
+def build_new_releases():
+    return list(
+        Book.objects.available().for_card().filter(is_new=True).order_by('-created_at')[:6]
+    )
+
+
+def build_popular_books():
+    return list(
+        Book.objects.available().for_card().order_by('-bayesian_rating', '-id')[:6]
+    )
+
+
+def build_active_groups():
+    return list(
+        ReadingGroup.objects.filter(is_active=True)
+        .annotate(member_count=Count('members')).order_by('-member_count')[:4]
+    )
+
+
+def build_stats():
+    return {
+        'total_books': Book.objects.available().count(),
+        'total_genres': Genre.objects.count(),
+        'total_groups': ReadingGroup.objects.filter(is_active=True).count(),
+    }
+
+
+BLOCKS = {
+    'featured_books': build_featured_books,
+    'new_releases': build_new_releases,
+    'popular_books': build_popular_books,
+    'active_groups': build_active_groups,
+    'stats': build_stats,
+}
+
+BOOK_BLOCKS = ('featured_books', 'new_releases', 'popular_books')
+
+
+def build_in_thread(name):
+    """Build a block on a worker thread, then close the thread's database connections."""
+    try:
+        return BLOCKS[name]()
+    finally:
+        connections.close_all()
+
+
+def version_key(name):
+    return f'home:version:{name}'
+
+
+def block_key(name, language, version):
+    return f'home:block:{name}:{language}:{version}'
+
+
+def get_version(name):
+    version = cache.get(version_key(name))
+    if version is None:
+        initial = initial_version()
+        cache.add(version_key(name), initial, None)
+        version = cache.get(version_key(name), initial)
+    return version
+
+
+def invalidate(*names):
+    """Bump the version of the given blocks so they are rebuilt on next access."""
+    for name in names:
+        try:
+            cache.incr(version_key(name))
+        except ValueError:
+            cache.add(version_key(name), initial_version(), None)
+
+
+def block_steps(name, version):
+    """Caching protocol of a block, shared by :func:`get_block` and :func:`aget_block`.
+    
+    Yields the cache operations to perform as ``(operation, *args)`` tuples,
+    is sent their results and returns the block content. The drivers only
+    carry out the I/O, synchronously or not; exceptions raised by an
+    operation are thrown back into the generator.
+    """
+    timeout = getattr(settings, 'HOME_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    language = translation.get_language() or settings.LANGUAGE_CODE
+    key = block_key(name, language, version)
+    lock_key = f'{key}:lock'
+
+    for attempt in range(WAIT_ATTEMPTS):
+        entry = yield ('get', key)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        if (yield ('lock', lock_key)):
+            break
+        if entry is not None:
+            # Someone else is refreshing the expired block; serve the stale copy.
+            return entry[1]
+        yield ('sleep',)
+    else:
+        return (yield ('build', name))
+
+    try:
+        value = yield ('build', name)
+        # Keep expired entries around a while longer so they can be served stale.
+        yield ('set', key, (time.time() + timeout, value), timeout * 2)
+        return value
+    finally:
+        yield ('unlock', lock_key)
+
+
+SYNC_OPERATIONS = {
+    'get': tiered.get,
+    'lock': lambda key: cache.add(key, 1, LOCK_TIMEOUT),
+    'sleep': lambda: time.sleep(WAIT_INTERVAL),
+    'build': lambda name: BLOCKS[name](),
+    'set': tiered.set,
+    'unlock': lambda key: cache.delete(key),
+}
+
+ASYNC_OPERATIONS = {
+    'get': tiered.aget,
+    'lock': lambda key: cache.aadd(key, 1, LOCK_TIMEOUT),
+    'sleep': lambda: asyncio.sleep(WAIT_INTERVAL),
+    'build': lambda name: sync_to_async(build_in_thread, thread_sensitive=False)(name),
+    'set': tiered.aset,
+    'unlock': lambda key: cache.adelete(key),
+}
+
+
+def get_block(name):
+    """Return the cached content of a home block, rebuilding it if needed."""
+    steps = block_steps(name, get_version(name))
+    result, error = None, None
+    while True:
+        try:
+            operation, *args = steps.throw(error) if error else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = SYNC_OPERATIONS[operation](*args), None
+        except Exception as exc:
+            result, error = None, exc
+
+
+async def aget_version(name):
+    version = await cache.aget(version_key(name))
+    if version is None:
+        initial = initial_version()
+        await cache.aadd(version_key(name), initial, None)
+        version = await cache.aget(version_key(name), initial)
+    return version
+
+
+async def aget_block(name):
+    """Async version of :func:`get_block`."""
+    steps = block_steps(name, await aget_version(name))
+    result, error = None, None
+    while True:
+        try:
+            operation, *args = steps.throw(error) if error else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = await ASYNC_OPERATIONS[operation](*args), None
+        except Exception as exc:
+            result, error = None, exc
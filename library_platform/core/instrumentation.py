@@ -0,0 +1,243 @@
+"""
+Per-request ORM instrumentation.
+
+``QueryInstrumentationMiddleware`` records, for every request, the number of
+SQL queries, the time spent in the database, repeated query shapes (the
+usual sign of an N+1 pattern) and the total and view time. Requests above
+the configured thresholds are logged as JSON on the
+``library_platform.instrumentation`` logger. In DEBUG, or for staff users,
+the figures are also returned in a ``Server-Timing`` header, readable in the
+browser developer tools.
+
+Queries are captured by an execute wrapper installed on every database
+connection, which reports to the recorders active in the current context.
+The context follows ``sync_to_async`` calls, so the queries async views run
+on the ORM's executor thread are counted too.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger('library_platform.instrumentation')
+
+DEFAULTS = {
+    'MAX_QUERIES': 30,
+    'MAX_SQL_MS': 200,
+    'MAX_DUPLICATES': 5,
+    'SLOW_REQUEST_MS': 1000,
+}
+
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+def threshold(name):
+    return getattr(settings, f'INSTRUMENTATION_{name}', DEFAULTS[name])
+
+
+def fingerprint(sql):
+    """Normalize a parametrized SQL statement so repetitions of it compare equal."""
+    return WHITESPACE.sub(' ', IN_LIST.sub('(...)', sql)).strip()
+
+
+active_recorders = ContextVar('active_recorders', default=())
+
+
+def record_queries(execute, sql, params, many, context):
+    """Execute wrapper timing each query for the recorders of the current context."""
+    recorders = active_recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for recorder in recorders:
+            recorder.record(sql, duration)
+
+
+@receiver(connection_created)
+def install_recorder(sender, connection, **kwargs):
+    # First, so execute_wrapper() blocks open around it still pop their own wrapper
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_queries)
+
+
+class QueryRecorder:
+    """Accumulates the queries run, on any thread, in the context it captures."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def record(self, sql, duration):
+        self.duration += duration
+        self.count += 1
+        self.fingerprints[fingerprint(sql)] += 1
+
+    @contextmanager
+    def capture(self):
+        for alias in connections:
+            install_recorder(None, connections[alias])
+        token = active_recorders.set(active_recorders.get() + (self,))
+        try:
+            yield self
+        finally:
+            active_recorders.reset(token)
+
+    @property
+    def duplicates(self):
+        """Query shapes run more than once, most repeated first."""
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count > 1]
+
+    @property
+    def duplicate_count(self):
+        return sum(count - 1 for sql, count in self.duplicates)
+
+
+class RequestStats:
+    """Measurements of one request."""
+
+    def __init__(self):
+        self.queries = QueryRecorder()
+        self.started = time.perf_counter()
+        self.total = None
+        self.view = None
+        self.view_time = None
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def offences(self):
+        offences = []
+        if self.queries.count > threshold('MAX_QUERIES'):
+            offences.append('queries')
+        if self.queries.duration * 1000 > threshold('MAX_SQL_MS'):
+            offences.append('sql_time')
+        if self.queries.duplicate_count > threshold('MAX_DUPLICATES'):
+            offences.append('duplicates')
+        if self.total * 1000 > threshold('SLOW_REQUEST_MS'):
+            offences.append('slow')
+        return offences
+
+    def as_dict(self, request, response):
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': self.view,
+            'status': response.status_code,
+            'queries': self.queries.count,
+            'sql_ms': round(self.queries.duration * 1000, 2),
+            'duplicate_queries': self.queries.duplicate_count,
+            'view_ms': round(self.view_time * 1000, 2) if self.view_time is not None else None,
+            'total_ms': round(self.total * 1000, 2),
+            'top_duplicates': [
+                {'sql': sql[:300], 'count': count} for sql, count in self.queries.duplicates[:5]
+            ],
+        }
+
+    def server_timing(self):
+        entries = [
+            f'db;dur={self.queries.duration * 1000:.1f};desc="{self.queries.count} queries"',
+            f'dup;desc="{self.queries.duplicate_count} repeated queries"',
+        ]
+        if self.view_time is not None:
+            entries.append(f'view;dur={self.view_time * 1000:.1f}')
+        entries.append(f'total;dur={self.total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+def get_request_stats(request):
+    """Return the :class:`RequestStats` of a (Django or DRF) request, if instrumented."""
+    request = getattr(request, '_request', request)
+    return getattr(request, 'instrumentation', None)
+
+
+def view_name(request):
+    match = request.resolver_match
+    if match is None:
+        return None
+    # DRF viewsets expose their method -> action mapping on the view function
+    actions = getattr(match.func, 'actions', None)
+    if actions and request.method.lower() in actions:
+        return f'{match.view_name}:{actions[request.method.lower()]}'
+    return match.view_name
+
+
+def is_staff(request):
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+class QueryInstrumentationMiddleware:
+    """Record query counts and timings of every request (see module docstring).
+
+    Works in sync and async stacks. Place it after ``AuthenticationMiddleware``
+    so staff users can be recognized.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = request.instrumentation = RequestStats()
+        with stats.queries.capture():
+            response = self.get_response(request)
+        self.report(request, response, stats)
+        if settings.DEBUG or is_staff(request):
+            response['Server-Timing'] = stats.server_timing()
+        return response
+
+    async def __acall__(self, request):
+        stats = request.instrumentation = RequestStats()
+        with stats.queries.capture():
+            response = await self.get_response(request)
+        self.report(request, response, stats)
+        if settings.DEBUG or await sync_to_async(is_staff)(request):
+            response['Server-Timing'] = stats.server_timing()
+        return response
+
+    def report(self, request, response, stats):
+        stats.finish()
+        if stats.view is None:
+            stats.view = view_name(request)
+        offences = stats.offences()
+        if offences:
+            logger.warning(json.dumps(dict(stats.as_dict(request, response), offences=offences)))
+
+
+class InstrumentedViewMixin:
+    """DRF view mixin naming the request after its view action and timing the handler."""
+
+    def initial(self, request, *args, **kwargs):
+        stats = get_request_stats(request)
+        if stats is not None:
+            action = getattr(self, 'action', None) or request.method.lower()
+            stats.view = f'{type(self).__name__}.{action}'
+            self._instrumentation_started = time.perf_counter()
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        stats = get_request_stats(request)
+        started = getattr(self, '_instrumentation_started', None)
+        if stats is not None and started is not None:
+            stats.view_time = time.perf_counter() - started
+        return super().finalize_response(request, response, *args, **kwargs)
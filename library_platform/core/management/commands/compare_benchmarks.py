@@ -0,0 +1,52 @@
+"""
+Compare two ``run_benchmarks`` result files.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import compare_results, failed_endpoints
+
+
+class Command(BaseCommand):
+    help = 'Show the changes between two benchmark runs and flag regressions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('base', help='Results of the reference run.')
+        parser.add_argument('current', help='Results of the run to check.')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Percentage above which a slowdown is a regression.')
+        parser.add_argument('--fail', action='store_true', help='Exit with an error on regressions.')
+
+    def handle(self, *args, **options):
+        runs = []
+        for path in (options['base'], options['current']):
+            with open(path) as results:
+                runs.append(json.load(results))
+        base, current = runs
+        for run, path in zip(runs, (options['base'], options['current'])):
+            meta = run['meta']
+            self.stdout.write(f'{path}: {meta["revision"]} on {meta["database"]}, {meta["books"]} books')
+
+        regressions = []
+        for run, path in zip(runs, (options['base'], options['current'])):
+            failed = failed_endpoints(run)
+            if failed:
+                # Their timings measure the error path, comparing them is meaningless
+                raise CommandError(f'{path}: endpoints answering with an error status: {", ".join(failed)}.')
+        for name, metric, before, after, change in compare_results(base, current):
+            # Query counts are exact: any increase is a regression
+            regressed = after > before if metric == 'queries' else change > options['threshold']
+            line = f'{name:<24} {metric:<8} {before:>10} -> {after:<10} {change:+.1f}%'
+            if regressed:
+                regressions.append(line)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+
+        if regressions:
+            message = f'{len(regressions)} regressions above {options["threshold"]}%.'
+            if options['fail']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('No regressions.'))
@@ -0,0 +1,30 @@
+"""
+Fill the database with a synthetic catalog for benchmarking.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from books.seeding import TABLES, default_sizes
+from core.benchmark import SCALES, generate_dataset
+
+
+class Command(BaseCommand):
+    help = 'Generate a reproducible benchmark catalog (1k, 100k or 1m books).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scale', help=f'One of {", ".join(SCALES)}, or a number of books.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (same seed, same data).')
+        parser.add_argument('--workers', type=int, default=1, help='Processes generating each table.')
+
+    def handle(self, *args, **options):
+        scale = options['scale'].lower()
+        try:
+            books = SCALES[scale] if scale in SCALES else int(scale)
+        except ValueError:
+            raise CommandError(f'Unknown scale "{scale}".')
+        sizes = default_sizes(books)
+        self.stdout.write(', '.join(f'{sizes[table]} {table}' for table in TABLES))
+        generate_dataset(
+            books, seed=options['seed'], workers=options['workers'],
+            progress=lambda table, written: self.stdout.write(f'{table}: {sum(written.values())} rows'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Generated {books} books.'))
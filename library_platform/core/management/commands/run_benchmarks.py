@@ -0,0 +1,45 @@
+"""
+Benchmark the books and core endpoints and write the results as JSON.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import default_endpoints, failed_endpoints, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Measure latency percentiles and query counts of the main endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help='Write the JSON results to this file.')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request.')
+        parser.add_argument('--endpoint', action='append', default=[], help='Only run these endpoints.')
+
+    def handle(self, *args, **options):
+        endpoints = default_endpoints()
+        if options['endpoint']:
+            unknown = set(options['endpoint']) - set(endpoints)
+            if unknown:
+                raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}.')
+            endpoints = {name: endpoints[name] for name in options['endpoint']}
+
+        def report(name, result):
+            self.stdout.write(
+                f'{name:<24} p50 {result["p50_ms"]:>9.2f} ms  p95 {result["p95_ms"]:>9.2f} ms  '
+                f'p99 {result["p99_ms"]:>9.2f} ms  {result["queries"]:>3} queries  {result["status"]}'
+            )
+
+        results = run_benchmarks(
+            endpoints, iterations=options['iterations'], warmup=options['warmup'],
+            cold=options['cold'], progress=report,
+        )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}.'))
+        failed = failed_endpoints(results)
+        if failed:
+            raise CommandError(f'Endpoints answering with an error status: {", ".join(failed)}.')
@@ -0,0 +1,60 @@
+"""
+Signals for core app.
+"""
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from books.importers import catalog_imported
+from books.models import Author, Book, Genre
+from books.popularity import popularity_updated
+from groups.models import ReadingGroup
+from . import cache, home_blocks
+
+cache.watch(Genre, Author, Book, Book.genres.through, Book.authors.through)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_home_on_book_change(sender, **kwargs):
+    """Book changes affect the book lists and the catalog statistics."""
+    home_blocks.invalidate(*home_blocks.BOOK_BLOCKS, 'stats')
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.genres.through)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_home_on_book_relations_change(sender, **kwargs):
+    """Book cards show their authors and genres."""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        home_blocks.invalidate(*home_blocks.BOOK_BLOCKS)
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def invalidate_home_on_genre_change(sender, **kwargs):
+    home_blocks.invalidate(*home_blocks.BOOK_BLOCKS, 'stats')
+
+
+@receiver(post_save, sender=ReadingGroup)
+@receiver(post_delete, sender=ReadingGroup)
+def invalidate_home_on_group_change(sender, **kwargs):
+    home_blocks.invalidate('active_groups', 'stats')
+
+
+@receiver(m2m_changed, sender=ReadingGroup.members.through)
+def invalidate_home_on_group_members_change(sender, action, **kwargs):
+    if action.startswith('post_'):
+        home_blocks.invalidate('active_groups')
+
+
+@receiver(popularity_updated)
+def invalidate_home_on_popularity_update(sender, **kwargs):
+    home_blocks.invalidate('popular_books')
+    # Scores are written with bulk updates, which send no model signals
+    cache.invalidate_model(Book)
+
+
+@receiver(catalog_imported)
+def invalidate_home_on_catalog_import(sender, **kwargs):
+    # Imports write with bulk queries, which send no model signals
+    home_blocks.invalidate(*home_blocks.BOOK_BLOCKS, 'stats')
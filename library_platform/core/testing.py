@@ -0,0 +1,48 @@
+"""
+Test helpers asserting query budgets.
+
+Usage::
+
+    with query_budget(5):
+        self.client.get('/api/books/')
+
+    class BookAPITests(QueryBudgetMixin, TestCase):
+        def test_list(self):
+            self.assertEndpointBudget('/api/books/', max_queries=5, max_duplicates=0)
+"""
+from contextlib import contextmanager
+
+from .instrumentation import QueryRecorder
+
+
+def budget_report(recorder, max_queries, max_duplicates):
+    lines = [f'{recorder.count} queries (budget {max_queries}), '
+             f'{recorder.duplicate_count} repeated (budget {max_duplicates}):']
+    for sql, count in recorder.fingerprints.most_common():
+        lines.append(f'  {count} x {sql[:200]}')
+    return '\n'.join(lines)
+
+
+@contextmanager
+def query_budget(max_queries, max_duplicates=None):
+    """Fail if the block runs more than ``max_queries`` queries or repeats queries too often."""
+    recorder = QueryRecorder()
+    with recorder.capture():
+        yield recorder
+    if recorder.count > max_queries or (
+        max_duplicates is not None and recorder.duplicate_count > max_duplicates
+    ):
+        raise AssertionError(budget_report(recorder, max_queries, max_duplicates))
+
+
+class QueryBudgetMixin:
+    """``TestCase`` mixin with query budget assertions."""
+
+    def assertQueryBudget(self, max_queries, max_duplicates=None):
+        return query_budget(max_queries, max_duplicates)
+
+    def assertEndpointBudget(self, url, max_queries, max_duplicates=None, method='get', **kwargs):
+        """Request ``url`` with the test client and check its query budget; return the response."""
+        with query_budget(max_queries, max_duplicates):
+            response = getattr(self.client, method)(url, **kwargs)
+        return response
@@ -1,3 +1,139 @@
-from django.test import TestCase
+import asyncio
+import threading
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sites.models import Site
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+
+from . import home_blocks
+from .cache import cached, initial_version, invalidate_model, tiered, version_key
+from .instrumentation import QueryInstrumentationMiddleware, QueryRecorder
+from .testing import query_budget
+from .views import AsyncHomeView
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def count_sites():
+    return Site.objects.count()
+
+
+class QueryBudgetTests(TestCase):
+    def test_counts_and_duplicates(self):
+        with query_budget(2, max_duplicates=1) as recorder:
+            count_sites()
+            count_sites()
+        self.assertEqual(recorder.count, 2)
+        self.assertEqual(recorder.duplicate_count, 1)
+
+    def test_over_budget_fails(self):
+        with self.assertRaisesMessage(AssertionError, '2 queries (budget 1)'):
+            with query_budget(1):
+                count_sites()
+                count_sites()
+
+    def test_counts_queries_of_other_threads(self):
+        recorder = QueryRecorder()
+
+        async def run():
+            with recorder.capture():
+                await sync_to_async(count_sites, thread_sensitive=False)()
+
+        async_to_sync(run)()
+        self.assertEqual(recorder.count, 1)
+
+
+@override_settings(DEBUG=True)
+class QueryInstrumentationMiddlewareTests(TestCase):
+    def request(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        return request
+
+    def test_sync(self):
+        def view(request):
+            count_sites()
+            return HttpResponse()
+
+        request = self.request()
+        response = QueryInstrumentationMiddleware(view)(request)
+        self.assertEqual(request.instrumentation.queries.count, 1)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    def test_async(self):
+        async def view(request):
+            await sync_to_async(count_sites)()
+            return HttpResponse()
+
+        request = self.request()
+        response = async_to_sync(QueryInstrumentationMiddleware(view))(request)
+        self.assertEqual(request.instrumentation.queries.count, 1)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        tiered.shared.clear()
+        tiered.local.clear()
+
+    def test_served_from_process_memory(self):
+        tiered.set('key', 'value')
+        tiered.shared.delete('key')
+        self.assertEqual(tiered.get('key'), 'value')
+        tiered.local.clear()
+        self.assertIsNone(tiered.get('key'))
+
+    def test_cached_entries_follow_model_changes(self):
+        build = mock.Mock(side_effect=[1, 2])
+        self.assertEqual(cached('sites', build, [Site]), 1)
+        self.assertEqual(cached('sites', build, [Site]), 1)
+        invalidate_model(Site)
+        self.assertEqual(cached('sites', build, [Site]), 2)
+
+    def test_versions_do_not_restart_after_eviction(self):
+        started = initial_version()
+        cached('sites', lambda: 1, [Site])
+        tiered.shared.delete(version_key(Site))
+        tiered.local.clear()
+        invalidate_model(Site)
+        self.assertGreaterEqual(tiered.shared.get(version_key(Site)), started)
+
+        home_blocks.invalidate('stats')
+        self.assertGreaterEqual(home_blocks.get_version('stats'), started)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncHomeTests(TestCase):
+    def setUp(self):
+        tiered.shared.clear()
+        tiered.local.clear()
+
+    def test_blocks_are_built_in_parallel(self):
+        # Times out unless both builds run at the same time
+        barrier = threading.Barrier(2, timeout=5)
+
+        def build():
+            barrier.wait()
+            return threading.get_ident()
+
+        async def run():
+            return await asyncio.gather(home_blocks.aget_block('featured_books'), home_blocks.aget_block('stats'))
+
+        with mock.patch.dict(home_blocks.BLOCKS, {'featured_books': build, 'stats': build}):
+            first, second = async_to_sync(run)()
+        self.assertNotEqual(first, second)
+
+    def test_view(self):
+        request = AsyncRequestFactory().get('/')
+        request.auser = sync_to_async(AnonymousUser)
+        with mock.patch('core.views.render', return_value=HttpResponse()) as render:
+            async_to_sync(AsyncHomeView.as_view())(request)
+        context = render.call_args.args[2]
+        self.assertEqual(context['stats']['total_books'], 0)
+        self.assertEqual(context['featured_books'], [])
+        self.assertNotIn('user_recommendations', context)
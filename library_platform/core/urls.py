@@ -1,14 +1,16 @@
 """
 URL configuration for core app.
 """
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'core'
 
 urlpatterns = [
-    path('', views.HomeView.as_view(), name='home'),
+    path('', (views.AsyncHomeView if settings.ASYNC_READ_VIEWS else views.HomeView).as_view(), name='home'),
     path('about/', views.AboutView.as_view(), name='about'),
     path('contact/', views.ContactView.as_view(), name='contact'),
     path('accessibility/', views.AccessibilityView.as_view(), name='accessibility'),
+    path('cache-stats/', views.CacheStatsView.as_view(), name='cache_stats'),
 ]
\ No newline at end of file
@@ -1,13 +1,23 @@
 """
 Views for core app - main pages and functionality.
 """
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.db.models import Prefetch
+from django.http import JsonResponse
 from django.shortcuts import render
+from django.views import View
 from django.views.generic import TemplateView
-from django.db.models import Q, Count
 from django.utils.translation import gettext_lazy as _
-from books.models import Book, Genre
-from groups.models import ReadingGroup
+from books.models import Book
 from recommendations.models import Recommendation
+from . import home_blocks
+from .cache import tiered
+
+# Recommended books are shown as cards
+RECOMMENDED_BOOKS = Prefetch('book', queryset=Book.objects.for_card())
 
 
 class HomeView(TemplateView):
@@ -17,43 +27,44 @@ class HomeView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Featured books
-        context['featured_books'] = Book.objects.filter(
-            is_featured=True, status='available'
-        ).prefetch_related('authors', 'genres')[:6]
-        
-        # New releases
-        context['new_releases'] = Book.objects.filter(
-            is_new=True, status='available'
-        ).order_by('-created_at').prefetch_related('authors', 'genres')[:6]
-        
-        # Popular books (by rating)
-        context['popular_books'] = Book.objects.filter(
-            status='available'
-        ).order_by('-average_rating', '-total_ratings').prefetch_related('authors', 'genres')[:6]
-        
-        # Active reading groups
-        context['active_groups'] = ReadingGroup.objects.filter(
-            is_active=True
-        ).annotate(member_count=Count('members')).order_by('-member_count')[:4]
+        # Shared blocks are cached per language and invalidated by signals
+        for name in ('featured_books', 'new_releases', 'popular_books', 'active_groups'):
+            context[name] = home_blocks.get_block(name)
         
         # User recommendations if authenticated
         if self.request.user.is_authenticated:
             context['user_recommendations'] = Recommendation.objects.filter(
                 user=self.request.user,
                 is_active=True
-            ).order_by('-confidence_score')[:4]
+            ).prefetch_related(RECOMMENDED_BOOKS).order_by('-confidence_score')[:4]
         
         # Statistics
-        context['stats'] = {
-            'total_books': Book.objects.filter(status='available').count(),
-            'total_genres': Genre.objects.count(),
-            'total_groups': ReadingGroup.objects.filter(is_active=True).count(),
-        }
+        context['stats'] = home_blocks.get_block('stats')
         
         return context
 
 
+class AsyncHomeView(View):
+    """Async home page view, building the missing home blocks in parallel."""
+    template_name = 'core/home.html'
+    
+    async def get(self, request):
+        names = ('featured_books', 'new_releases', 'popular_books', 'active_groups', 'stats')
+        context = dict(zip(names, await asyncio.gather(*map(home_blocks.aget_block, names))))
+        
+        user = await request.auser()
+        if user.is_authenticated:
+            context['user_recommendations'] = [
+                recommendation async for recommendation in Recommendation.objects.filter(
+                    user=user,
+                    is_active=True
+                ).prefetch_related(RECOMMENDED_BOOKS).order_by('-confidence_score')[:4]
+            ]
+        
+        # Template rendering may still touch lazy relations, keep it synchronous
+        return await sync_to_async(render)(request, self.template_name, context)
+
+
 class AboutView(TemplateView):
     """About page view."""
     template_name = 'core/about.html'
@@ -144,4 +155,14 @@ class AccessibilityView(TemplateView):
                 ]
             }
         ]
-        return context
\ No newline at end of file
+        return context
+
+
+class CacheStatsView(UserPassesTestMixin, View):
+    """Staff-only hit, miss and eviction counts of this process's two-tier cache."""
+    
+    def test_func(self):
+        return self.request.user.is_staff
+    
+    def get(self, request):
+        return JsonResponse(tiered.get_stats())
@@ -62,6 +62,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.instrumentation.QueryInstrumentationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -87,6 +88,11 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'library_platform.wsgi.application'
+ASGI_APPLICATION = 'library_platform.asgi.application'
+
+# Route the hot read-only pages and API endpoints to their async views
+# (only worth it when served over ASGI)
+ASYNC_READ_VIEWS = config('ASYNC_READ_VIEWS', default=False, cast=bool)
 
 # Database
 DATABASES = {
@@ -139,6 +145,11 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Book file delivery: 'stream' (Django streams the file), 'accel' (nginx
+# X-Accel-Redirect to an internal location) or 'sendfile' (X-Sendfile)
+BOOKS_DELIVERY_MODE = config('BOOKS_DELIVERY_MODE', default='stream')
+BOOKS_DELIVERY_ACCEL_PREFIX = '/protected-media/'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -214,6 +225,29 @@ TINYMCE_DEFAULT_CONFIG = {
     'statusbar': True,
 }
 
+# Cache: the shared (L2) cache is Redis when REDIS_CACHE_URL is set, else a
+# filesystem cache; core.cache keeps a per-process LRU (L1) in front of it.
+REDIS_CACHE_URL = config('REDIS_CACHE_URL', default='')
+if REDIS_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'var' / 'cache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+CACHE_L1_MAX_ENTRIES = config('CACHE_L1_MAX_ENTRIES', default=1000, cast=int)
+CACHE_L1_TIMEOUT = config('CACHE_L1_TIMEOUT', default=60, cast=int)
+# Longest delay before a change made by another process is seen
+CACHE_VERSION_TIMEOUT = 5
+
 # Celery Configuration (for async tasks like AI recommendations)
 CELERY_BROKER_URL = config('REDIS_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://localhost:6379/0')
@@ -221,12 +255,92 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'flush-book-counters': {
+        'task': 'books.tasks.flush_book_counters',
+        'schedule': 30,
+    },
+    'update-similar-books': {
+        'task': 'books.tasks.update_similar_books',
+        'schedule': 60 * 15,
+    },
+    'rebuild-similar-books': {
+        'task': 'books.tasks.update_similar_books',
+        'schedule': 60 * 60 * 24,
+        'kwargs': {'incremental': False},
+    },
+    'reconcile-book-ratings': {
+        'task': 'books.tasks.reconcile_book_ratings',
+        'schedule': 60 * 60 * 6,
+    },
+    'update-book-popularity': {
+        'task': 'books.tasks.update_book_popularity',
+        'schedule': 60 * 15,
+    },
+    'update-recommendations': {
+        'task': 'books.tasks.update_recommendations',
+        'schedule': 60 * 30,
+    },
+    'rebuild-recommendations': {
+        'task': 'books.tasks.update_recommendations',
+        'schedule': 60 * 60 * 24,
+        'kwargs': {'incremental': False},
+    },
+    'prune-deleted-books': {
+        'task': 'books.tasks.prune_deleted_books',
+        'schedule': 60 * 60 * 24,
+    },
+}
+
+# Weighted ratings (books.popularity) count every book as having this many
+# extra ratings at the catalog average
+POPULARITY_PRIOR_RATINGS = 10
+
+# Item-item recommendations (books.recommender): saved book similarities
+# and time of the last run, reused by incremental runs
+RECOMMENDATIONS_PER_USER = 20
+RECOMMENDATIONS_STATE_PATH = BASE_DIR / 'var' / 'recommender.npz'
+
+# Title/author typeahead (books.suggest): in-process index built in the
+# background from the first request of each process, and rebuilt when older
+# than this many seconds
+SUGGEST_WARM_ON_START = config('SUGGEST_WARM_ON_START', default=True, cast=bool)
+SUGGEST_REFRESH_INTERVAL = 600
+
+# Typo-tolerant search (books.fuzzy): share of the query trigrams a title
+# or author name must contain, and number of matches kept
+FUZZY_SEARCH_THRESHOLD = 0.4
+FUZZY_SEARCH_MAX_RESULTS = 200
+
+# Book view/download counters: 'cache' (shared cache flushed by the
+# flush-book-counters Celery task) by default with Redis, else 'local' (per
+# process, flushed by a background thread of each process) as the filesystem
+# cache has no atomic incr
+BOOKS_COUNTER_BACKEND = config('BOOKS_COUNTER_BACKEND', default='cache' if REDIS_CACHE_URL else 'local')
+BOOKS_COUNTER_FLUSH_INTERVAL = 30
+if BOOKS_COUNTER_BACKEND != 'cache':
+    CELERY_BEAT_SCHEDULE.pop('flush-book-counters')
+
+# Incremental catalog exports (books.export): days the tombstones of deleted
+# books are kept, pruned by the prune-deleted-books task
+BOOKS_TOMBSTONE_RETENTION_DAYS = 90
 
 # Logging
+# Requests above these budgets are logged by core.instrumentation
+INSTRUMENTATION_MAX_QUERIES = config('INSTRUMENTATION_MAX_QUERIES', default=30, cast=int)
+INSTRUMENTATION_MAX_SQL_MS = config('INSTRUMENTATION_MAX_SQL_MS', default=200, cast=int)
+INSTRUMENTATION_MAX_DUPLICATES = config('INSTRUMENTATION_MAX_DUPLICATES', default=5, cast=int)
+INSTRUMENTATION_SLOW_REQUEST_MS = config('INSTRUMENTATION_SLOW_REQUEST_MS', default=1000, cast=int)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
+        'instrumentation': {
+            'level': 'WARNING',
+            'class': 'logging.FileHandler',
+            'filename': BASE_DIR / 'logs' / 'instrumentation.log',
+        },
         'file': {
             'level': 'INFO',
             'class': 'logging.FileHandler',
@@ -241,6 +355,14 @@ LOGGING = {
         'handlers': ['console', 'file'],
         'level': 'INFO',
     },
+    'loggers': {
+        # One JSON object per offending request
+        'library_platform.instrumentation': {
+            'handlers': ['instrumentation'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
 
 # Create logs directory
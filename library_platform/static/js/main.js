@@ -10,6 +10,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize search functionality
     initializeSearch();
     
+    // Initialize typeahead filters
+    initializeAutocomplete();
+    
     // Initialize reading progress
     initializeReadingProgress();
     
@@ -289,6 +292,103 @@ function hideSearchResults() {
     }
 }
 
+// Autocomplete Functions
+function initializeAutocomplete() {
+    const selects = document.querySelectorAll('select[data-autocomplete-url]');
+    selects.forEach(select => {
+        setupAutocomplete(select);
+    });
+}
+
+function setupAutocomplete(select) {
+    // The select only holds the current choice; a text input searches the rest
+    const container = document.createElement('div');
+    container.className = 'autocomplete-container position-relative';
+    const input = document.createElement('input');
+    input.type = 'text';
+    input.className = 'form-control autocomplete-input';
+    input.setAttribute('autocomplete', 'off');
+    input.setAttribute('role', 'combobox');
+    input.setAttribute('aria-expanded', 'false');
+    if (select.id) {
+        // Keep the field label pointing at the visible input
+        input.id = `${select.id}_autocomplete`;
+        const label = document.querySelector(`label[for="${select.id}"]`);
+        if (label) label.htmlFor = input.id;
+    }
+    const results = document.createElement('div');
+    results.className = 'autocomplete-results list-group position-absolute w-100';
+    results.setAttribute('role', 'listbox');
+    
+    select.parentNode.insertBefore(container, select);
+    container.append(input, results, select);
+    select.classList.add('d-none');
+    if (select.value) {
+        input.value = select.selectedOptions[0].text;
+    }
+    
+    const search = debounce(query => {
+        fetch(`${select.dataset.autocompleteUrl}?q=${encodeURIComponent(query)}`)
+            .then(response => response.json())
+            .then(data => displayAutocompleteResults(select, input, results, data))
+            .catch(error => {
+                console.error('Autocomplete error:', error);
+            });
+    }, 300);
+    
+    input.addEventListener('input', function() {
+        const query = this.value.trim();
+        if (!query) {
+            select.value = '';
+            hideAutocompleteResults(input, results);
+            return;
+        }
+        search(query);
+    });
+    
+    // Hide results when clicking outside
+    document.addEventListener('click', function(e) {
+        if (!container.contains(e.target)) {
+            hideAutocompleteResults(input, results);
+        }
+    });
+}
+
+function displayAutocompleteResults(select, input, results, data) {
+    results.innerHTML = '';
+    data.forEach(result => {
+        const item = document.createElement('button');
+        item.type = 'button';
+        item.className = 'list-group-item list-group-item-action';
+        item.setAttribute('role', 'option');
+        item.textContent = result.text;
+        item.addEventListener('click', function() {
+            selectAutocompleteResult(select, result);
+            input.value = result.text;
+            hideAutocompleteResults(input, results);
+        });
+        results.appendChild(item);
+    });
+    input.setAttribute('aria-expanded', data.length > 0 ? 'true' : 'false');
+    results.classList.toggle('show', data.length > 0);
+}
+
+function selectAutocompleteResult(select, result) {
+    const value = String(result.id);
+    let option = Array.from(select.options).find(option => option.value === value);
+    if (!option) {
+        option = new Option(result.text, value);
+        select.add(option);
+    }
+    option.selected = true;
+    select.dispatchEvent(new Event('change', { bubbles: true }));
+}
+
+function hideAutocompleteResults(input, results) {
+    results.classList.remove('show');
+    input.setAttribute('aria-expanded', 'false');
+}
+
 // Reading Progress Functions
 function initializeReadingProgress() {
     const progressElements = document.querySelectorAll('[data-reading-progress]');